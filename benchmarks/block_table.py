@@ -0,0 +1,62 @@
+'''Measures the time and memory to create the blocks of a 3D task as a
+``BlockTable``, compared to a list of ``Block`` objects with their
+dependencies as created by ``create_dependency_graph()``. Usage::
+
+    python benchmarks/block_table.py --blocks 1000000
+
+Memory is measured with ``tracemalloc``, which slows down the creation
+considerably. Times are measured in a separate run without it.
+'''
+from daisy.block_table import BlockTable
+from daisy.blocks import create_dependency_graph
+from dependency_graph import make_task
+import argparse
+import gc
+import time
+import tracemalloc
+
+
+def measure(f, *args):
+    '''Returns ``(time, memory)`` of ``f(*args)``, memory being the memory
+    held by the result.'''
+
+    gc.collect()
+    start = time.perf_counter()
+    result = f(*args)
+    duration = time.perf_counter() - start
+    del result
+
+    gc.collect()
+    tracemalloc.start()
+    result = f(*args)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    return duration, memory
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--blocks', type=int, nargs='+', default=[1000000])
+    parser.add_argument(
+        '--fit',
+        default='valid',
+        choices=['valid', 'overhang', 'shrink'])
+    args = parser.parse_args()
+
+    for num_blocks in args.blocks:
+
+        task = make_task(num_blocks) + (True, args.fit)
+        actual_blocks = len(BlockTable(*task))
+
+        for name, f in [
+                ('BlockTable', BlockTable),
+                ('Block objects', create_dependency_graph)]:
+
+            duration, memory = measure(f, *task)
+            print(
+                "%8d blocks, %-13s: %7.2fs, %8.1f MB (%6.1f bytes/block)" % (
+                    actual_blocks, name, duration, memory/1e6,
+                    memory/actual_blocks))
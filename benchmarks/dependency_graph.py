@@ -0,0 +1,79 @@
+'''Measures the time to create the block-wise dependency graph of a 3D task,
+for the reference implementation that enumerates blocks one by one, the
+vectorized ``create_block_arrays()``, and ``create_dependency_graph()`` (which
+creates ``Block`` objects from the arrays). Usage::
+
+    python benchmarks/dependency_graph.py --blocks 10000 100000 1000000
+
+The reference implementation is slow, it is only run up to
+``--reference-blocks`` blocks.
+'''
+from daisy.blocks import create_dependency_graph, create_block_arrays, \
+    _create_dependency_graph_iterative
+import argparse
+import daisy
+import time
+
+
+def make_task(num_blocks):
+    '''Returns ``(total_roi, read_roi, write_roi)`` of a task with about
+    ``num_blocks`` blocks.'''
+
+    blocks_per_dim = int(round(num_blocks**(1.0/3)))
+
+    write_roi = daisy.Roi((0, 0, 0), (10, 10, 10))
+    read_roi = write_roi.grow((2, 2, 2), (2, 2, 2))
+    total_roi = daisy.Roi(
+        (-2, -2, -2),
+        (blocks_per_dim*10 + 4,)*3)
+
+    return total_roi, read_roi, write_roi
+
+
+def timed(f, *args):
+
+    start = time.perf_counter()
+    result = f(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--blocks',
+        type=int,
+        nargs='+',
+        default=[10000, 100000, 1000000])
+    parser.add_argument('--reference-blocks', type=int, default=100000)
+    parser.add_argument(
+        '--fit',
+        default='valid',
+        choices=['valid', 'overhang', 'shrink'])
+    args = parser.parse_args()
+
+    for num_blocks in args.blocks:
+
+        task = make_task(num_blocks) + (True, args.fit)
+
+        arrays, arrays_time = timed(create_block_arrays, *task)
+        actual_blocks = len(arrays[0])
+
+        blocks, blocks_time = timed(create_dependency_graph, *task)
+        assert len(blocks) == actual_blocks
+        del blocks
+
+        if num_blocks <= args.reference_blocks:
+            reference, reference_time = timed(
+                _create_dependency_graph_iterative,
+                *task)
+            assert len(reference) == actual_blocks
+            del reference
+            reference = "%8.2fs" % reference_time
+        else:
+            reference = "  (skipped)"
+
+        print(
+            "%8d blocks: reference %s, arrays %7.2fs, "
+            "create_dependency_graph %7.2fs" % (
+                actual_blocks, reference, arrays_time, blocks_time))
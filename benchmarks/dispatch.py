@@ -0,0 +1,113 @@
+'''Measures scheduler dispatch latency and throughput on no-op blocks.
+
+Every worker times its calls to ``Client.acquire_block()``, i.e., the time
+between asking the scheduler for a block and receiving it. Usage::
+
+    python benchmarks/dispatch.py --blocks 10000 --workers 8
+
+With ``--trace``, a Chrome trace of every run is saved, showing when each
+worker processed which block.
+
+Local workers connect to the scheduler through a Unix domain socket. Pass
+``--transports tcp unix`` to compare it to TCP.
+'''
+import argparse
+import daisy
+import glob
+import json
+import logging
+import os
+import tempfile
+import time
+
+daisy.scheduler._NO_SPAWN_STATUS_THREAD = True
+
+
+def worker(outdir):
+
+    client = daisy.Client()
+    latencies = []
+
+    while True:
+
+        start = time.perf_counter()
+        block = client.acquire_block()
+        if block is None:
+            break
+        latencies.append(time.perf_counter() - start)
+
+        client.release_block(block, 0)
+
+    path = os.path.join(outdir, '%d.json' % client.context.worker_id)
+    with open(path, 'w') as f:
+        json.dump(latencies, f)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p/100.0*len(values)))]
+
+
+def run(num_blocks, num_workers, trace_prefix=None, transport='unix'):
+
+    daisy.scheduler._NO_UNIX_SOCKET = transport == 'tcp'
+
+    outdir = tempfile.mkdtemp(prefix='daisy_bench_dispatch_')
+
+    trace = daisy.BlockTrace() if trace_prefix else None
+
+    start = time.perf_counter()
+    daisy.run_blockwise(
+        total_roi=daisy.Roi((0,), (num_blocks,)),
+        read_roi=daisy.Roi((0,), (1,)),
+        write_roi=daisy.Roi((0,), (1,)),
+        process_function=lambda: worker(outdir),
+        read_write_conflict=False,
+        num_workers=num_workers,
+        trace=trace)
+    duration = time.perf_counter() - start
+
+    if trace is not None:
+        trace.save_chrome_trace(
+            '%s_%s_%d_%d.json' % (
+                trace_prefix, transport, num_blocks, num_workers))
+
+    latencies = []
+    for path in glob.glob(os.path.join(outdir, '*.json')):
+        with open(path) as f:
+            latencies += json.load(f)
+        os.remove(path)
+    os.rmdir(outdir)
+
+    print(
+        "%s, %d blocks, %d workers: %.2fs, %.1f blocks/s, dispatch latency "
+        "median %.3fms, p90 %.3fms, p99 %.3fms, max %.3fms" % (
+            transport, num_blocks, num_workers, duration,
+            num_blocks/duration,
+            percentile(latencies, 50)*1e3,
+            percentile(latencies, 90)*1e3,
+            percentile(latencies, 99)*1e3,
+            max(latencies)*1e3))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--blocks', type=int, nargs='+', default=[10000])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 8])
+    parser.add_argument(
+        '--trace',
+        help="Save Chrome traces to files starting with this prefix")
+    parser.add_argument(
+        '--transports',
+        nargs='+',
+        choices=['unix', 'tcp'],
+        default=['unix'])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    for transport in args.transports:
+        for num_blocks in args.blocks:
+            for num_workers in args.workers:
+                run(num_blocks, num_workers, args.trace, transport)
@@ -0,0 +1,120 @@
+'''Measures how many scheduler messages per second can be encoded, decoded,
+and received through a tornado stream, for pickle and binary encodings.
+Usage::
+
+    python benchmarks/messages.py --messages 100000
+'''
+from daisy.block import BlockTemplate
+from daisy.tcp import SchedulerMessage, SchedulerMessageType, ReturnCode, \
+    pack_message, encode_message, decode_message, get_and_unpack_message
+from tornado.ioloop import IOLoop
+from tornado.tcpserver import TCPServer
+import argparse
+import daisy
+import socket
+import threading
+import time
+
+
+def hot_messages():
+    '''Returns tuples ``(name, message, template)``.'''
+
+    read_roi = daisy.Roi((0, 0, 0), (140, 140, 140))
+    write_roi = daisy.Roi((20, 20, 20), (100, 100, 100))
+    template = BlockTemplate(read_roi, write_roi)
+    block = daisy.Block(
+        daisy.Roi((0, 0, 0), (1000, 1000, 1000)),
+        read_roi + (100, 200, 300),
+        write_roi + (100, 200, 300))
+
+    get_block = SchedulerMessage(
+        SchedulerMessageType.WORKER_GET_BLOCK,
+        data='task')
+    ret_block = SchedulerMessage(
+        SchedulerMessageType.WORKER_RET_BLOCK,
+        data=(('task', block.block_id), ReturnCode.SUCCESS, 0.1))
+    new_block = SchedulerMessage(
+        SchedulerMessageType.NEW_BLOCK,
+        data=block)
+
+    return [
+        ('WORKER_GET_BLOCK', get_block, None),
+        ('WORKER_RET_BLOCK', ret_block, None),
+        ('NEW_BLOCK', new_block, None),
+        ('NEW_BLOCK+template', new_block, template),
+    ]
+
+
+def bench_codec(msg, template, num_messages, binary):
+
+    start = time.perf_counter()
+    for _ in range(num_messages):
+        encoding, payload = encode_message(msg, binary, template)
+    encode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(num_messages):
+        decode_message(encoding, payload, template)
+    decode_time = time.perf_counter() - start
+
+    return len(payload), num_messages/encode_time, num_messages/decode_time
+
+
+class ReceivingServer(TCPServer):
+
+    def __init__(self, num_messages, template):
+        super().__init__()
+        self.num_messages = num_messages
+        self.template = template
+        self.done = None
+
+    async def handle_stream(self, stream, address):
+        for _ in range(self.num_messages):
+            await get_and_unpack_message(stream, self.template)
+        self.done = time.perf_counter()
+        IOLoop.current().stop()
+
+
+def bench_stream(msg, template, num_messages, binary):
+
+    ioloop = IOLoop()
+    ioloop.make_current()
+    server = ReceivingServer(num_messages, template)
+    server.listen(0, address='127.0.0.1')
+    sock, = server._sockets.values()
+    port = sock.getsockname()[1]
+
+    data = pack_message(msg, binary, template)*num_messages
+
+    def send():
+        with socket.create_connection(('127.0.0.1', port)) as s:
+            s.sendall(data)
+
+    start = time.perf_counter()
+    sender = threading.Thread(target=send)
+    sender.start()
+    ioloop.start()
+    sender.join()
+    server.stop()
+    ioloop.close(all_fds=True)
+
+    return num_messages/(server.done - start)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=100000)
+    args = parser.parse_args()
+
+    for name, msg, template in hot_messages():
+        for binary in [False, True]:
+            size, encode_rate, decode_rate = bench_codec(
+                msg, template, args.messages, binary)
+            stream_rate = bench_stream(msg, template, args.messages, binary)
+            print(
+                "%-18s %-6s %4d bytes, encode %8.0f msg/s, decode %8.0f "
+                "msg/s, receive %8.0f msg/s" % (
+                    name,
+                    'binary' if binary else 'pickle',
+                    size, encode_rate, decode_rate, stream_rate))
@@ -0,0 +1,118 @@
+'''Measures how long workers take to start, for different start methods.
+
+Every worker records when it received its first block. The time to first
+block is measured from the call to ``run_blockwise()``, and includes
+starting the process, importing modules, and connecting to the scheduler.
+Usage::
+
+    python benchmarks/spawn.py --workers 1 16 128 \\
+        --start-methods fork forkserver spawn
+
+Note that the forkserver is started (and imports the preloaded modules) the
+first time it is used, i.e., during the first run with ``forkserver``.
+'''
+import argparse
+import daisy
+import functools
+import glob
+import json
+import logging
+import os
+import tempfile
+import time
+
+daisy.scheduler._NO_SPAWN_STATUS_THREAD = True
+
+
+def worker(outdir):
+
+    client = daisy.Client()
+    first_block_time = None
+
+    while True:
+
+        block = client.acquire_block()
+        if block is None:
+            break
+        if first_block_time is None:
+            first_block_time = time.time()
+
+        client.release_block(block, 0)
+
+    if first_block_time is None:
+        return
+
+    path = os.path.join(outdir, '%d.json' % client.context.worker_id)
+    with open(path, 'w') as f:
+        json.dump(first_block_time, f)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p/100.0*len(values)))]
+
+
+def run(num_workers, start_method, blocks_per_worker, preload_modules):
+
+    outdir = tempfile.mkdtemp(prefix='daisy_bench_spawn_')
+    num_blocks = num_workers*blocks_per_worker
+
+    start = time.time()
+    daisy.run_blockwise(
+        total_roi=daisy.Roi((0,), (num_blocks,)),
+        read_roi=daisy.Roi((0,), (1,)),
+        write_roi=daisy.Roi((0,), (1,)),
+        # lambdas can not be pickled for 'spawn' and 'forkserver'
+        process_function=functools.partial(worker, outdir),
+        read_write_conflict=False,
+        num_workers=num_workers,
+        start_method=start_method,
+        preload_modules=preload_modules)
+    duration = time.time() - start
+
+    startup_times = []
+    for path in glob.glob(os.path.join(outdir, '*.json')):
+        with open(path) as f:
+            startup_times.append(json.load(f) - start)
+        os.remove(path)
+    os.rmdir(outdir)
+
+    print(
+        "%-10s %4d workers: %.2fs total, time to first block median "
+        "%.3fs, p90 %.3fs, max %.3fs (%d workers got blocks)" % (
+            start_method, num_workers, duration,
+            percentile(startup_times, 50),
+            percentile(startup_times, 90),
+            max(startup_times),
+            len(startup_times)))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 16, 128])
+    parser.add_argument(
+        '--start-methods',
+        nargs='+',
+        default=['fork', 'forkserver', 'spawn'])
+    parser.add_argument(
+        '--blocks-per-worker',
+        type=int,
+        default=10,
+        help="Number of blocks per worker, such that every worker gets one")
+    parser.add_argument(
+        '--preload',
+        nargs='*',
+        default=[],
+        help="Additional modules to preload in the forkserver")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    for start_method in args.start_methods:
+        for num_workers in args.workers:
+            run(
+                num_workers,
+                start_method,
+                args.blocks_per_worker,
+                args.preload)
@@ -11,6 +11,8 @@ from .coordinate import Coordinate # noqa
 from .datasets import open_ds, prepare_ds # noqa
 from .dependency_graph import DependencyGraph # noqa
 from .graph import Graph # noqa
+from .instrumentation import Instrumentation # noqa
+from .journal import CompletionJournal # noqa
 from .parameter import Parameter # noqa
 from .processes import call # noqa
 from .roi import Roi # noqa
@@ -19,3 +21,4 @@ from .scheduler import _NO_SPAWN_STATUS_THREAD # noqa
 from .scheduler import distribute # noqa
 from .scheduler import run_blockwise # noqa
 from .task import Task # noqa
+from .trace import BlockTrace # noqa
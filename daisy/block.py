@@ -1,5 +1,7 @@
 from __future__ import absolute_import
 from .freezable import Freezable
+from .morton import morton_code
+from .roi import Roi
 
 
 class Block(Freezable):
@@ -20,6 +22,11 @@ class Block(Freezable):
             A unique ID for this block (within all blocks tiling the total ROI
             to process).
 
+        z_order_id (``int``):
+
+            The Morton code of the position of this block in the grid of
+            blocks tiling the total ROI, used to process blocks in z-order.
+
         requested_write_roi (`class:Roi`):
 
             The write ROI that was actually requested for this block.
@@ -79,17 +86,11 @@ class Block(Freezable):
             block_id += block_index[d]*f
             f *= num_blocks[d]
 
-        bit32_constant = 1 << 31
-        indices = [block_index[i] for i in range(total_roi.dims())]
-        n = 0
-        z_order_id = 0
-        while n < 32:
-            for i in range(total_roi.dims()):
-                z_order_id = z_order_id >> 1
-                if indices[i] & 1:
-                    z_order_id += bit32_constant
-                indices[i] = indices[i] >> 1
-                n += 1
+        # position in the grid of blocks, relative to the total ROI
+        grid_index = (
+            write_roi.get_offset() -
+            total_roi.get_begin())//write_roi.get_shape()
+        z_order_id = morton_code(grid_index)
 
         return block_id, z_order_id
 
@@ -99,3 +100,68 @@ class Block(Freezable):
             self.block_id,
             self.read_roi,
             self.write_roi)
+
+
+class BlockTemplate():
+    '''The read and write ROI shared by all blocks of a task, before they are
+    shifted to their position. Used to describe blocks compactly by their
+    offset to the template.
+
+    Args:
+
+        read_roi (`class:Roi`):
+
+            The read ROI of the task's blocks.
+
+        write_roi (`class:Roi`):
+
+            The write ROI of the task's blocks.
+    '''
+
+    def __init__(self, read_roi, write_roi):
+
+        self.read_roi = read_roi
+        self.write_roi = write_roi
+
+        # plain tuples, to avoid the overhead of Roi arithmetics per block
+        self.__read_begin = tuple(read_roi.get_begin())
+        self.__read_shape = tuple(read_roi.get_shape())
+        self.__write_begin = tuple(write_roi.get_begin())
+        self.__write_shape = tuple(write_roi.get_shape())
+
+    def get_offset(self, block):
+        '''Get the offset by which this template has to be shifted to obtain
+        ``block``, or ``None`` if ``block`` differs from a shifted template
+        (e.g., because it was shrunk at the boundary of the total ROI).'''
+
+        offset = tuple(
+            b - t
+            for b, t in zip(block.read_roi.get_begin(), self.__read_begin))
+        write_begin = tuple(
+            o + t
+            for o, t in zip(offset, self.__write_begin))
+
+        if (
+                block.read_roi.get_shape() == self.__read_shape and
+                block.write_roi.get_shape() == self.__write_shape and
+                block.write_roi.get_begin() == write_begin and
+                block.requested_write_roi == block.write_roi):
+            return offset
+
+        return None
+
+    def make_block(self, offset, block_id, z_order_id):
+        '''Create the block with the given ``offset`` to this template.'''
+
+        block = Block(
+            None,
+            Roi(
+                tuple(o + t for o, t in zip(offset, self.__read_begin)),
+                self.__read_shape),
+            Roi(
+                tuple(o + t for o, t in zip(offset, self.__write_begin)),
+                self.__write_shape),
+            block_id=block_id)
+        block.z_order_id = z_order_id
+
+        return block
@@ -0,0 +1,308 @@
+from __future__ import absolute_import
+from .block import Block
+from .blocks import compute_level_stride, compute_level_offsets, shrink
+from .coordinate import Coordinate
+from .roi import Roi
+from itertools import product
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _ceildiv(a, b):
+    return -(-a // b)
+
+
+class BlockGrid():
+    '''Arithmetic description of the blocks of a task and their dependencies,
+    as created by :func:`create_dependency_graph`, without materializing
+    them.
+
+    Blocks are identified by their grid index, the number of write shapes
+    (per dimension) a block is shifted from the first block in the total
+    ROI. The blocks included in the task (according to ``fit``) form a box
+    ``[0, shape)`` in grid index space.
+
+    Args:
+
+        total_roi (`class:daisy.Roi`):
+        block_read_roi (`class:daisy.Roi`):
+        block_write_roi (`class:daisy.Roi`):
+        read_write_conflict (``bool``, optional):
+        fit (``string``, optional):
+
+            See :func:`create_dependency_graph`.
+    '''
+
+    def __init__(
+            self,
+            total_roi,
+            block_read_roi,
+            block_write_roi,
+            read_write_conflict=True,
+            fit='valid'):
+
+        self.total_roi = total_roi
+        self.block_read_roi = block_read_roi
+        self.block_write_roi = block_write_roi
+        self.read_write_conflict = read_write_conflict
+        self.fit = fit
+
+        self.dims = total_roi.dims()
+        self.write_shape = block_write_roi.get_shape()
+        self.read_shape = block_read_roi.get_shape()
+
+        # shift of the block with grid index (0, ..., 0)
+        self.origin = total_roi.get_begin() - block_read_roi.get_begin()
+
+        self.shape = Coordinate(
+            self.__num_blocks(d)
+            for d in range(self.dims))
+
+        # number of blocks per dimension with read ROI inside the total ROI,
+        # only blocks beyond that need to be shrunk
+        self.interior_shape = Coordinate(
+            max(0, (t - r)//w + 1)
+            for t, r, w in zip(
+                total_roi.get_shape(),
+                self.read_shape,
+                self.write_shape))
+
+        # number of grid positions per level, per dimension
+        level_stride = compute_level_stride(block_read_roi, block_write_roi)
+        level_offsets = compute_level_offsets(block_write_roi, level_stride)
+        self.level_shape = level_stride/self.write_shape
+
+        # level of each grid position modulo level_shape
+        self.levels = {
+            tuple(level_offset/self.write_shape): level
+            for level, level_offset in enumerate(level_offsets)
+        }
+
+        # per level, per dimension: the grid index differences to blocks of
+        # the previous level that are in conflict
+        self.conflict_deltas = [None]
+        for level in range(1, len(level_offsets)):
+            offset_to_prev = level_offsets[level - 1] - level_offsets[level]
+            self.conflict_deltas.append([
+                [op//w, (op + ls)//w] if op < 0 else [(op - ls)//w, op//w]
+                for op, ls, w in zip(
+                    offset_to_prev,
+                    level_stride,
+                    self.write_shape)
+            ])
+
+        logger.debug(
+            "block grid of shape %s with %d levels",
+            self.shape, len(level_offsets))
+
+    def __num_blocks(self, d):
+        '''Number of blocks in dimension ``d`` that pass the ``fit``
+        criterion.'''
+
+        total = self.total_roi.get_shape()[d]
+        read = self.read_shape[d]
+        write = self.write_shape[d]
+        context_ul = (
+            self.block_write_roi.get_begin()[d] -
+            self.block_read_roi.get_begin()[d])
+        context_lr = read - context_ul - write
+
+        # upper bound on number of blocks, as enumerated for each level in
+        # create_dependency_graph
+        num_blocks = _ceildiv(total, write)
+
+        if self.fit == 'valid':
+            # read ROI within total ROI
+            num_fit = (total - read)//write + 1
+        elif self.fit == 'overhang':
+            # begin of write ROI within total ROI
+            num_fit = _ceildiv(total - context_ul, write)
+        elif self.fit == 'shrink':
+            # begin of write ROI within total ROI, and non-empty write ROI
+            # after shrinking
+            num_fit = _ceildiv(total - context_ul - context_lr, write)
+        else:
+            raise RuntimeError("Unknown fit %s" % self.fit)
+
+        return max(0, min(num_blocks, num_fit))
+
+    def size(self):
+        '''The number of blocks in this grid.'''
+        size = 1
+        for s in self.shape:
+            size *= s
+        return size
+
+    def get_position(self, index):
+        '''Get the position of the block at the given grid index in a flat
+        array of all blocks of this grid (in C order).'''
+        position = 0
+        for i, s in zip(index, self.shape):
+            position = position*s + i
+        return position
+
+    def get_index(self, position):
+        '''Get the grid index of the block at the given position, the
+        inverse of ``get_position()``.'''
+        index = []
+        for s in reversed(self.shape):
+            index.append(position % s)
+            position //= s
+        return tuple(reversed(index))
+
+    def contains(self, index):
+        return all(0 <= i < s for i, s in zip(index, self.shape))
+
+    def get_level(self, index):
+        return self.levels[tuple(
+            i % m for i, m in zip(index, self.level_shape))]
+
+    def get_block(self, index):
+        '''Create the block at the given grid index.'''
+
+        offset = self.origin + Coordinate(index)*self.write_shape
+        block = Block(
+            self.total_roi,
+            self.block_read_roi + offset,
+            self.block_write_roi + offset)
+
+        if self.fit == 'shrink' and any(
+                i >= s for i, s in zip(index, self.interior_shape)):
+            block = shrink(self.total_roi, block)
+
+        return block
+
+    def get_read_roi(self, index):
+        '''Get the read ROI of the block at the given grid index.'''
+
+        read_roi = Roi(
+            self.total_roi.get_begin() +
+            Coordinate(index)*self.write_shape,
+            self.read_shape)
+
+        if self.fit == 'shrink':
+            read_roi = self.total_roi.intersect(read_roi)
+
+        return read_roi
+
+    def get_write_cell(self, index):
+        '''Get the grid cell of the block at the given grid index, i.e., its
+        write ROI before shrinking.'''
+
+        return self.block_write_roi + (
+            self.origin + Coordinate(index)*self.write_shape)
+
+    def get_dependencies(self, index):
+        '''Get the grid indices of blocks that have to finish before the
+        block at ``index`` can run.'''
+
+        if not self.read_write_conflict:
+            return []
+
+        level = self.get_level(index)
+        if level == 0:
+            return []
+
+        return self.__indices_in_grid(
+            [i + delta for delta in deltas]
+            for i, deltas in zip(index, self.conflict_deltas[level]))
+
+    def get_dependents(self, index):
+        '''Get the grid indices of blocks that depend on the block at
+        ``index``.'''
+
+        if not self.read_write_conflict:
+            return []
+
+        level = self.get_level(index) + 1
+        if level == len(self.conflict_deltas):
+            return []
+
+        return self.__indices_in_grid(
+            [i - delta for delta in deltas]
+            for i, deltas in zip(index, self.conflict_deltas[level]))
+
+    def get_roots(self):
+        '''Get the grid indices of all blocks without dependencies.'''
+
+        if not self.read_write_conflict:
+            return list(product(*[range(s) for s in self.shape]))
+
+        roots = set()
+
+        for level_position, level in self.levels.items():
+
+            dim_indices = [
+                range(p, s, m)
+                for p, s, m in zip(
+                    level_position,
+                    self.shape,
+                    self.level_shape)
+            ]
+
+            if level == 0:
+                roots.update(product(*dim_indices))
+                continue
+
+            # a block has no dependencies if all its conflicts lie outside
+            # of the grid in at least one dimension
+            for d in range(self.dims):
+                free = [
+                    i for i in dim_indices[d]
+                    if all(
+                        not 0 <= i + delta < self.shape[d]
+                        for delta in self.conflict_deltas[level][d])
+                ]
+                roots.update(product(*(
+                    dim_indices[:d] + [free] + dim_indices[d + 1:])))
+
+        return list(roots)
+
+    def get_indices_writing(self, roi):
+        '''Get the grid indices of blocks whose grid cell intersects with
+        ``roi``, the equivalent of :func:`get_subgraph_blocks`.'''
+
+        grid_offset = self.origin + self.block_write_roi.get_begin()
+        begin = roi.get_begin() - grid_offset
+        end = roi.get_end() - grid_offset
+
+        return self.__indices_in_grid(
+            range(b//w, _ceildiv(e, w))
+            for b, e, w in zip(begin, end, self.write_shape))
+
+    def get_indices_reading(self, roi):
+        '''Get the grid indices of blocks whose read ROI intersects with
+        ``roi``.'''
+
+        if roi.empty():
+            return []
+
+        total_begin = self.total_roi.get_begin()
+        total_end = self.total_roi.get_end()
+        dim_indices = []
+
+        for d in range(self.dims):
+
+            begin = roi.get_begin()[d] - total_begin[d]
+            end = roi.get_end()[d] - total_begin[d]
+            w = self.write_shape[d]
+
+            if self.fit == 'shrink' and roi.get_begin()[d] >= total_end[d]:
+                # read ROIs are shrunk to the total ROI
+                return []
+
+            dim_indices.append(range(
+                (begin - self.read_shape[d])//w + 1,
+                _ceildiv(end, w)))
+
+        return self.__indices_in_grid(dim_indices)
+
+    def __indices_in_grid(self, dim_indices):
+
+        dim_indices = [
+            [i for i in indices if 0 <= i < s]
+            for indices, s in zip(dim_indices, self.shape)
+        ]
+
+        return list(product(*dim_indices))
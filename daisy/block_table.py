@@ -0,0 +1,248 @@
+from __future__ import absolute_import
+from .block import Block
+from .blocks import create_block_arrays, compute_block_ids
+from .roi import Roi
+from itertools import product
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class BlockTable():
+    '''The blocks of a task and their conflicts, stored in contiguous
+    arrays. ``Block`` objects are only created on request, see
+    ``get_block()``.
+
+    Blocks are referred to by their row in the table, which follows the
+    order of :func:`create_dependency_graph`.
+
+    Args:
+
+        total_roi (`class:daisy.Roi`):
+        block_read_roi (`class:daisy.Roi`):
+        block_write_roi (`class:daisy.Roi`):
+        read_write_conflict (``bool``, optional):
+        fit (``string``, optional):
+
+            See :func:`create_dependency_graph`.
+
+        grid_begin (`class:daisy.Coordinate`, optional):
+
+            See :func:`compute_block_ids`. Tables that are merged should use
+            the same ``grid_begin``, such that their z-order IDs agree.
+    '''
+
+    def __init__(
+            self,
+            total_roi,
+            block_read_roi,
+            block_write_roi,
+            read_write_conflict=True,
+            fit='valid',
+            grid_begin=None):
+
+        self.total_roi = total_roi
+        self.block_read_roi = block_read_roi
+        self.block_write_roi = block_write_roi
+
+        self.read_rois, self.write_rois, self.conflict_ptrs, \
+            self.conflict_indices = create_block_arrays(
+                total_roi,
+                block_read_roi,
+                block_write_roi,
+                read_write_conflict,
+                fit)
+
+        # block IDs are computed from the write ROI before shrinking, which
+        # has the same offset
+        self.block_ids, self.z_order_ids = compute_block_ids(
+            total_roi,
+            block_write_roi.get_shape(),
+            self.write_rois[:, 0],
+            grid_begin)
+
+        self.__index()
+
+        logger.debug("created block table with %d blocks", len(self))
+
+    def __len__(self):
+        return len(self.block_ids)
+
+    def __index(self):
+        '''Create the lookup tables for block IDs and dependents.'''
+
+        # rows sorted by block ID, to find rows of block IDs
+        self.__sorted_rows = np.argsort(self.block_ids, kind='stable')
+        self.__sorted_block_ids = self.block_ids[self.__sorted_rows]
+
+        # dependents of each block (reverse of conflicts)
+        num_conflicts = np.diff(self.conflict_ptrs)
+        conflicted_rows = np.repeat(np.arange(len(self)), num_conflicts)
+        order = np.argsort(self.conflict_indices, kind='stable')
+        self.dependent_ptrs = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(self.conflict_indices, minlength=len(self)),
+            out=self.dependent_ptrs[1:])
+        self.dependent_indices = conflicted_rows[order]
+
+    def get_rows(self, block_ids):
+        '''Get the rows of the given block IDs. Returns ``-1`` for IDs that
+        are not in this table.'''
+
+        block_ids = np.asarray(block_ids, dtype=np.int64)
+        if len(self) == 0:
+            return np.full(block_ids.shape, -1, dtype=np.int64)
+
+        positions = np.searchsorted(self.__sorted_block_ids, block_ids)
+        positions = np.minimum(positions, len(self) - 1)
+        rows = self.__sorted_rows[positions]
+        rows[self.__sorted_block_ids[positions] != block_ids] = -1
+
+        return rows
+
+    def get_row(self, block_id):
+        '''Get the row of the given block ID.'''
+
+        position = int(self.__sorted_block_ids.searchsorted(block_id))
+        if (
+                position == len(self) or
+                self.__sorted_block_ids[position] != block_id):
+            raise KeyError("Block %d is not in this table" % block_id)
+
+        return int(self.__sorted_rows[position])
+
+    def get_block(self, row):
+        '''Create the ``Block`` in the given row.'''
+
+        read_roi = self.read_rois[row].tolist()
+        write_roi = self.write_rois[row].tolist()
+
+        block = Block(
+            self.total_roi,
+            Roi(*read_roi),
+            Roi(*write_roi),
+            block_id=int(self.block_ids[row]))
+        block.z_order_id = int(self.z_order_ids[row])
+
+        return block
+
+    def get_conflicts(self, row):
+        '''Get the rows of blocks in conflict with the block in ``row``.'''
+        return self.conflict_indices[
+            self.conflict_ptrs[row]:self.conflict_ptrs[row + 1]]
+
+    def get_dependents(self, row):
+        '''Get the rows of blocks that conflict with the block in ``row``.'''
+        return self.dependent_indices[
+            self.dependent_ptrs[row]:self.dependent_ptrs[row + 1]]
+
+    def get_rows_writing(self, read_rois):
+        '''Find, for each given read ROI, the blocks of this table whose write
+        ROI (before shrinking) intersects with it, the vectorized equivalent
+        of :func:`get_subgraph_blocks`.
+
+        Args:
+
+            read_rois (``ndarray``):
+
+                Offsets and shapes of the ROIs, shape ``(n, 2, dims)``.
+
+        Returns:
+
+            ``(roi_indices, rows)``, two arrays listing each pair of an
+            index into ``read_rois`` and a row of this table.
+        '''
+
+        write_shape = np.array(self.block_write_roi.get_shape())
+        grid_offset = np.array(
+            self.total_roi.get_begin() -
+            self.block_read_roi.get_begin() +
+            self.block_write_roi.get_begin())
+
+        if len(self) == 0 or len(read_rois) == 0:
+            return (
+                np.zeros(0, dtype=np.int64),
+                np.zeros(0, dtype=np.int64))
+
+        # positions of blocks in the write grid (the blocks of merged tables
+        # might start before the total ROI), and the rows of each grid
+        # position
+        grid_indices = (self.write_rois[:, 0] - grid_offset)//write_shape
+        grid_begin = np.min(grid_indices, axis=0)
+        grid_indices -= grid_begin
+        grid_shape = np.max(grid_indices, axis=0) + 1
+        grid_rows = np.full(np.prod(grid_shape), -1, dtype=np.int64)
+        grid_rows[np.ravel_multi_index(
+            tuple(grid_indices.T),
+            grid_shape)] = np.arange(len(self))
+
+        # range of intersecting grid indices for each ROI
+        begin = read_rois[:, 0] - grid_offset
+        end = begin + read_rois[:, 1]
+        lower = begin//write_shape - grid_begin
+        upper = -(-end//write_shape) - grid_begin
+
+        roi_indices = []
+        rows = []
+
+        max_counts = np.max(upper - lower, axis=0)
+        for delta in product(*[range(c) for c in max_counts]):
+
+            indices = lower + delta
+            valid = np.all(
+                (indices < upper) &
+                (indices >= 0) &
+                (indices < grid_shape),
+                axis=1)
+            valid_indices = np.flatnonzero(valid)
+            delta_rows = grid_rows[np.ravel_multi_index(
+                tuple(indices[valid].T),
+                grid_shape)]
+            included = delta_rows >= 0
+
+            roi_indices.append(valid_indices[included])
+            rows.append(delta_rows[included])
+
+        if len(rows) == 0:
+            return (
+                np.zeros(0, dtype=np.int64),
+                np.zeros(0, dtype=np.int64))
+
+        return np.concatenate(roi_indices), np.concatenate(rows)
+
+    def merge(self, other):
+        '''Add the blocks of another table of the same task (e.g., created
+        for a different request ROI) that are not yet in this table.'''
+
+        new = np.flatnonzero(self.get_rows(other.block_ids) < 0)
+        # skip duplicate IDs within other
+        _, first = np.unique(other.block_ids[new], return_index=True)
+        new = new[np.sort(first)]
+
+        # conflicts of new blocks, as rows of the merged table
+        new_rows = np.full(len(other), -1, dtype=np.int64)
+        new_rows[new] = len(self) + np.arange(len(new))
+        other_rows = self.get_rows(other.block_ids)
+        merged_rows = np.where(other_rows >= 0, other_rows, new_rows)
+
+        conflicts = [
+            merged_rows[other.get_conflicts(row)]
+            for row in new
+        ]
+        num_conflicts = np.array([len(c) for c in conflicts], dtype=np.int64)
+
+        self.read_rois = np.concatenate([self.read_rois, other.read_rois[new]])
+        self.write_rois = np.concatenate(
+            [self.write_rois, other.write_rois[new]])
+        self.block_ids = np.concatenate(
+            [self.block_ids, other.block_ids[new]])
+        self.z_order_ids = np.concatenate(
+            [self.z_order_ids, other.z_order_ids[new]])
+        self.conflict_ptrs = np.concatenate([
+            self.conflict_ptrs,
+            self.conflict_ptrs[-1] + np.cumsum(num_conflicts)])
+        self.conflict_indices = np.concatenate(
+            [self.conflict_indices] + conflicts).astype(np.int64)
+
+        self.__index()
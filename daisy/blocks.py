@@ -1,9 +1,11 @@
 from __future__ import absolute_import
 from .block import Block
 from .coordinate import Coordinate
+from .morton import morton_encode
 from .roi import Roi
 from itertools import product
 import logging
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
@@ -84,6 +86,274 @@ def create_dependency_graph(
                               |rrrr|www|rrrr|     block 3 (shrunk)
     '''
 
+    read_rois, write_rois, conflict_ptrs, conflict_indices = \
+        create_block_arrays(
+            total_roi,
+            block_read_roi,
+            block_write_roi,
+            read_write_conflict,
+            fit)
+
+    read_shape = block_read_roi.get_shape()
+    write_shape = block_write_roi.get_shape()
+
+    # blocks that were shrunk to fit the total ROI
+    shrunk = np.any(read_rois[:, 1] != read_shape, axis=1).tolist()
+
+    block_ids, z_order_ids = compute_block_ids(
+        total_roi,
+        write_shape,
+        write_rois[:, 0])
+
+    blocks = []
+    for read_offset, write_offset, is_shrunk, block_id, z_order_id in zip(
+            read_rois[:, 0].tolist(),
+            write_rois[:, 0].tolist(),
+            shrunk,
+            block_ids.tolist(),
+            z_order_ids.tolist()):
+
+        block = Block(
+            total_roi,
+            Roi(read_offset, read_shape),
+            Roi(write_offset, write_shape),
+            block_id=block_id)
+        block.z_order_id = z_order_id
+
+        if is_shrunk:
+            block = shrink(total_roi, block)
+
+        blocks.append(block)
+
+    conflict_ptrs = conflict_ptrs.tolist()
+    conflict_indices = conflict_indices.tolist()
+
+    return [
+        (
+            block,
+            [
+                blocks[j]
+                for j in conflict_indices[begin:end]
+            ]
+        )
+        for block, begin, end in zip(
+            blocks,
+            conflict_ptrs[:-1],
+            conflict_ptrs[1:])
+    ]
+
+
+def compute_block_ids(
+        total_roi,
+        block_write_shape,
+        write_offsets,
+        grid_begin=None):
+    '''Vectorized version of ``Block.compute_block_id``.
+
+    Args:
+
+        total_roi (`class:daisy.Roi`):
+
+            The total ROI that the blocks are tiling.
+
+        block_write_shape (`class:daisy.Coordinate`):
+
+            The shape of the (not shrunk) write ROI of the blocks.
+
+        write_offsets (``ndarray``):
+
+            The offsets of the write ROIs of the blocks, shape ``(n, dims)``.
+
+        grid_begin (`class:daisy.Coordinate`, optional):
+
+            The offset the grid positions of the z-order IDs are relative to.
+            Defaults to the begin of ``total_roi``. Blocks tiling different
+            total ROIs have comparable z-order IDs only if they were computed
+            with the same ``grid_begin``.
+
+    Returns:
+
+        ``(block_ids, z_order_ids)``, two arrays of length ``n``.
+    '''
+
+    dims = total_roi.dims()
+    write_shape = np.array(block_write_shape, dtype=np.int64)
+    if grid_begin is None:
+        grid_begin = total_roi.get_begin()
+    grid_begin = np.array(grid_begin, dtype=np.int64)
+    total_shape = np.array(total_roi.get_shape(), dtype=np.int64)
+
+    # same (truncating) divisions as Coordinate.__truediv__
+    num_blocks = ((total_shape + write_shape - 1)/write_shape).astype(np.int64)
+    block_index = (write_offsets/write_shape).astype(np.int64)
+
+    block_ids = np.zeros(len(write_offsets), dtype=np.int64)
+    f = 1
+    for d in range(dims)[::-1]:
+        block_ids += block_index[:, d]*f
+        f *= int(num_blocks[d])
+
+    grid_index = (write_offsets - grid_begin)//write_shape
+    z_order_ids = morton_encode(grid_index)
+
+    return block_ids, z_order_ids
+
+
+def create_block_arrays(
+        total_roi,
+        block_read_roi,
+        block_write_roi,
+        read_write_conflict=True,
+        fit='valid'):
+    '''Vectorized implementation of :func:`create_dependency_graph`, that
+    returns the blocks and their conflicts as arrays instead of ``Block``
+    objects.
+
+    Args:
+
+        total_roi (`class:daisy.Roi`):
+        block_read_roi (`class:daisy.Roi`):
+        block_write_roi (`class:daisy.Roi`):
+        read_write_conflict (``bool``, optional):
+        fit (``string``, optional):
+
+            See :func:`create_dependency_graph`.
+
+    Returns:
+
+        ``(read_rois, write_rois, conflict_ptrs, conflict_indices)``, where
+        ``read_rois`` and ``write_rois`` are arrays of shape ``(n, 2, dims)``
+        with the offset and shape of the (fitted) read and write ROI of each
+        block, in the same order as :func:`create_dependency_graph`. The
+        indices of blocks in conflict with block ``i`` are
+        ``conflict_indices[conflict_ptrs[i]:conflict_ptrs[i + 1]]``.
+    '''
+
+    level_stride = compute_level_stride(block_read_roi, block_write_roi)
+    level_offsets = compute_level_offsets(block_write_roi, level_stride)
+
+    dims = total_roi.dims()
+    total_begin = np.array(total_roi.get_begin(), dtype=np.int64)
+    total_end = np.array(total_roi.get_end(), dtype=np.int64)
+    total_shape = total_end - total_begin
+    read_begin = np.array(block_read_roi.get_begin(), dtype=np.int64)
+    read_shape = np.array(block_read_roi.get_shape(), dtype=np.int64)
+    write_begin = np.array(block_write_roi.get_begin(), dtype=np.int64)
+    write_shape = np.array(block_write_roi.get_shape(), dtype=np.int64)
+
+    # all block offsets are multiples of the write shape (relative to the
+    # total ROI begin), the grid of possible offsets has this shape:
+    grid_shape = -(-total_shape//write_shape)
+
+    # position of each included block in the returned arrays, by grid index
+    # (-1 for excluded blocks)
+    positions = np.full(np.prod(grid_shape), -1, dtype=np.int64)
+
+    read_rois = []
+    write_rois = []
+    conflict_counts = []
+    conflict_indices = []
+    num_blocks = 0
+
+    for level, level_offset in enumerate(level_offsets):
+
+        # all block offsets of the current level (relative to total ROI
+        # start), in the same order as itertools.product
+        dim_offsets = [
+            np.arange(lo, e, s, dtype=np.int64)
+            for lo, e, s in zip(level_offset, total_shape, level_stride)
+        ]
+        offsets = np.stack(
+            [
+                o.ravel()
+                for o in np.meshgrid(*dim_offsets, indexing='ij')
+            ],
+            axis=1).reshape(-1, dims)
+
+        # read and write ROIs in global coordinates
+        block_read_begin = offsets + total_begin
+        block_read_end = block_read_begin + read_shape
+        block_write_begin = block_read_begin + (write_begin - read_begin)
+        block_write_end = block_write_begin + write_shape
+
+        included, (
+            block_read_begin,
+            block_read_end,
+            block_write_begin,
+            block_write_end) = _fit_block_arrays(
+                fit,
+                total_begin,
+                total_end,
+                block_read_begin,
+                block_read_end,
+                block_write_begin,
+                block_write_end)
+        offsets = offsets[included]
+
+        grid_indices = np.ravel_multi_index(
+            tuple((offsets//write_shape).T),
+            grid_shape)
+        positions[grid_indices] = np.arange(
+            num_blocks,
+            num_blocks + len(offsets))
+        num_blocks += len(offsets)
+
+        read_rois.append(np.stack(
+            [block_read_begin, block_read_end - block_read_begin],
+            axis=1))
+        write_rois.append(np.stack(
+            [block_write_begin, block_write_end - block_write_begin],
+            axis=1))
+
+        # get conflicts to previous level
+        if level > 0 and read_write_conflict:
+            conflict_offsets = get_conflict_offsets(
+                level_offset,
+                level_offsets[level - 1],
+                level_stride)
+        else:
+            conflict_offsets = []
+
+        conflicts = np.full(
+            (len(offsets), len(conflict_offsets)),
+            -1,
+            dtype=np.int64)
+
+        for c, conflict_offset in enumerate(conflict_offsets):
+
+            conflict_grid = (offsets + conflict_offset)//write_shape
+            in_grid = np.all(
+                (conflict_grid >= 0) & (conflict_grid < grid_shape),
+                axis=1)
+            conflicts[in_grid, c] = positions[np.ravel_multi_index(
+                tuple(conflict_grid[in_grid].T),
+                grid_shape)]
+
+        # conflicts with excluded blocks are skipped
+        conflicts_included = conflicts >= 0
+        conflict_counts.append(np.sum(conflicts_included, axis=1))
+        conflict_indices.append(conflicts[conflicts_included])
+
+    conflict_ptrs = np.zeros(num_blocks + 1, dtype=np.int64)
+    np.cumsum(np.concatenate(conflict_counts), out=conflict_ptrs[1:])
+
+    return (
+        np.concatenate(read_rois).reshape(-1, 2, dims),
+        np.concatenate(write_rois).reshape(-1, 2, dims),
+        conflict_ptrs,
+        np.concatenate(conflict_indices))
+
+
+def _create_dependency_graph_iterative(
+        total_roi,
+        block_read_roi,
+        block_write_roi,
+        read_write_conflict=True,
+        fit='valid'):
+    '''Reference implementation of :func:`create_dependency_graph`, that
+    enumerates blocks and their conflicts one by one. Used for testing and
+    benchmarking.'''
+
     level_stride = compute_level_stride(block_read_roi, block_write_roi)
     level_offsets = compute_level_offsets(block_write_roi, level_stride)
 
@@ -148,6 +418,57 @@ def create_dependency_graph(
     return blocks
 
 
+def _fit_block_arrays(
+        fit,
+        total_begin,
+        total_end,
+        read_begin,
+        read_end,
+        write_begin,
+        write_end):
+    '''Vectorized inclusion criteria and fitting of :func:`enumerate_blocks`.
+    Returns a mask of included blocks and the fitted ROI begins and ends of
+    the included blocks.'''
+
+    if fit == 'valid':
+        included = np.all(
+            (read_begin >= total_begin) & (read_end <= total_end),
+            axis=1)
+
+    elif fit == 'overhang' or fit == 'shrink':
+        included = np.all(
+            (write_begin >= total_begin) & (write_begin < total_end),
+            axis=1)
+
+    else:
+        raise RuntimeError("Unknown fit %s" % fit)
+
+    read_begin = read_begin[included]
+    read_end = read_end[included]
+    write_begin = write_begin[included]
+    write_end = write_end[included]
+
+    if fit == 'shrink':
+
+        # shrink read ROIs to the total ROI, and write ROIs by the same amount
+        shrunk_read_begin = np.maximum(read_begin, total_begin)
+        shrunk_read_end = np.minimum(read_end, total_end)
+        write_begin = write_begin + (shrunk_read_begin - read_begin)
+        write_end = write_end + (shrunk_read_end - read_end)
+        read_begin = shrunk_read_begin
+        read_end = shrunk_read_end
+
+        # skip blocks with empty write ROIs
+        non_empty = np.all(write_end > write_begin, axis=1)
+        included[included] = non_empty
+        read_begin = read_begin[non_empty]
+        read_end = read_end[non_empty]
+        write_begin = write_begin[non_empty]
+        write_end = write_end[non_empty]
+
+    return included, (read_begin, read_end, write_begin, write_end)
+
+
 def compute_level_stride(block_read_roi, block_write_roi):
     '''Get the stride that separates independent blocks in one level.'''
 
@@ -318,8 +639,9 @@ def shrink(total_roi, block):
         block.read_roi.get_begin() - r.get_begin(),
         r.get_end() - block.read_roi.get_end())
 
-    # create a new block, but keep the block_id
+    # create a new block, but keep the block_id and z_order_id
     shrunk_block = Block(total_roi, r, w, block_id=block.block_id)
+    shrunk_block.z_order_id = block.z_order_id
 
     return shrunk_block
 
@@ -354,9 +676,10 @@ def get_subgraph_blocks(
             aligned_subroi[1] * block_write_roi.get_shape(),
             block_write_roi.get_shape())
     ]
-    # generate absolute offsets
+    # generate absolute offsets (of the block read and write ROIs, which
+    # already include the write ROI begin)
     block_offsets = [
-        Coordinate(o) + full_graph_offset
+        Coordinate(o) + full_graph_offset - block_write_roi.get_begin()
         for o in product(*block_dim_offsets)
     ]
     blocks = enumerate_blocks(
@@ -0,0 +1,158 @@
+from __future__ import absolute_import
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CheckExecutor():
+    '''Evaluates a check function (like the ``pre_check`` of a task) for
+    blocks in a pool of threads, and reports the results through a callback.
+
+    Args:
+
+        check_function (function):
+
+            Called as ``check_function(block)``, returns ``True`` if the
+            check passed.
+
+        batch_check_function (function, optional):
+
+            Called as ``batch_check_function(blocks)`` with a list of blocks,
+            returns a sequence with one ``bool`` per block. Used instead of
+            ``check_function`` if given.
+
+        num_workers (``int``, optional):
+
+            The number of threads to evaluate checks in. If 0, checks are
+            evaluated in ``submit()``.
+
+        batch_size (``int``, optional):
+
+            The maximal number of blocks per call of
+            ``batch_check_function``.
+
+        name (``string``, optional):
+
+            The name of the check, for log messages.
+
+        record_duration (function, optional):
+
+            Called as ``record_duration(seconds)`` with the time it took to
+            check each block.
+    '''
+
+    def __init__(
+            self,
+            check_function,
+            batch_check_function=None,
+            num_workers=1,
+            batch_size=1,
+            name='check',
+            record_duration=None):
+
+        self.check_function = check_function
+        self.batch_check_function = batch_check_function
+        self.num_workers = num_workers
+        self.batch_size = batch_size if batch_check_function else 1
+        self.name = name
+        self.record_duration = record_duration
+
+        self.lock = threading.Lock()
+        self.num_pending = 0
+
+        self.executor = None
+        if num_workers > 0:
+            kwargs = {}
+            if sys.version_info >= (3, 6):
+                # name the threads after the check they run
+                kwargs['thread_name_prefix'] = name
+            self.executor = ThreadPoolExecutor(
+                max_workers=num_workers,
+                **kwargs)
+
+    def get_capacity(self):
+        '''The number of blocks that should be pending to keep all threads
+        busy.'''
+        return 2*max(1, self.num_workers)*self.batch_size
+
+    def get_pending_count(self):
+        '''The number of submitted blocks whose results were not reported
+        yet.'''
+        with self.lock:
+            return self.num_pending
+
+    def submit(self, blocks, callback):
+        '''Check the given blocks. For each block, ``callback(block,
+        result)`` is called once its check finished, from one of the threads
+        of the pool.'''
+
+        blocks = list(blocks)
+
+        with self.lock:
+            self.num_pending += len(blocks)
+
+        for i in range(0, len(blocks), self.batch_size):
+            batch = blocks[i:i + self.batch_size]
+            if self.executor is None:
+                self.__check(batch, callback)
+            else:
+                self.executor.submit(self.__check, batch, callback)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+    def __check(self, blocks, callback):
+
+        start = time.perf_counter()
+        results = self.__evaluate(blocks)
+        if self.record_duration is not None:
+            duration = (time.perf_counter() - start)/len(blocks)
+            for _ in blocks:
+                self.record_duration(duration)
+
+        for block, result in zip(blocks, results):
+            try:
+                callback(block, result)
+            except Exception:
+                logger.exception(
+                    "Exception while handling %s() result of block %s",
+                    self.name, block)
+
+        with self.lock:
+            self.num_pending -= len(blocks)
+
+    def __evaluate(self, blocks):
+
+        if self.batch_check_function is not None:
+
+            try:
+                results = [bool(r) for r in self.batch_check_function(blocks)]
+                if len(results) != len(blocks):
+                    raise RuntimeError(
+                        "Got %d results for %d blocks" % (
+                            len(results), len(blocks)))
+                return results
+            except Exception as e:
+                # checks can intermittently fail
+                logger.error(
+                    "%s() exception for %d blocks. Exception: %s",
+                    self.name, len(blocks), e)
+                return [False]*len(blocks)
+
+        results = []
+        for block in blocks:
+            try:
+                results.append(self.check_function(block))
+            except Exception as e:
+                # checks can intermittently fail
+                logger.error(
+                    "%s() exception for block %s. Exception: %s",
+                    self.name, block, e)
+                results.append(False)
+
+        return results
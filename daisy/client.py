@@ -1,12 +1,9 @@
 from .context import Context
-from .tcp import pack_message, get_and_unpack_message, \
+from .tcp import pack_message, read_message, \
     SchedulerMessage, SchedulerMessageType, ReturnCode
-from collections import deque
-from tornado.ioloop import IOLoop
-from tornado.iostream import StreamClosedError
-from tornado.tcpclient import TCPClient
-import asyncio
 import logging
+import os
+import socket
 import sys
 import threading
 import time
@@ -18,10 +15,28 @@ class Client():
     '''Client code that runs on a remote worker providing task management
     API for user code. It communicates with the scheduler through TCP/IP.
 
+    The client uses a plain blocking socket: requests are sent and blocks
+    are received in the thread that calls ``acquire_block()``, without a
+    separate network thread.
+
     Scheduler IP address, port, and other configurations are typically
     passed to ``Client`` through an environment variable named
     'DAISY_CONTEXT'.
 
+    Workers on the same host as the scheduler connect through the Unix
+    domain socket of the scheduler, if it has one, which avoids the overhead
+    of TCP. Other workers connect through TCP.
+
+    A worker can ask for more than one block at a time, such that the next
+    block is already on its way while the current one is processed. The
+    number of blocks requested ahead is given by ``prefetch_depth`` of the
+    context (see ``Task.schedule()``).
+
+    Workers started by a scheduler that reuses workers (see
+    ``distribute()``) can be assigned to another task once their task is
+    finished. From then on, ``acquire_block()`` returns blocks of the new
+    task, and ``context`` refers to it.
+
     Example usage:
 
         def blockwise_process(block):
@@ -41,7 +56,7 @@ class Client():
             self,
             context=None,
             ioloop=None):
-        '''Initialize TCP connection with the scheduler.
+        '''Initialize the connection with the scheduler.
 
         Args:
 
@@ -53,35 +68,40 @@ class Client():
 
             ioloop(``tornado.IOLoop``, optional):
 
-                If not passed in, Clientwill start an ioloop in a concurrent
-                thread
+                Deprecated, not used.
         '''
         logger.debug("Client init")
         self.context = context
-        self.connected = False
-        self.error_state = False
-        self.stream = None
+        self.block_template = None
+        self.socket = None
+        self.reader = None
+
+        # set once the scheduler told the worker to terminate, or the
+        # connection was lost
+        self.closed = False
 
         if self.context is None:
             self.context = Context.from_env()
 
-        self.ioloop = ioloop
-        if self.ioloop is None:
-            new_event_loop = asyncio.new_event_loop()
-            asyncio._set_running_loop(new_event_loop)
-            asyncio.set_event_loop(new_event_loop)
-            self.ioloop = IOLoop.current()
-            t = threading.Thread(target=self.ioloop.start, daemon=True)
-            t.start()
+        # number of blocks requested from the scheduler, but not yet
+        # received through acquire_block()
+        self.requested_blocks = 0
 
-        self.ioloop.add_callback(self._start)
+        # {block_id: time} when blocks were handed out by acquire_block(),
+        # to report the compute time of each block to the scheduler
+        self.acquire_times = {}
 
-        logger.debug("Waiting for connection to Daisy scheduler...")
-        while not self.connected:
-            time.sleep(.1)
-            if self.error_state:
-                logger.error("Cannot connect to Daisy scheduler")
-                sys.exit(1)
+        # release_block() might be called from another thread than
+        # acquire_block()
+        self.send_lock = threading.Lock()
+
+        try:
+            self.socket = self._connect_with_retry()
+        except Exception:
+            logger.error("Cannot connect to Daisy scheduler")
+            sys.exit(1)
+        self.reader = self.socket.makefile('rb')
+        logger.debug("Connected.")
 
         self.send(
             SchedulerMessage(
@@ -89,132 +109,151 @@ class Client():
                 data=self.context.worker_id))
 
     def __del__(self):
-        '''Stop spawn ioloop when client is done'''
-        try:
-            self.ioloop.add_callback(self.ioloop.stop)
-        except Exception:
-            # self.ioloop is None
-            pass
-
-    async def _start(self):
-        '''Start the TCP client.'''
-        logger.debug(
-            "Connecting to scheduler at %s:%d",
-            self.context.hostname,
-            self.context.port)
-
-        try:
-            self.stream = await self._connect_with_retry()
-        except Exception:
-            self.error_state = True
-            raise
+        '''Close the connection when client is done'''
+        self.close()
 
-        self.job_queue = deque()
-        self.job_queue_cv = threading.Condition()
-        self.connected = True
-        logger.debug("Connected.")
+    def close(self):
+        '''Close the connection to the scheduler.'''
 
-        await self.async_recv()
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+        self.closed = True
 
-    async def _connect_with_retry(self):
+    def _connect_with_retry(self):
         '''Helper method that tries to connect to the scheduler within
         a number of retries.'''
         num_retries = 10
         counter = 0
+        socket_path = self.context.socket_path
+        use_unix_socket = (
+            socket_path is not None and
+            os.path.exists(socket_path) and
+            _is_local_address(self.context.hostname))
         while True:
             try:
-                logger.debug("calling TCPClient().connect() ...")
-                stream = await TCPClient().connect(
+                if use_unix_socket:
+                    logger.debug("connecting to %s ...", socket_path)
+                    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                    try:
+                        sock.connect(socket_path)
+                    except Exception:
+                        sock.close()
+                        raise
+                    return sock
+                logger.debug(
+                    "connecting to %s:%d ...",
                     self.context.hostname,
-                    self.context.port,
+                    self.context.port)
+                sock = socket.create_connection(
+                    (self.context.hostname, self.context.port),
                     timeout=60)
-                return stream
-            except TimeoutError:
-                logger.error("call to TCPClient().connect() timed out")
+                sock.settimeout(None)
+                # messages are small and latency-critical, don't let Nagle's
+                # algorithm delay them
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                return sock
+            except socket.timeout:
+                logger.error("connecting to the scheduler timed out")
                 raise
             except Exception:
-                logger.debug("TCP connect error, retry...")
+                logger.debug("connect error, retry...")
                 counter += 1
                 if (counter > num_retries):
                     # retry for 10 seconds
                     logger.error(
-                        "TCP connection failed %d times, giving up",
+                        "Connection failed %d times, giving up",
                         num_retries)
                     raise RuntimeError(
-                        "TCP connection could not be established")
-                await asyncio.sleep(1)
+                        "Connection could not be established")
+                time.sleep(1)
 
-    async def async_recv(self):
-        '''Loop that receives commands from Daisy scheduler.'''
-        while True:
-            try:
-                msg = await get_and_unpack_message(self.stream)
-                logger.debug("Received {}".format(msg.data))
-
-                if msg.type == SchedulerMessageType.NEW_BLOCK:
-                    block = msg.data
-                    with self.job_queue_cv:
-                        self.job_queue.append(block)
-                        self.job_queue_cv.notify()
+    def send(self, data):
+        '''Send a ``SchedulerMessage`` to the scheduler.'''
 
-                elif msg.type == SchedulerMessageType.TERMINATE_WORKER:
-                    break
+        message = pack_message(data)
 
-            except Exception as e:
+        with self.send_lock:
+            try:
+                self.socket.sendall(message)
+            except (AttributeError, OSError) as e:
+                # the socket is None after close()
                 logger.error(
-                    "Worker %s async_recv got Exception %s",
+                    "Worker %s could not send message: %s",
                     self.context.worker_id, e)
-                with self.job_queue_cv:
-                    self.job_queue.append(e)
-                    self.job_queue_cv.notify()
-                break
-
-        # all done, notify client code to exit
-        with self.job_queue_cv:
-            self.job_queue.append(None)
-            self.job_queue_cv.notify()
-
-    async def async_send(self, data):
-        '''Send ``data`` to the scheduler. ``data`` must have been formated
-        using tcp.pack_message()'''
-        try:
-            await self.stream.write(data)
-        except StreamClosedError:
-            logger.error(
-                "Worker %s async_send got StreamClosedError" %
-                self.context.worker_id)
-
-    def send(self, data):
-        '''Non-async wrapper for async_send()'''
-        self.ioloop.spawn_callback(self.async_send, pack_message(data))
 
     def acquire_block(self):
-        '''API for client to get a new block. It works by sending a get block
-        message to the scheduler, then wait for async_recv() to append to the
-        queue.'''
-        self.send(
-            SchedulerMessage(
-                SchedulerMessageType.WORKER_GET_BLOCK,
-                data=self.context.task_id))
+        '''API for client to get a new block. It works by sending get block
+        messages to the scheduler (until ``prefetch_depth`` blocks are
+        requested), then reading messages from the scheduler until a block
+        arrives. Returns ``None`` if there are no more blocks.'''
 
-        with self.job_queue_cv:
+        if self.closed:
+            return None
 
-            while len(self.job_queue) == 0:
-                self.job_queue_cv.wait()
+        while True:
 
-            ret = self.job_queue.popleft()
+            while self.requested_blocks < self.context.prefetch_depth:
+                self.send(
+                    SchedulerMessage(
+                        SchedulerMessageType.WORKER_GET_BLOCK,
+                        data=self.context.task_id))
+                self.requested_blocks += 1
 
-            if isinstance(ret, StreamClosedError):
-                # StreamClosedError can not be distinguished from proper
+            try:
+                msg = read_message(self.reader, self.block_template)
+            except (EOFError, OSError):
+                # losing the connection can not be distinguished from proper
                 # teardown, just tell the client to stop
-                ret = None
-            elif isinstance(ret, Exception):
-                raise ret
-
-            logger.debug(
-                "Worker %s received block %s" %
-                (self.context.worker_id, ret))
-            return ret
+                logger.debug(
+                    "Worker %s lost connection to scheduler",
+                    self.context.worker_id)
+                self.close()
+                return None
+
+            if msg.type == SchedulerMessageType.NEW_BLOCK:
+                block = msg.data
+                self.requested_blocks -= 1
+                self.acquire_times[block.block_id] = time.perf_counter()
+                logger.debug(
+                    "Worker %s received block %s",
+                    self.context.worker_id, block)
+                return block
+
+            elif msg.type == SchedulerMessageType.BLOCK_TEMPLATE:
+                self.block_template = msg.data
+
+            elif msg.type == SchedulerMessageType.ASSIGN_TASK:
+                task_id, worker_id, num_workers, prefetch_depth = msg.data
+                logger.debug(
+                    "Worker %s assigned to task %s as worker %s",
+                    self.context.worker_id, task_id, worker_id)
+                self.context = Context(
+                    self.context.hostname,
+                    self.context.port,
+                    task_id,
+                    worker_id,
+                    num_workers,
+                    prefetch_depth,
+                    self.context.socket_path)
+                # the blocks requested so far were requested for the
+                # previous task
+                self.requested_blocks = 0
+
+            elif msg.type == SchedulerMessageType.TERMINATE_WORKER:
+                logger.debug(
+                    "Worker %s received terminate message",
+                    self.context.worker_id)
+                self.close()
+                return None
+
+            else:
+                logger.error(
+                    "Worker %s received unexpected message %s",
+                    self.context.worker_id, msg.type)
 
     def release_block(self, block, ret):
         '''API for client to return a a block.
@@ -241,9 +280,29 @@ class Client():
                 ret)
             ret = ReturnCode.SUCCESS
 
+        compute_time = None
+        acquire_time = self.acquire_times.pop(block.block_id, None)
+        if acquire_time is not None:
+            compute_time = time.perf_counter() - acquire_time
+
         logger.debug("Releasing block {}".format(block.block_id))
 
         self.send(
             SchedulerMessage(
                 SchedulerMessageType.WORKER_RET_BLOCK,
-                data=((self.context.task_id, block.block_id), ret)))
+                data=(
+                    (self.context.task_id, block.block_id),
+                    ret,
+                    compute_time)))
+
+
+def _is_local_address(hostname):
+    '''Check whether ``hostname`` is an address of this host.'''
+
+    try:
+        # binding only works for local addresses
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.bind((hostname, 0))
+        return True
+    except OSError:
+        return False
@@ -6,23 +6,40 @@ logger = logging.getLogger(__name__)
 
 class Context():
 
-    def __init__(self, hostname, port, task_id, worker_id, num_workers):
+    def __init__(
+            self,
+            hostname,
+            port,
+            task_id,
+            worker_id,
+            num_workers,
+            prefetch_depth=1,
+            socket_path=None):
         self.hostname = hostname
         self.port = port
         self.task_id = task_id
         self.worker_id = worker_id
         self.num_workers = num_workers
+        self.prefetch_depth = prefetch_depth
+        # Unix domain socket of the scheduler, for workers on the same host
+        self.socket_path = socket_path
 
     def to_env(self):
 
-        return '%s:%d:%s:%d:%d' % (
+        env = '%s:%d:%s:%d:%d:%d' % (
             self.hostname,
             self.port,
             self.task_id,
             self.worker_id,
-            self.num_workers
+            self.num_workers,
+            self.prefetch_depth
         )
 
+        if self.socket_path is not None:
+            env += ':' + self.socket_path
+
+        return env
+
     @staticmethod
     def from_env():
 
@@ -40,7 +57,10 @@ class Context():
                 int(tokens[1]),
                 tokens[2],
                 int(tokens[3]),
-                int(tokens[4]))
+                int(tokens[4]),
+                int(tokens[5]) if len(tokens) > 5 else 1,
+                # the path might contain colons
+                ':'.join(tokens[6:]) if len(tokens) > 6 else None)
 
         except KeyError:
             logger.error("DAISY_CONTEXT malformed")
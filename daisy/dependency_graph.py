@@ -2,15 +2,53 @@ from __future__ import absolute_import
 
 import collections
 import copy
-import heapq
 import logging
+import numpy as np
 import threading
-from .blocks import create_dependency_graph, get_subgraph_blocks, \
-    expand_request_roi_to_grid
+from .block_grid import BlockGrid
+from .block_table import BlockTable
+from .blocks import get_subgraph_blocks, expand_request_roi_to_grid
+from .priority_policy import get_priority_policy
+from .ready_queue import ReadyQueue
 
 logger = logging.getLogger(__name__)
 
 
+def _get_csr_rows(ptrs, indices, rows):
+    '''Concatenate ``indices[ptrs[row]:ptrs[row + 1]]`` for all given
+    rows.'''
+
+    starts = ptrs[rows]
+    lengths = ptrs[rows + 1] - starts
+    total = int(lengths.sum())
+
+    # position in indices of each element of the result
+    positions = np.arange(total) + np.repeat(
+        starts - (np.cumsum(lengths) - lengths),
+        lengths)
+
+    return indices[positions]
+
+
+class BlockState():
+    '''The states of blocks in a ``DependencyGraph``, as stored in its
+    per-task state arrays.'''
+
+    # waiting for dependencies (in lazy mode, also blocks that were not
+    # created yet)
+    PENDING = 0
+    # in a ready queue
+    READY = 1
+    PROCESSING = 2
+    DONE = 3
+    # failed more than max_retries times
+    FAILED = 4
+    # a (direct or indirect) dependency failed
+    ORPHANED = 5
+
+    NUM_STATES = 6
+
+
 class DependencyGraph():
     '''This class constructs a block-wise dependency graph of a given
     ``Task`` and its dependencies.It provides an interface for the
@@ -19,10 +57,36 @@ class DependencyGraph():
 
     User can make a subgraph of certain ROIs of the full graph through
     ``get_subgraph``.
+
+    Blocks are stored in one ``BlockTable`` per task, ``Block`` objects are
+    only created for blocks that are being processed.
+
+    Args:
+
+        lazy (``bool``, optional):
+
+            If set, blocks and their dependencies are not created upfront.
+            Instead, they are computed from the grid index of a block when
+            needed, such that only blocks that are ready or being processed
+            are kept in memory, together with the number of unfinished
+            dependencies of blocks for which some, but not all dependencies
+            finished. Tasks that are shared between several targets have to
+            be requested with the same ROI.
+
+        priority (``string``, `class:PriorityPolicy`, or function, optional):
+
+            The order in which ready blocks of a task are processed. Either
+            ``'z_order'`` (the default), ``'critical_path'`` (blocks with the
+            longest chain of dependents first), ``'locality'`` (blocks close
+            to the last finished block first), a function returning the
+            priority of a block (lower first), or a ``PriorityPolicy``. See
+            ``daisy.priority_policy``.
     '''
 
-    def __init__(self, global_config):
+    def __init__(self, global_config, lazy=False, priority='z_order'):
         self.global_config = global_config
+        self.lazy = lazy
+        self.priority_policy = get_priority_policy(priority)
 
         # self.leaf_task_id = None
         self.tasks = set()
@@ -30,26 +94,44 @@ class DependencyGraph():
         self.prepared_tasks = set()
         self.created_tasks = set()
         self.task_dependency = collections.defaultdict(set)
+        self.task_dependents = collections.defaultdict(set)
 
-        self.dependents = collections.defaultdict(set)
-        self.dependencies = collections.defaultdict(set)
-        self.ready_queues = collections.defaultdict(collections.deque)
+        self.ready_queues = collections.defaultdict(ReadyQueue)
         self.ready_queue_cv = threading.Condition()
-        self.processing_blocks = set()
-        self.task_processing_blocks = collections.defaultdict(set)
+        # incremented on every event that may allow the scheduler to make
+        # progress, see ``notify_update()`` and ``wait_for_update()``
+        self.update_count = 0
+        # blocks that are being processed (or ready, in lazy mode)
         self.blocks = {}
 
-        self.retry_count = collections.defaultdict(int)
-        self.failed_blocks = set()
-        self.orphaned_blocks = set()
-        self.task_failed_count = collections.defaultdict(int)
-
-        self.task_done_count = collections.defaultdict(int)
+        # the BlockState (uint8) and number of retries (int32) of each block,
+        # per task, as arrays indexed by the row in the block table (eager
+        # mode) or the position in the block grid (lazy mode), and the number
+        # of blocks in each state
+        self.block_states = {}
+        self.retry_counts = {}
+        self.task_state_counts = {}
+        self.num_processing = 0
+
+        # blocks that were completed in an earlier run, given to init()
+        self.completed_blocks = {}
+        self.task_restored_count = collections.defaultdict(int)
         self.task_total_block_count = collections.defaultdict(int)
 
-        self.use_z_order_scheduling = True
-        if self.use_z_order_scheduling:
-            self.ready_queues = collections.defaultdict(list)
+        # lazy mode: the block grid of each task, the grid index of each
+        # block in self.blocks, and the number of unfinished dependencies of
+        # blocks that are not ready yet, indexed by (task_id, grid index)
+        self.block_grids = {}
+        self.block_indices = {}
+        self.remaining_dependencies = {}
+
+        # eager mode: the block table of each task, the number of unfinished
+        # dependencies of each block (by row), and the dependents of each
+        # block in other tasks as {task_id: {dependent task_id: (ptrs,
+        # rows)}}, in the same format as BlockTable.get_dependents()
+        self.block_tables = {}
+        self.dependency_counts = {}
+        self.inter_task_dependents = collections.defaultdict(dict)
 
     def add(self, task):
         '''Add a ``Task`` to the graph.
@@ -76,29 +158,62 @@ class DependencyGraph():
 
             # modify task dependency graph
             self.task_dependency[task.task_id].add(dependency_task.task_id)
+            self.task_dependents[dependency_task.task_id].add(task.task_id)
 
-    def init(self, task_id, request_roi=None):
+    def init(self, task_id, request_roi=None, completed_blocks=None):
         '''Called by the ``scheduler`` after all tasks have been added.
         Call the prepare() of each task, and create the entire
-        block-wise graph.'''
+        block-wise graph.
+
+        Args:
+
+            task_id (``string``):
+
+                The task to create the graph for, together with its
+                dependencies.
+
+            request_roi (`class:daisy.Roi`, optional):
+
+                Only create the blocks needed to write to this ROI.
+
+            completed_blocks (`dict` {task_id: ``ndarray``}, optional):
+
+                The IDs of blocks that were completed in an earlier run (see
+                ``CompletionJournal``). These blocks are marked as done
+                without calling their ``pre_check``.
+        '''
         assert(task_id in self.task_map)
+        if self.num_processing or any(
+                self.get_task_done_count(t) > self.task_restored_count[t]
+                for t in self.task_state_counts):
+            raise RuntimeError(
+                "Tasks can not be initialized after blocks were processed")
+        if completed_blocks is not None:
+            self.completed_blocks.update(completed_blocks)
         self.created_tasks = set()
         self.__recursively_prepare(task_id)
+        if self.lazy:
+            self.priority_policy.prepare(self)
         self.__recursively_create_dependency_graph(task_id, request_roi)
-
-    def add_to_ready_queue(self, task_id, block_id):
-        if self.use_z_order_scheduling:
-            heapq.heappush(self.ready_queues[task_id],
-                           (self.blocks[block_id].z_order_id, block_id))
+        if self.lazy:
+            self.__restore_lazy_blocks()
         else:
-            self.ready_queues[task_id].append(block_id)
+            self.__create_block_dependencies()
+
+    def add_to_ready_queue(self, task_id, block_id, finished_block_id=None):
+        self.__set_state(
+            task_id,
+            self.__get_position(block_id),
+            BlockState.READY)
+        priority = self.priority_policy.get_priority(
+            self,
+            task_id,
+            self.get_block(block_id),
+            finished_block_id)
+        self.ready_queues[task_id].push(priority, block_id[1])
 
     def get_from_ready_queue(self, task_id):
-        if self.use_z_order_scheduling:
-            item = heapq.heappop(self.ready_queues[task_id])
-            return item[1]
-        else:
-            return self.ready_queues[task_id].popleft()
+        return (task_id, self.ready_queues[task_id].pop())
 
     def __recursively_create_dependency_graph(self, task_id, request_roi):
         '''Create dependency graph for its dependencies first before
@@ -143,52 +258,250 @@ class DependencyGraph():
             self.__recursively_create_dependency_graph(dependency_task,
                                                        dependency_request_roi)
 
-        # finally create graph for this task
-        # first create the self-contained dependency graph
-        blocks = create_dependency_graph(
+        if self.lazy:
+            self.__create_block_grid(task_id)
+            return
+
+        # finally create the blocks of this task, their dependencies are
+        # created in init() once all tasks are known (z-order IDs are
+        # relative to the original total ROI, to be the same for all
+        # requests)
+        table = BlockTable(
             task._daisy.total_roi,
             task._daisy.read_roi,
             task._daisy.write_roi,
             task._daisy.read_write_conflict,
-            task._daisy.fit)
+            task._daisy.fit,
+            grid_begin=task._daisy.orig_total_roi.get_begin())
 
-        self.task_total_block_count[task_id] += len(blocks)
-        self.task_done_count[task_id] = 0
+        if task_id in self.block_tables:
+            self.block_tables[task_id].merge(table)
+        else:
+            self.block_tables[task_id] = table
+
+        self.task_total_block_count[task_id] = len(
+            self.block_tables[task_id])
 
         # some sanity checks
         assert(task._daisy.max_retries >= 0)
 
-        # add tasks to block-wise graph, while accounting for intra-task
-        # and inter-task dependencies
-        for block, block_dependencies in blocks:
+    def __create_block_dependencies(self):
+        '''Count the unfinished dependencies of all blocks, find the dependents
+        of each block in other tasks, and fill the ready queues with all
+        blocks without dependencies.'''
+
+        self.ready_queues = collections.defaultdict(ReadyQueue)
+        self.inter_task_dependents = collections.defaultdict(dict)
+
+        for task_id, table in self.block_tables.items():
 
-            block_id = (task_id, block.block_id)
+            self.__create_states(task_id, len(table))
 
-            if block_id in self.blocks:
+            # intra-task dependencies
+            counts = np.diff(table.conflict_ptrs)
+
+            # inter-task read-write dependencies
+            for dependency_task in self.task_dependency[task_id]:
+
+                dependency_table = self.block_tables[dependency_task]
+                rows, dependency_rows = dependency_table.get_rows_writing(
+                    table.read_rois)
+                counts += np.bincount(rows, minlength=len(table))
+
+                # rows of dependents for each row of the dependency table
+                order = np.argsort(dependency_rows, kind='stable')
+                ptrs = np.zeros(len(dependency_table) + 1, dtype=np.int64)
+                np.cumsum(
+                    np.bincount(dependency_rows, minlength=len(
+                        dependency_table)),
+                    out=ptrs[1:])
+                self.inter_task_dependents[dependency_task][task_id] = (
+                    ptrs,
+                    rows[order])
+
+            self.dependency_counts[task_id] = counts
+
+        self.__restore_blocks()
+
+        self.priority_policy.prepare(self)
+
+        for task_id, table in self.block_tables.items():
+
+            ready = np.flatnonzero(self.dependency_counts[task_id] == 0)
+            if len(ready) == 0:
                 continue
 
-            self.blocks[block_id] = block
+            self.__set_states(task_id, ready, BlockState.READY)
+            self.ready_queues[task_id].push_all(
+                self.priority_policy.get_priorities(self, task_id, ready),
+                table.block_ids[ready])
+
+    def __restore_blocks(self):
+        '''Mark the completed blocks given to init() as done in eager mode,
+        and subtract them from the dependency counts of their dependents.
+        Done blocks get a negative dependency count, such that they are
+        never added to a ready queue.'''
+
+        done = {}
+        for task_id, table in self.block_tables.items():
+            mask = np.zeros(len(table), dtype=bool)
+            if task_id in self.completed_blocks:
+                rows = table.get_rows(self.completed_blocks[task_id])
+                mask[rows[rows >= 0]] = True
+            done[task_id] = mask
+
+        for task_id, table in self.block_tables.items():
+
+            mask = done[task_id]
+            if not mask.any():
+                continue
 
-            dependencies = [(task_id, b.block_id) for b in block_dependencies]
+            counts = self.dependency_counts[task_id]
+            done_dependents = table.dependent_indices[
+                np.repeat(mask, np.diff(table.dependent_ptrs))]
+            counts -= np.bincount(done_dependents, minlength=len(counts))
 
-            # add inter-task read-write dependency
-            if len(self.task_dependency[task_id]):
-                roi = block.read_roi
-                for dependent_task in self.task_dependency[task_id]:
-                    block_ids = self._get_subgraph_blocks(dependent_task, roi)
-                    dependencies.extend([
-                        (dependent_task, block_id)
-                        for block_id in block_ids
-                    ])
+            for dependent_task, (ptrs, rows) in \
+                    self.inter_task_dependents[task_id].items():
+                counts = self.dependency_counts[dependent_task]
+                done_dependents = rows[np.repeat(mask, np.diff(ptrs))]
+                counts -= np.bincount(done_dependents, minlength=len(counts))
 
-            for dep_id in dependencies:
-                self.dependents[dep_id].add(block_id)
-                self.dependencies[block_id].add(dep_id)
+        for task_id, mask in done.items():
 
-            if len(dependencies) == 0:
-                # if this block has no dependencies, add it to the ready
-                # queue immediately
-                self.add_to_ready_queue(task_id, block_id)
+            self.dependency_counts[task_id][mask] = -1
+            self.__set_states(task_id, np.flatnonzero(mask), BlockState.DONE)
+            num_done = int(np.count_nonzero(mask))
+            self.task_restored_count[task_id] = num_done
+
+            if num_done > 0:
+                logger.info(
+                    "Task %s: %d of %d blocks were completed in an earlier "
+                    "run", task_id, num_done, len(mask))
+
+    def __restore_lazy_blocks(self):
+        '''Mark the completed blocks given to init() as done in lazy mode.
+        Since blocks are only created once they are ready, this repeatedly
+        removes completed blocks from the ready queues, until the ready
+        queues contain no more completed blocks.'''
+
+        if len(self.completed_blocks) == 0:
+            return
+
+        restored_any = True
+        while restored_any:
+
+            restored_any = False
+            for task_id in list(self.ready_queues.keys()):
+
+                if task_id not in self.completed_blocks:
+                    continue
+
+                completed = self.completed_blocks[task_id]
+                queue = self.ready_queues[task_id]
+                not_completed = []
+
+                while len(queue) > 0:
+
+                    block_id = self.get_from_ready_queue(task_id)
+                    position = np.searchsorted(completed, block_id[1])
+                    if (
+                            position == len(completed) or
+                            completed[position] != block_id[1]):
+                        not_completed.append(block_id)
+                        continue
+
+                    self.__set_state(
+                        task_id,
+                        self.__get_position(block_id),
+                        BlockState.DONE)
+                    self.task_restored_count[task_id] += 1
+                    self.__remove_lazy_block(block_id)
+                    restored_any = True
+
+                for block_id in not_completed:
+                    self.add_to_ready_queue(task_id, block_id)
+
+    def __create_block_grid(self, task_id):
+        '''Create the block grid of a task for lazy mode, and add its blocks
+        without dependencies to the ready queue. All other blocks are created
+        in ``remove_and_update()``, once their last dependency finished.'''
+
+        task = self.task_map[task_id]
+        grid = BlockGrid(
+            task._daisy.total_roi,
+            task._daisy.read_roi,
+            task._daisy.write_roi,
+            task._daisy.read_write_conflict,
+            task._daisy.fit)
+
+        if task_id in self.block_grids:
+            if self.block_grids[task_id].total_roi != grid.total_roi:
+                raise RuntimeError(
+                    "Task %s is requested with different total ROIs (%s and "
+                    "%s), this is not supported for lazy dependency graphs"
+                    % (task_id, self.block_grids[task_id].total_roi,
+                       grid.total_roi))
+            return
+
+        self.block_grids[task_id] = grid
+        self.task_total_block_count[task_id] += grid.size()
+        self.__create_states(task_id, grid.size())
+
+        # some sanity checks
+        assert task._daisy.max_retries >= 0
+
+        for index in grid.get_roots():
+            if len(self.__get_lazy_dependencies(task_id, index)) == 0:
+                self.__add_lazy_block(task_id, index)
+
+    def __add_lazy_block(self, task_id, index, finished_block_id=None):
+        '''Create a block in lazy mode and add it to the ready queue.'''
+
+        block = self.block_grids[task_id].get_block(index)
+        block_id = (task_id, block.block_id)
+
+        self.blocks[block_id] = block
+        self.block_indices[block_id] = index
+        self.add_to_ready_queue(task_id, block_id, finished_block_id)
+
+    def __get_lazy_dependencies(self, task_id, index):
+        '''Get the ``(task_id, index)`` of all dependencies of a block in lazy
+        mode.'''
+
+        grid = self.block_grids[task_id]
+        dependencies = [(task_id, i) for i in grid.get_dependencies(index)]
+
+        if len(self.task_dependency[task_id]):
+            roi = grid.get_read_roi(index)
+            for dependency_task in self.task_dependency[task_id]:
+                dependency_grid = self.block_grids[dependency_task]
+                dependencies.extend([
+                    (dependency_task, i)
+                    for i in dependency_grid.get_indices_writing(roi)
+                ])
+
+        return dependencies
+
+    def __get_lazy_dependents(self, task_id, index):
+        '''Get the ``(task_id, index)`` of all dependents of a block in lazy
+        mode.'''
+
+        grid = self.block_grids[task_id]
+        dependents = [(task_id, i) for i in grid.get_dependents(index)]
+
+        if len(self.task_dependents[task_id]):
+            cell = grid.get_write_cell(index)
+            for dependent_task in self.task_dependents[task_id]:
+                if dependent_task not in self.block_grids:
+                    continue
+                dependent_grid = self.block_grids[dependent_task]
+                dependents.extend([
+                    (dependent_task, i)
+                    for i in dependent_grid.get_indices_reading(cell)
+                ])
+
+        return dependents
 
     def __recursively_prepare(self, task):
 
@@ -201,14 +514,33 @@ class DependencyGraph():
 
         self.task_map[task].prepare()
 
-    def next(self, waiting_blocks):
+    def next(self, waiting_blocks, max_blocks=None, wait=True):
         '''Called by the ``scheduler`` to get a `dict` of ready blocks.
         This function blocks when outstanding blocks are empty and
         there is no further ready blocks to issue. This (only) happens
         when there are outstanding, currently executing blocks.
 
+        Args:
+
+            waiting_blocks (`dict` {task_id: `deque` of blocks}):
+
+                Blocks returned by a previous call that have not been
+                scheduled yet. New blocks are appended to these queues.
+
+            max_blocks (`dict` {task_id: ``int``}, optional):
+
+                The maximal number of blocks per task (including waiting
+                blocks) to return, e.g., the number of idle workers of each
+                task. Tasks that are not in ``max_blocks`` get no blocks. If
+                not given, one block per task is returned.
+
+            wait (``bool``, optional):
+
+                If set to ``False``, return immediately (possibly with an
+                empty `dict`) instead of blocking.
+
         Return:
-            `dict` {task_id: block} for ready task blocks.
+            `dict` {task_id: `deque` of blocks} for ready task blocks.
             Empty `dict` does not necessarily mean that there is
             no more blocks to be run (though it is the case currently).
             The scheduler should call empty() to really make sure that
@@ -224,20 +556,38 @@ class DependencyGraph():
 
                 for task_type in self.ready_queues:
 
-                    if task_type in return_blocks:
-                        pass
+                    num_blocks = 1
+                    if max_blocks is not None:
+                        num_blocks = max_blocks.get(task_type, 0)
 
-                    elif len(self.ready_queues[task_type]) == 0:
-                        pass
+                    task_blocks = return_blocks.get(task_type, [])
+                    num_blocks -= len(task_blocks)
 
-                    else:
-                        block_id = self.get_from_ready_queue(task_type)
-                        self.processing_blocks.add(block_id)
-                        self.task_processing_blocks[block_id[0]].add(
-                            block_id[1])
-                        return_blocks[block_id[0]] = self.blocks[block_id]
+                    while (
+                            num_blocks > 0 and
+                            len(self.ready_queues[task_type]) > 0):
 
-                if len(return_blocks):
+                        block_id = self.get_from_ready_queue(task_type)
+                        position = self.__get_position(block_id)
+                        if block_id not in self.blocks:
+                            self.blocks[block_id] = self.block_tables[
+                                task_type].get_block(position)
+                        self.__set_state(
+                            task_type,
+                            position,
+                            BlockState.PROCESSING)
+                        if task_type not in return_blocks:
+                            return_blocks[task_type] = collections.deque()
+                        return_blocks[task_type].append(
+                            self.blocks[block_id])
+                        num_blocks -= 1
+
+                # return if there is something to return, or if there are
+                # ready blocks, but max_blocks did not ask for them
+                if (
+                        len(return_blocks) or
+                        not wait or
+                        self.ready_size() > 0):
                     return return_blocks
 
                 # empty work list; blocks until more blocks are returned
@@ -254,65 +604,199 @@ class DependencyGraph():
         are failed blocks that prevent other blocks from running.'''
         return (
             (self.ready_size() == 0) and
-            (len(self.processing_blocks) == 0))
+            (self.num_processing == 0))
 
     def size(self):
         '''Return the size of the block-wise graph.'''
-        return len(self.blocks)
-
-    def ready_size(self):
-        '''Return the number of blocks ready to be run.'''
+        return sum(self.task_total_block_count.values())
+
+    def ready_size(self, task_id=None):
+        '''Return the number of blocks ready to be run, of all tasks or of
+        the given task.'''
+        if task_id is not None:
+            if task_id not in self.ready_queues:
+                return 0
+            return len(self.ready_queues[task_id])
         count = 0
         for task in self.ready_queues:
             count += len(self.ready_queues[task])
         return count
 
     def get_orphans(self):
-        '''Return the number of blocks cannot be issued due to failed
+        '''Return the IDs of blocks that cannot be issued due to failed
         dependencies.'''
-        return self.orphaned_blocks
+        return self.__get_block_ids_in_state(BlockState.ORPHANED)
 
     def get_failed_blocks(self):
-        '''Return blocks that have failed and won't be retried.'''
-        return self.failed_blocks
+        '''Return the IDs of blocks that have failed and won't be
+        retried.'''
+        return self.__get_block_ids_in_state(BlockState.FAILED)
+
+    def get_state_counts(self):
+        '''Return the number of blocks in each ``BlockState``, over all
+        tasks, as an array indexed by state.'''
+        counts = np.zeros(BlockState.NUM_STATES, dtype=np.int64)
+        for task_counts in self.task_state_counts.values():
+            counts += task_counts
+        return counts
+
+    def get_task_state_counts(self, task_id):
+        '''Return the number of blocks of a task in each ``BlockState``, as
+        an array indexed by state.'''
+        if task_id not in self.task_state_counts:
+            return np.zeros(BlockState.NUM_STATES, dtype=np.int64)
+        return self.task_state_counts[task_id].copy()
+
+    def __create_states(self, task_id, num_blocks):
+
+        self.block_states[task_id] = np.full(
+            num_blocks,
+            BlockState.PENDING,
+            dtype=np.uint8)
+        self.retry_counts[task_id] = np.zeros(num_blocks, dtype=np.int32)
+        self.task_state_counts[task_id] = np.zeros(
+            BlockState.NUM_STATES,
+            dtype=np.int64)
+        self.task_state_counts[task_id][BlockState.PENDING] = num_blocks
+
+    def __get_position(self, block_id):
+        '''Get the index of a block in the state arrays of its task.'''
+
+        task_id = block_id[0]
+        if self.lazy:
+            return self.block_grids[task_id].get_position(
+                self.block_indices[block_id])
+        return self.block_tables[task_id].get_row(block_id[1])
+
+    def __set_state(self, task_id, position, state):
+
+        states = self.block_states[task_id]
+        counts = self.task_state_counts[task_id]
+
+        previous_state = states[position]
+        if previous_state == BlockState.PROCESSING:
+            self.num_processing -= 1
+        if state == BlockState.PROCESSING:
+            self.num_processing += 1
+
+        counts[previous_state] -= 1
+        counts[state] += 1
+        states[position] = state
+
+    def __set_states(self, task_id, positions, state):
+        '''Vectorized version of ``__set_state()``, for blocks that are
+        not being processed.'''
+
+        states = self.block_states[task_id]
+        counts = self.task_state_counts[task_id]
+
+        counts -= np.bincount(
+            states[positions],
+            minlength=BlockState.NUM_STATES)
+        counts[state] += len(positions)
+        states[positions] = state
+
+    def __get_block_ids_in_state(self, state):
+
+        block_ids = set()
+
+        for task_id, states in self.block_states.items():
+
+            positions = np.flatnonzero(states == state)
+
+            if self.lazy:
+                grid = self.block_grids[task_id]
+                block_ids.update(
+                    (task_id, grid.get_block(grid.get_index(p)).block_id)
+                    for p in positions.tolist())
+            else:
+                table = self.block_tables[task_id]
+                block_ids.update(
+                    (task_id, b)
+                    for b in table.block_ids[positions].tolist())
+
+        return block_ids
 
     def get_block(self, block_id):
         '''Return a specific block.'''
-        return self.blocks[block_id]
-
-    def cancel_and_reschedule(self, block_id):
+        if block_id in self.blocks or self.lazy:
+            return self.blocks[block_id]
+        table = self.block_tables[block_id[0]]
+        return table.get_block(table.get_row(block_id[1]))
+
+    def get_dependents(self, block_id):
+        '''Return the IDs of all blocks that depend on the given block. In
+        lazy mode, this is only supported for blocks that are ready or being
+        processed.'''
+
+        task_id = block_id[0]
+
+        if self.lazy:
+            return [
+                (t, self.block_grids[t].get_block(index).block_id)
+                for t, index in self.__get_lazy_dependents(
+                    task_id,
+                    self.block_indices[block_id])
+            ]
+
+        return [
+            (t, int(self.block_tables[t].block_ids[row]))
+            for t, rows in self.__get_dependent_rows(
+                task_id,
+                self.block_tables[task_id].get_row(block_id[1]))
+            for row in rows
+        ]
+
+    def __get_dependent_rows(self, task_id, row):
+        '''Get the rows of the dependents of a block in eager mode, as a list
+        of ``(task_id, rows)``.'''
+
+        dependents = [
+            (task_id, self.block_tables[task_id].get_dependents(row))
+        ]
+        for dependent_task, (ptrs, rows) in \
+                self.inter_task_dependents[task_id].items():
+            dependents.append(
+                (dependent_task, rows[ptrs[row]:ptrs[row + 1]]))
+
+        return dependents
+
+    def cancel_and_reschedule(self, block_id, count_retry=True):
         '''Used to notify that a block has failed. The block will either
         be rescheduled if within the number of retries, or be marked
-        as failed.'''
-        if block_id not in self.processing_blocks:
-            logger.error(
-                "Block %d is canceled but was not found", block_id)
-            raise
+        as failed. If ``count_retry`` is ``False``, the block is rescheduled
+        without counting it as a retry (e.g., because it was never started).
+        '''
+        task_id = block_id[0]
+        position = self.__get_position(block_id)
 
-        self.retry_count[block_id] = self.retry_count[block_id] + 1
+        if self.block_states[task_id][position] != BlockState.PROCESSING:
+            raise RuntimeError(
+                "Block %s is canceled but was not being processed" %
+                (block_id,))
 
         with self.ready_queue_cv:
 
-            self.processing_blocks.remove(block_id)
-            self.task_processing_blocks[block_id[0]].remove(block_id[1])
-            task_id = block_id[0]
+            retry_count = self.retry_counts[task_id]
+            if count_retry:
+                retry_count[position] += 1
 
             if (
-                    self.retry_count[block_id] >
+                    retry_count[position] >
                     self.task_map[task_id]._daisy.max_retries):
 
-                self.failed_blocks.add(block_id)
-                self.task_failed_count[block_id[0]] += 1
+                self.__set_state(task_id, position, BlockState.FAILED)
                 logger.error(
                     "Block {} is canceled and will not be rescheduled."
                     .format(block_id))
 
-                if len(self.dependents[block_id]):
+                orphan_counts = self.mark_orphans(block_id)
+                if len(orphan_counts):
                     logger.error(
-                        "The following blocks are then orphaned and "
-                        "cannot be run: {}".format(self.dependents[block_id]))
-
-                self.recursively_check_orphans(block_id)
+                        "%d blocks of %d tasks are then orphaned and cannot "
+                        "be run",
+                        sum(orphan_counts.values()), len(orphan_counts))
+                    logger.debug("orphans per task: %s", orphan_counts)
                 # simply leave it canceled at this point
 
             else:
@@ -320,38 +804,209 @@ class DependencyGraph():
                 self.add_to_ready_queue(task_id, block_id)
                 logger.info("Block {} will be rescheduled.".format(block_id))
 
-            self.ready_queue_cv.notify()  # in either case, unblock next()
+            # in either case, unblock next()
+            self.update_count += 1
+            self.ready_queue_cv.notify_all()
 
     def recursively_check_orphans(self, block_id):
-        '''Check and mark children of the given block as orphans.'''
-        for orphan_id in self.dependents[block_id]:
+        '''Check and mark children of the given block as orphans. Deprecated,
+        use ``mark_orphans()``.'''
+        self.mark_orphans(block_id)
+
+    def mark_orphans(self, block_id):
+        '''Mark all direct and indirect dependents of the given (failed)
+        block as orphans.
+
+        Dependents are visited in a breadth-first search over all tasks. In
+        eager mode, each step processes the whole frontier at once. Every
+        block enters the frontier at most once, since blocks that are
+        orphaned or failed already are not visited again.
 
-            if (orphan_id in self.orphaned_blocks
-                    or orphan_id in self.failed_blocks):
-                return
+        Returns:
 
-            self.orphaned_blocks.add(orphan_id)
-            self.recursively_check_orphans(orphan_id)
+            `dict` {task_id: ``int``} with the number of new orphans per
+            task.
+        '''
+
+        if self.lazy:
+            return self.__mark_lazy_orphans(block_id)
+
+        orphan_counts = collections.defaultdict(int)
+
+        task_id = block_id[0]
+        frontier = {
+            task_id: np.array(
+                [self.block_tables[task_id].get_row(block_id[1])],
+                dtype=np.int64)
+        }
+
+        while len(frontier) > 0:
+
+            # rows of the dependents of the frontier, per task
+            dependents = collections.defaultdict(list)
+            for task_id, rows in frontier.items():
+
+                table = self.block_tables[task_id]
+                dependents[task_id].append(_get_csr_rows(
+                    table.dependent_ptrs,
+                    table.dependent_indices,
+                    rows))
+
+                for dependent_task, (ptrs, dependent_rows) in \
+                        self.inter_task_dependents[task_id].items():
+                    dependents[dependent_task].append(_get_csr_rows(
+                        ptrs,
+                        dependent_rows,
+                        rows))
+
+            frontier = {}
+            for task_id, rows in dependents.items():
+
+                rows = np.unique(np.concatenate(rows))
+                states = self.block_states[task_id][rows]
+                rows = rows[
+                    (states != BlockState.ORPHANED) &
+                    (states != BlockState.FAILED)]
+                if len(rows) == 0:
+                    continue
+
+                self.__set_states(task_id, rows, BlockState.ORPHANED)
+                orphan_counts[task_id] += len(rows)
+                frontier[task_id] = rows
+
+        return dict(orphan_counts)
+
+    def __mark_lazy_orphans(self, block_id):
+        '''Lazy mode version of ``mark_orphans()``, visiting one block at a
+        time.'''
+
+        orphan_counts = collections.defaultdict(int)
+        to_check = collections.deque([
+            (block_id[0], self.block_indices[block_id])
+        ])
+
+        while len(to_check) > 0:
+
+            task_id, index = to_check.popleft()
+
+            for dependent in self.__get_lazy_dependents(task_id, index):
+
+                dependent_task, dependent_index = dependent
+                position = self.block_grids[dependent_task].get_position(
+                    dependent_index)
+                if self.block_states[dependent_task][position] in [
+                        BlockState.ORPHANED,
+                        BlockState.FAILED]:
+                    continue
+
+                self.__set_state(dependent_task, position, BlockState.ORPHANED)
+                orphan_counts[dependent_task] += 1
+                to_check.append(dependent)
+
+        return dict(orphan_counts)
 
     def remove_and_update(self, block_id):
         '''Removing a finished block and update ready queue.'''
         with self.ready_queue_cv:
 
-            self.task_done_count[block_id[0]] += 1
-            self.processing_blocks.remove(block_id)
-            self.task_processing_blocks[block_id[0]].remove(block_id[1])
+            position = self.__get_position(block_id)
+            self.__set_state(block_id[0], position, BlockState.DONE)
+
+            if self.lazy:
+                self.__remove_lazy_block(block_id)
 
-            dependents = self.dependents[block_id]
-            for dep in dependents:
-                self.dependencies[dep].remove(block_id)
-                if len(self.dependencies[dep]) == 0:
-                    # ready to run
-                    self.add_to_ready_queue(dep[0], dep)
+            else:
+                self.__remove_block(block_id, position)
 
             # Unblock next() regardless. If we only unblock for new
             # elements in ready_queue, the program might lock up if
             # this block is the last
-            self.ready_queue_cv.notify()
+            self.update_count += 1
+            self.ready_queue_cv.notify_all()
+
+    def __remove_block(self, block_id, row):
+        '''Forget a finished block (in the given row of its block table) in
+        eager mode, and add the dependents for which it was the last
+        unfinished dependency to the ready queue.'''
+
+        del self.blocks[block_id]
+
+        task_id = block_id[0]
+
+        for dependent_task, rows in self.__get_dependent_rows(task_id, row):
+
+            if len(rows) == 0:
+                continue
+
+            table = self.block_tables[dependent_task]
+            counts = self.dependency_counts[dependent_task]
+            counts[rows] -= 1
+
+            # ready to run
+            ready = rows[counts[rows] == 0]
+            if len(ready) == 0:
+                continue
+
+            self.__set_states(dependent_task, ready, BlockState.READY)
+
+            priorities = self.priority_policy.get_priorities(
+                self,
+                dependent_task,
+                ready,
+                block_id)
+            for priority, dependent_id in zip(
+                    zip(*[p.tolist() for p in priorities]),
+                    table.block_ids[ready].tolist()):
+                self.ready_queues[dependent_task].push(
+                    priority,
+                    dependent_id)
+
+    def __remove_lazy_block(self, block_id):
+        '''Forget a finished block in lazy mode, and create the dependents
+        for which it was the last unfinished dependency.'''
+
+        index = self.block_indices.pop(block_id)
+        del self.blocks[block_id]
+
+        for dependent in self.__get_lazy_dependents(block_id[0], index):
+
+            remaining = self.remaining_dependencies.pop(dependent, None)
+            if remaining is None:
+                # first finished dependency of this block
+                remaining = len(self.__get_lazy_dependencies(*dependent))
+            remaining -= 1
+
+            if remaining == 0:
+                # ready to run
+                self.__add_lazy_block(*dependent, block_id)
+            else:
+                self.remaining_dependencies[dependent] = remaining
+
+    def get_update_count(self):
+        '''Return the current update count, to be passed to
+        ``wait_for_update()``.'''
+        with self.ready_queue_cv:
+            return self.update_count
+
+    def notify_update(self):
+        '''Notify a scheduler waiting in ``wait_for_update()`` about an
+        external event that might allow it to make progress, e.g., a worker
+        becoming idle.'''
+        with self.ready_queue_cv:
+            self.update_count += 1
+            self.ready_queue_cv.notify_all()
+
+    def wait_for_update(self, update_count, timeout=None):
+        '''Block until an update happened after ``update_count`` was obtained
+        through ``get_update_count()``, or until ``timeout`` seconds passed.
+        Updates are finished or canceled blocks and calls to
+        ``notify_update()``.
+
+        Returns the current update count.'''
+        with self.ready_queue_cv:
+            if self.update_count == update_count:
+                self.ready_queue_cv.wait(timeout)
+            return self.update_count
 
     def get_subgraph(self, roi):
         '''Create a subgraph given a ROI, assuming this ROI is that
@@ -404,17 +1059,33 @@ class DependencyGraph():
 
     def is_task_done(self, task_id):
         '''Return ``True`` if all blocks of a task have completed.'''
-        return (self.task_done_count[task_id]
+        return (self.get_task_done_count(task_id)
                 == self.task_total_block_count[task_id])
 
     def get_task_size(self, task_id):
         return self.task_total_block_count[task_id]
 
     def get_task_done_count(self, task_id):
-        return self.task_done_count[task_id]
+        if task_id not in self.task_state_counts:
+            return 0
+        return int(self.task_state_counts[task_id][BlockState.DONE])
 
-    def get_task_failed_count(self, task_id):
-        return self.task_failed_count[task_id]
+    def get_task_restored_count(self, task_id):
+        '''Return the number of blocks of a task that were completed in an
+        earlier run.'''
+        return self.task_restored_count[task_id]
 
-    def get_task_processing_blocks(self, task_id):
-        return self.task_processing_blocks[task_id]
+    def get_restored_count(self):
+        '''Return the number of blocks that were completed in an earlier
+        run.'''
+        return sum(self.task_restored_count.values())
+
+    def get_task_failed_count(self, task_id):
+        if task_id not in self.task_state_counts:
+            return 0
+        return int(self.task_state_counts[task_id][BlockState.FAILED])
+
+    def get_task_processing_count(self, task_id):
+        if task_id not in self.task_state_counts:
+            return 0
+        return int(self.task_state_counts[task_id][BlockState.PROCESSING])
@@ -0,0 +1,220 @@
+from __future__ import absolute_import
+import collections
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram():
+    '''A histogram of durations, with one bucket per power of two
+    microseconds. Adding a duration takes constant time and memory, such
+    that every block can be recorded.
+
+    Percentiles are estimated by the upper bound of the bucket they fall
+    into, i.e., they are accurate up to a factor of two.
+    '''
+
+    num_buckets = 48
+
+    def __init__(self):
+
+        self.counts = [0]*self.num_buckets
+        self.count = 0
+        self.total = 0.0
+        self.min = float('inf')
+        self.max = 0.0
+
+    def add(self, duration):
+        '''Add a duration, in seconds.'''
+
+        bucket = min(
+            int(duration*1e6).bit_length() if duration > 0 else 0,
+            self.num_buckets - 1)
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total += duration
+        if duration < self.min:
+            self.min = duration
+        if duration > self.max:
+            self.max = duration
+
+    def merge(self, other):
+        '''Add all durations of another histogram to this one.'''
+
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def mean(self):
+        return self.total/self.count if self.count > 0 else 0.0
+
+    def percentile(self, p):
+        '''Estimate the ``p``-th percentile (between 0 and 100), in
+        seconds.'''
+
+        if self.count == 0:
+            return 0.0
+
+        rank = p/100.0*self.count
+        cumulative = 0
+        for bucket, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= rank and count > 0:
+                upper = (1 << bucket)*1e-6
+                return max(self.min, min(upper, self.max))
+
+        return self.max
+
+
+class Instrumentation():
+    '''Collects histograms of the time spent in each step of scheduling a
+    block, per task.
+
+    The scheduler records the following metrics (all durations in seconds):
+
+        ``next``:
+
+            Getting ready blocks from the ``DependencyGraph``, per call (not
+            per task).
+
+        ``pre_check``, ``post_check``:
+
+            Evaluating the ``pre_check`` and ``post_check`` of a block. For
+            a ``batch_pre_check``, the time of the batch is divided evenly
+            among its blocks.
+
+        ``queue_wait``:
+
+            The time a block waits for an idle worker after its
+            ``pre_check``.
+
+        ``send``:
+
+            Sending a block to a worker, from handing it to the network
+            thread until it was written to the connection.
+
+        ``compute``:
+
+            Processing a block in a worker, as reported by the worker (the
+            time between ``Client.acquire_block()`` returning it and
+            ``Client.release_block()``).
+
+        ``dispatch``:
+
+            The time between sending a block and receiving its result, minus
+            ``compute``. This is the overhead of distributing a block,
+            including network latency and the time the block spends in the
+            worker's prefetch queue.
+
+        ``update``:
+
+            Finishing or rescheduling a returned block in the
+            ``DependencyGraph``.
+
+    Recording a duration is cheap enough to be always enabled. Pass an
+    instance with ``enabled=False`` to ``distribute()`` to disable it
+    anyway.
+
+    Args:
+
+        enabled (``bool``, optional):
+
+            If not set, ``record()`` does nothing.
+    '''
+
+    metrics = [
+        'next',
+        'pre_check',
+        'queue_wait',
+        'send',
+        'compute',
+        'dispatch',
+        'post_check',
+        'update',
+    ]
+
+    def __init__(self, enabled=True):
+
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        # {(metric, task_id): Histogram}
+        self.histograms = collections.defaultdict(Histogram)
+
+    def record(self, metric, task_id, duration):
+        '''Record one duration (in seconds) of the given metric. Can be
+        called from any thread.'''
+
+        if not self.enabled:
+            return
+
+        with self.lock:
+            self.histograms[(metric, task_id)].add(duration)
+
+    def get_histogram(self, metric, task_id=None):
+        '''Get a copy of the histogram of a metric for the given task, or
+        for all tasks if ``task_id`` is ``None``.'''
+
+        histogram = Histogram()
+
+        with self.lock:
+            for (m, t), h in self.histograms.items():
+                if m == metric and (task_id is None or t == task_id):
+                    histogram.merge(h)
+
+        return histogram
+
+    def get_task_ids(self):
+        '''Get the IDs of all tasks with recorded durations.'''
+
+        with self.lock:
+            return sorted(set(
+                t for _, t in self.histograms.keys()
+                if t is not None))
+
+    def get_summary(self):
+        '''Get a table of the count, mean, and percentiles of each metric and
+        task, as a string.'''
+
+        lines = [
+            "%-12s %-20s %10s %10s %10s %10s %10s %10s" % (
+                'metric', 'task', 'count', 'mean', 'p50', 'p90', 'p99',
+                'max')
+        ]
+
+        with self.lock:
+            histograms = dict(self.histograms)
+
+        ordered_metrics = self.metrics + sorted(
+            set(m for m, _ in histograms) - set(self.metrics))
+
+        for metric in ordered_metrics:
+            task_ids = sorted(
+                set(t for m, t in histograms if m == metric),
+                key=str)
+            for task_id in task_ids:
+                histogram = histograms[(metric, task_id)]
+                lines.append(
+                    "%-12s %-20s %10d %10s %10s %10s %10s %10s" % (
+                        metric,
+                        '-' if task_id is None else task_id,
+                        histogram.count,
+                        _format_duration(histogram.mean()),
+                        _format_duration(histogram.percentile(50)),
+                        _format_duration(histogram.percentile(90)),
+                        _format_duration(histogram.percentile(99)),
+                        _format_duration(histogram.max)))
+
+        return '\n'.join(lines)
+
+
+def _format_duration(seconds):
+
+    if seconds < 1e-3:
+        return '%.1fus' % (seconds*1e6)
+    if seconds < 1:
+        return '%.2fms' % (seconds*1e3)
+    return '%.2fs' % seconds
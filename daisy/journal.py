@@ -0,0 +1,95 @@
+from __future__ import absolute_import
+import collections
+import logging
+import numpy as np
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class CompletionJournal():
+    '''An append-only file of completed blocks, used to resume a run without
+    checking every block again.
+
+    Each completed block is written as one line ``<task_id>\\t<block_id>``.
+    Lines are written through to the operating system as soon as a block is
+    added, such that only the block being written can be lost if the
+    scheduler crashes.
+
+    The journal refers to blocks by their IDs only. It has to be deleted if
+    the ROIs of a task change between runs.
+
+    Args:
+
+        filename (``string``):
+
+            The file to read completed blocks from and append them to. It is
+            created if it does not exist.
+    '''
+
+    def __init__(self, filename):
+
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.file = None
+
+    def read(self):
+        '''Read all blocks completed so far.
+
+        Returns:
+
+            `dict` {task_id: ``ndarray``} with the sorted IDs of the completed
+            blocks of each task.
+        '''
+
+        block_ids = collections.defaultdict(list)
+
+        if not os.path.exists(self.filename):
+            return {}
+
+        with open(self.filename, 'r') as f:
+            for line in f:
+                try:
+                    task_id, block_id = line.rstrip('\n').rsplit('\t', 1)
+                    block_ids[task_id].append(int(block_id))
+                except ValueError:
+                    # the last line might be incomplete after a crash
+                    logger.warning(
+                        "Skipping invalid line %r in journal %s",
+                        line, self.filename)
+
+        logger.info(
+            "Read %d completed blocks from journal %s",
+            sum(len(ids) for ids in block_ids.values()),
+            self.filename)
+
+        return {
+            task_id: np.unique(np.array(ids, dtype=np.int64))
+            for task_id, ids in block_ids.items()
+        }
+
+    def add(self, block_id):
+        '''Add a completed block, given as ``(task_id, block_id)``.'''
+
+        line = '%s\t%d\n' % block_id
+
+        with self.lock:
+            if self.file is None:
+                # a previous run might have crashed in the middle of a line
+                if (
+                        os.path.exists(self.filename) and
+                        os.path.getsize(self.filename) > 0):
+                    with open(self.filename, 'rb') as f:
+                        f.seek(-1, os.SEEK_END)
+                        if f.read(1) != b'\n':
+                            line = '\n' + line
+                self.file = open(self.filename, 'a', buffering=1)
+            self.file.write(line)
+
+    def close(self):
+
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
@@ -0,0 +1,116 @@
+from __future__ import absolute_import
+import numpy as np
+
+_MASK64 = (1 << 64) - 1
+_spread_tables = {}
+
+
+def _unit_bits(dims):
+    '''Number of bits per dimension that are spread with one table lookup,
+    such that a spread unit of all dimensions fits into 64 bits.'''
+    return max(1, min(8, 64//dims))
+
+
+def _get_spread_table(dims):
+    '''Lookup table that spreads the bits of a value, such that bit ``i`` is
+    moved to bit ``i*dims``.'''
+
+    if dims not in _spread_tables:
+
+        bits = _unit_bits(dims)
+        table = []
+        for value in range(1 << bits):
+            spread = 0
+            for i in range(bits):
+                if value & (1 << i):
+                    spread |= 1 << (i*dims)
+            table.append(spread)
+
+        _spread_tables[dims] = table
+
+    return _spread_tables[dims]
+
+
+def morton_code(index):
+    '''Interleave the bits of the given index (a sequence of ``int``) into its
+    Morton code (or z-order ID). The lowest bit of the first dimension
+    becomes the lowest bit of the code.
+
+    Negative values are interpreted as 64-bit two's complement.'''
+
+    dims = len(index)
+    bits = _unit_bits(dims)
+    mask = (1 << bits) - 1
+    table = _get_spread_table(dims)
+
+    values = [i & _MASK64 for i in index]
+
+    code = 0
+    shift = 0
+    while any(values):
+        for d in range(dims):
+            code |= table[values[d] & mask] << (shift + d)
+            values[d] >>= bits
+        shift += bits*dims
+
+    return code
+
+
+def morton_encode(indices):
+    '''Vectorized version of :func:`morton_code`.
+
+    Args:
+
+        indices (``ndarray``):
+
+            Integer array of shape ``(n, dims)``.
+
+    Returns:
+
+        The Morton codes as an array of length ``n``, of type ``uint64`` if
+        all codes fit into 64 bits, otherwise of Python ``int`` (``dtype``
+        ``object``).
+    '''
+
+    indices = np.asarray(indices, dtype=np.int64).view(np.uint64)
+    n, dims = indices.shape
+
+    bits = _unit_bits(dims)
+    mask = np.uint64((1 << bits) - 1)
+    table = np.array(_get_spread_table(dims), dtype=np.uint64)
+
+    # spread units per dimension that fit into one 64-bit chunk of the
+    # code, and the number of chunks needed
+    max_bits = int(indices.max()).bit_length() if n > 0 else 0
+    if max_bits*dims <= 64:
+        units = max(1, -(-max_bits//bits))
+    else:
+        units = max(1, 64//(bits*dims))
+    chunk_bits = units*bits
+    num_chunks = max(1, -(-max_bits//chunk_bits))
+
+    chunks = []
+    for c in range(num_chunks):
+
+        code = np.zeros(n, dtype=np.uint64)
+        for u in range(units):
+
+            shift = c*chunk_bits + u*bits
+            if shift >= 64:
+                break
+
+            for d in range(dims):
+                code |= (
+                    table[(indices[:, d] >> np.uint64(shift)) & mask] <<
+                    np.uint64(u*bits*dims + d))
+
+        chunks.append(code)
+
+    if num_chunks == 1:
+        return chunks[0]
+
+    codes = np.zeros(n, dtype=object)
+    for c, chunk in enumerate(chunks):
+        codes += chunk.astype(object) << (c*chunk_bits*dims)
+
+    return codes
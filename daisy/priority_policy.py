@@ -0,0 +1,269 @@
+from __future__ import absolute_import
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class PriorityPolicy():
+    '''Base class for policies that decide in which order the ready blocks of
+    a task are processed by the ``DependencyGraph``.
+
+    A priority is a tuple of numbers, blocks with lower priorities are
+    processed first. Ties are broken by block ID. All priorities returned by
+    a policy should have the same length.
+
+    Subclasses have to implement ``get_priority()``, and can implement
+    ``get_priorities()`` (for speed) and ``prepare()``.
+    '''
+
+    def prepare(self, graph):
+        '''Called by the ``DependencyGraph`` before the first blocks are added
+        to the ready queues. In eager mode, all blocks and their dependencies
+        exist at this point.'''
+        pass
+
+    def get_priority(self, graph, task_id, block, finished_block_id=None):
+        '''Get the priority of a ready block of the given task.
+
+        Args:
+
+            graph (`class:DependencyGraph`):
+
+                The graph the block belongs to.
+
+            task_id (``string``):
+
+                The task of the block.
+
+            block (`class:Block`):
+
+                The block.
+
+            finished_block_id (``tuple``, optional):
+
+                The ID of the block whose completion made this block ready,
+                ``None`` for blocks without dependencies or rescheduled
+                blocks.
+        '''
+        raise NotImplementedError()
+
+    def get_priorities(self, graph, task_id, rows, finished_block_id=None):
+        '''Vectorized version of ``get_priority()`` for blocks given by their
+        rows in the ``BlockTable`` of the task (eager mode only). Returns a
+        tuple of arrays, one per element of the priority tuple.'''
+
+        table = graph.block_tables[task_id]
+        priorities = [
+            self.get_priority(
+                graph,
+                task_id,
+                table.get_block(row),
+                finished_block_id)
+            for row in rows.tolist()
+        ]
+
+        return tuple(np.array(p) for p in zip(*priorities))
+
+
+class ZOrderPriority(PriorityPolicy):
+    '''Process blocks in z-order (the default), such that blocks close in
+    space are processed close in time.'''
+
+    def get_priority(self, graph, task_id, block, finished_block_id=None):
+        return (block.z_order_id,)
+
+    def get_priorities(self, graph, task_id, rows, finished_block_id=None):
+        return (graph.block_tables[task_id].z_order_ids[rows],)
+
+
+class CriticalPathPriority(PriorityPolicy):
+    '''Process blocks with the longest chain of (direct or indirect)
+    dependents first, across all tasks. This unblocks downstream tasks as
+    early as possible. Ties are broken by z-order.
+
+    In lazy mode, the dependents of blocks are not known upfront. The
+    length of the chain is then estimated from the longest chain of
+    downstream tasks and the level of the block in its task.
+    '''
+
+    def prepare(self, graph):
+
+        if graph.lazy:
+            self.task_heights = self.__get_task_heights(graph)
+        else:
+            self.heights = self.__get_block_heights(graph)
+
+    def get_priority(self, graph, task_id, block, finished_block_id=None):
+
+        if graph.lazy:
+            index = graph.block_indices[(task_id, block.block_id)]
+            level = graph.block_grids[task_id].get_level(index)
+            return (-self.task_heights[task_id], level, block.z_order_id)
+
+        row = graph.block_tables[task_id].get_row(block.block_id)
+        return (-int(self.heights[task_id][row]), block.z_order_id)
+
+    def get_priorities(self, graph, task_id, rows, finished_block_id=None):
+
+        return (
+            -self.heights[task_id][rows],
+            graph.block_tables[task_id].z_order_ids[rows])
+
+    def __get_task_heights(self, graph):
+
+        heights = {}
+
+        def get_height(task_id):
+            if task_id not in heights:
+                heights[task_id] = max(
+                    [
+                        get_height(t) + 1
+                        for t in graph.task_dependents[task_id]
+                    ],
+                    default=0)
+            return heights[task_id]
+
+        for task_id in graph.task_map:
+            get_height(task_id)
+
+        return heights
+
+    def __get_block_heights(self, graph):
+        '''Compute the length of the longest chain of dependents of each
+        block, by relaxing the heights of all dependencies at once until they
+        do not change anymore.'''
+
+        # all blocks of all tasks, numbered consecutively
+        offsets = {}
+        num_blocks = 0
+        for task_id, table in graph.block_tables.items():
+            offsets[task_id] = num_blocks
+            num_blocks += len(table)
+
+        # all dependency edges
+        dependencies = []
+        dependents = []
+        for task_id, table in graph.block_tables.items():
+
+            offset = offsets[task_id]
+            rows = np.arange(len(table))
+
+            dependencies.append(offset + table.conflict_indices)
+            dependents.append(
+                offset + np.repeat(rows, np.diff(table.conflict_ptrs)))
+
+            for dependent_task, (ptrs, dependent_rows) in \
+                    graph.inter_task_dependents[task_id].items():
+                dependencies.append(offset + np.repeat(rows, np.diff(ptrs)))
+                dependents.append(offsets[dependent_task] + dependent_rows)
+
+        heights = np.zeros(num_blocks, dtype=np.int64)
+
+        if num_blocks > 0:
+
+            dependencies = np.concatenate(dependencies)
+            dependents = np.concatenate(dependents)
+
+            if len(dependencies) > 0:
+
+                order = np.argsort(dependencies, kind='stable')
+                dependencies = dependencies[order]
+                dependents = dependents[order]
+
+                starts = np.flatnonzero(np.concatenate([
+                    [True],
+                    dependencies[1:] != dependencies[:-1]]))
+                nodes = dependencies[starts]
+
+                iterations = 0
+                while True:
+                    new_heights = np.maximum.reduceat(
+                        heights[dependents] + 1,
+                        starts)
+                    if np.array_equal(new_heights, heights[nodes]):
+                        break
+                    heights[nodes] = new_heights
+                    iterations += 1
+
+                logger.debug(
+                    "computed critical path lengths in %d iterations",
+                    iterations)
+
+        return {
+            task_id: heights[offset:offset + len(graph.block_tables[task_id])]
+            for task_id, offset in offsets.items()
+        }
+
+
+class LocalityPriority(PriorityPolicy):
+    '''Process blocks that were made ready by the most recently finished
+    block first. These blocks are close to a block that was just processed,
+    likely by the same worker that asks for the next block, which improves
+    the reuse of cached data. Other blocks are processed in z-order.'''
+
+    def __init__(self):
+        self.finished_block_id = None
+        self.finished_count = 0
+
+    def get_priority(self, graph, task_id, block, finished_block_id=None):
+        return (self.__get_recency(finished_block_id), block.z_order_id)
+
+    def get_priorities(self, graph, task_id, rows, finished_block_id=None):
+        return (
+            np.full(
+                len(rows),
+                self.__get_recency(finished_block_id),
+                dtype=np.int64),
+            graph.block_tables[task_id].z_order_ids[rows])
+
+    def __get_recency(self, finished_block_id):
+
+        if finished_block_id is None:
+            return 0
+
+        if finished_block_id != self.finished_block_id:
+            self.finished_block_id = finished_block_id
+            self.finished_count += 1
+
+        return -self.finished_count
+
+
+class UserPriority(PriorityPolicy):
+    '''Process blocks according to a user-supplied function, called as::
+
+        priority_function(task_id, block)
+
+    which has to return a number. Blocks with lower numbers are processed
+    first, ties are broken by z-order.'''
+
+    def __init__(self, priority_function):
+        self.priority_function = priority_function
+
+    def get_priority(self, graph, task_id, block, finished_block_id=None):
+        return (self.priority_function(task_id, block), block.z_order_id)
+
+
+def get_priority_policy(priority):
+    '''Get a ``PriorityPolicy`` from either a policy, a function (see
+    ``UserPriority``), or one of the names ``'z_order'``, ``'critical_path'``,
+    or ``'locality'``.'''
+
+    if isinstance(priority, PriorityPolicy):
+        return priority
+
+    if callable(priority):
+        return UserPriority(priority)
+
+    policies = {
+        'z_order': ZOrderPriority,
+        'critical_path': CriticalPathPriority,
+        'locality': LocalityPriority,
+    }
+
+    if priority not in policies:
+        raise RuntimeError(
+            "Unknown priority policy %s, choose one of %s" % (
+                priority, list(policies.keys())))
+
+    return policies[priority]()
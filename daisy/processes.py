@@ -1,11 +1,16 @@
 from multiprocessing import Process
 from subprocess import check_call, CalledProcessError
 import logging
+import multiprocessing
 import os
 import sys
 
 logger = logging.getLogger(__name__)
 
+# modules imported by the forkserver before it forks workers, modules that
+# are not installed are skipped
+FORKSERVER_PRELOAD = ['daisy', 'numpy', 'zarr']
+
 
 def _freopen(filename, mode, fobj):
     """Redirect file descriptors
@@ -81,14 +86,36 @@ def spawn_function(
         log_out,
         log_err,
         log_to_files,
-        log_to_stdout):
+        log_to_stdout,
+        start_method=None,
+        preload_modules=None):
     """Helper function to spawn ``function`` in a separate process with the
     given ``env`` added to the environment. Optionally logs the process' stdout
     and stderr in file ``log_out`` and ``log_err``.
 
+    ``start_method`` is the ``multiprocessing`` start method to use
+    (``'fork'``, ``'spawn'``, or ``'forkserver'``), the default of the
+    platform if not given. With ``'forkserver'``, processes are forked from a
+    server process that imported ``FORKSERVER_PRELOAD`` and
+    ``preload_modules`` once, such that workers start without importing them
+    again and share their memory pages with the server until written to.
+    For ``'spawn'`` and ``'forkserver'``, ``function`` and ``args`` have to
+    be picklable (e.g., module-level functions, not lambdas).
+
     Returns started process so it can be terminated later"""
 
-    proc = Process(
+    if start_method is None:
+        process_class = Process
+    else:
+        context = multiprocessing.get_context(start_method)
+        if start_method == 'forkserver':
+            # only has an effect before the forkserver was started, i.e.,
+            # before the first process is spawned with it
+            context.set_forkserver_preload(
+                FORKSERVER_PRELOAD + list(preload_modules or []))
+        process_class = context.Process
+
+    proc = process_class(
         target=call_wrapper,
         args=(function, args, env, log_out, log_err,
               log_to_files, log_to_stdout)
@@ -0,0 +1,65 @@
+from __future__ import absolute_import
+import heapq
+import numpy as np
+
+
+class ReadyQueue():
+    '''Priority queue of the IDs of ready blocks of a task, lowest priority
+    first (ties are broken by block ID). Priorities are tuples of integers,
+    see ``PriorityPolicy``.
+
+    Many blocks can be added at once with ``push_all()``, e.g., all blocks
+    without dependencies. Those are kept in sorted arrays instead of
+    individual heap entries.
+    '''
+
+    def __init__(self):
+
+        self.heap = []
+        self.bulk_priorities = ()
+        self.bulk_block_ids = np.zeros(0, dtype=np.int64)
+        self.bulk_position = 0
+
+    def __len__(self):
+        return len(self.heap) + len(self.bulk_block_ids) - self.bulk_position
+
+    def push(self, priority, block_id):
+        heapq.heappush(self.heap, (priority, block_id))
+
+    def push_all(self, priorities, block_ids):
+        '''Add arrays of blocks. ``priorities`` is a tuple of arrays, one for
+        each element of the priority tuples.'''
+
+        if len(block_ids) == 0:
+            return
+
+        if self.bulk_position < len(self.bulk_block_ids):
+            priorities = tuple(
+                np.concatenate([p[self.bulk_position:], q])
+                for p, q in zip(self.bulk_priorities, priorities))
+            block_ids = np.concatenate([
+                self.bulk_block_ids[self.bulk_position:],
+                block_ids])
+
+        order = np.lexsort((block_ids,) + tuple(reversed(priorities)))
+        self.bulk_priorities = tuple(p[order] for p in priorities)
+        self.bulk_block_ids = block_ids[order]
+        self.bulk_position = 0
+
+    def pop(self):
+        '''Remove and return the block ID with the lowest priority.'''
+
+        if self.bulk_position < len(self.bulk_block_ids):
+
+            position = self.bulk_position
+            bulk_item = (
+                tuple(
+                    p[position:position + 1].tolist()[0]
+                    for p in self.bulk_priorities),
+                int(self.bulk_block_ids[position]))
+
+            if len(self.heap) == 0 or bulk_item < self.heap[0]:
+                self.bulk_position += 1
+                return bulk_item[1]
+
+        return heapq.heappop(self.heap)[1]
@@ -1,7 +1,6 @@
 from __future__ import absolute_import
 from .coordinate import Coordinate
 from .freezable import Freezable
-import copy
 import numbers
 import numpy as np
 
@@ -73,6 +72,9 @@ class Roi(Freezable):
                 self.__offset.dims(),
                 self.__shape.dims()))
 
+        if None not in self.__shape:
+            return
+
         self.__offset = Coordinate((
             o
             if s is not None else None
@@ -306,7 +308,8 @@ class Roi(Freezable):
 
     def copy(self):
         '''Create a copy of this ROI.'''
-        return copy.deepcopy(self)
+        # offset and shape are immutable, no need for a deep copy
+        return Roi(self.__offset, self.__shape)
 
     def __left_min(self, x, y):
 
@@ -1,20 +1,28 @@
 from __future__ import absolute_import
 
+from .block import BlockTemplate
+from .check_executor import CheckExecutor
 from .client import Client
 from .context import Context
-from .dependency_graph import DependencyGraph
+from .dependency_graph import BlockState, DependencyGraph
+from .instrumentation import Histogram, Instrumentation
+from .journal import CompletionJournal
 from .processes import spawn_function
 from .task import Task
 from .tcp import ReturnCode, SchedulerMessage, SchedulerMessageType, \
     DaisyTCPServer
+from .trace import BlockTrace
+from .worker import ThreadWorker
 from inspect import signature
 from tornado.ioloop import IOLoop
 import asyncio
 import collections
 from datetime import timedelta
+import functools
 import logging
 import os
 import queue
+import socket
 import threading
 import time
 
@@ -24,6 +32,9 @@ logger = logging.getLogger(__name__)
 # long time to shutdown
 _NO_SPAWN_STATUS_THREAD = False
 
+# used for benchmarks to make local workers connect through TCP
+_NO_UNIX_SOCKET = False
+
 
 class Scheduler():
     '''This is the main scheduler that tracks states of tasks and workers.
@@ -41,9 +52,71 @@ class Scheduler():
         return Scheduler().distribute(graph)
 
     See the DependencyGraph class for more information.
+
+    Args:
+
+        journal (`class:CompletionJournal`, optional):
+
+            If given, all blocks that are completed or skipped are added to
+            this journal.
+
+        instrumentation (`class:Instrumentation`, optional):
+
+            Records the time spent in each step of scheduling a block. A new
+            one is created if not given.
+
+        trace (`class:BlockTrace`, optional):
+
+            If given, records when each block was ready, dispatched,
+            processed, and finished, and by which worker.
+
+        max_workers (``int``, optional):
+
+            The maximal number of workers of all tasks together. Workers of
+            tasks with a fixed number of workers count towards it, but are
+            always started. Tasks with a ``max_workers`` of their own (see
+            ``Task.schedule()``) are only scaled up while the total is below
+            this number.
+
+        reuse_workers (``bool``, optional):
+
+            If set, workers of a finished task are not terminated, but kept
+            as spare workers and assigned to tasks that start later, such
+            that the cost of starting a worker is paid once per run instead
+            of once per task. Only applies to tasks with a process function
+            that takes a block, which are all run by the same kind of
+            worker.
+
+        start_method (``string``, optional):
+
+            The ``multiprocessing`` start method of worker processes, see
+            ``processes.spawn_function()``.
+
+        preload_modules (`list` of ``string``, optional):
+
+            Modules to import in the forkserver, in addition to daisy,
+            numpy, and zarr, if ``start_method`` is ``'forkserver'``.
     '''
 
-    def __init__(self):
+    def __init__(
+            self,
+            journal=None,
+            instrumentation=None,
+            trace=None,
+            max_workers=None,
+            reuse_workers=False,
+            start_method=None,
+            preload_modules=None):
+
+        self.journal = journal
+        self.max_workers = max_workers
+        self.reuse_workers = reuse_workers
+        self.start_method = start_method
+        self.preload_modules = preload_modules
+        self.trace = trace
+        self.instrumentation = instrumentation
+        if self.instrumentation is None:
+            self.instrumentation = Instrumentation()
 
         # a copy of tasks from the DependencyGraph
         self.tasks = {}
@@ -56,23 +129,83 @@ class Scheduler():
         self.idle_workers = collections.defaultdict(queue.Queue)
         self.worker_type = {}
         self.dead_workers = set()
-        self.worker_outstanding_blocks = collections.defaultdict(set)
+        # {worker: OrderedDict {block_id: time sent}}, in the order the blocks
+        # were sent
+        self.worker_outstanding_blocks = collections.defaultdict(
+            collections.OrderedDict)
+        # {worker: time}, when a worker last returned a block
+        self.worker_last_return = {}
+        # workers that exceeded the block timeout of their task, and are
+        # being shut down
+        self.timed_out_workers = set()
         self.registered_workers = collections.defaultdict(set)
 
+        # speculative execution of straggling blocks: {block_id: set of
+        # workers} running copies of a block, blocks whose result was taken
+        # from one copy while others are still running, and the durations
+        # of successful blocks per task (all protected by
+        # worker_states_lock)
+        self.block_copies = {}
+        self.superseded_blocks = set()
+        self.block_durations = collections.defaultdict(Histogram)
+        # number of blocks of a task that have to succeed before stragglers
+        # are detected, and how long a block has to run at least to be
+        # considered a straggler, in seconds
+        self.min_straggler_samples = 10
+        self.min_straggler_duration = 1.0
+
         # precomputed recruit functions
         self.worker_recruit_fn = {}
 
         self.launched_tasks = set()
+        # protects finished_tasks, which is set in __distribute()
+        self.finished_tasks_lock = threading.Lock()
+        # number of workers started per task, minus the ones that were
+        # retired or terminated because their task finished
+        self.num_running_workers = collections.defaultdict(int)
+        # workers that were told to terminate because they were not needed
+        # anymore, they should not be respawned
+        self.retired_workers = set()
+        # how often to scale the number of workers of tasks with
+        # max_workers, in seconds
+        self.autoscale_interval = 0.5
+        self.last_autoscale = None
+        # tasks whose workers can be assigned to other tasks (if
+        # reuse_workers is set), and the connected workers of finished
+        # tasks waiting to be assigned (protected by worker_states_lock)
+        self.pool_tasks = set()
+        self.spare_workers = set()
         self.skipped_count = collections.defaultdict(int)
+        # protects counters of returned blocks, which are updated from the
+        # IOLoop thread and the pre_check threads
+        self.results_lock = threading.Lock()
+
+        # evaluate the pre_check of ready blocks ahead of dispatching them,
+        # blocks that need to be processed are put into checked_blocks as
+        # (task_id, block, time checked)
+        self.pre_checkers = {}
+        self.checked_blocks = queue.Queue()
+
+        # evaluate the post_check of returned blocks outside of the IOLoop
+        # thread
+        self.post_checkers = {}
         self.next_worker_id = collections.defaultdict(int)
         self.finished_scheduling = False
 
         # keeping track of spawned processes so we can force terminate
         # them when finishing the block-wise scheduling
         self.started_processes = set()
+        # threads of workers that run in the scheduler process
+        self.started_threads = []
+        # {(task_id, worker_id): process}
+        self.worker_processes = {}
 
         self.status_thread = None
         self.periodic_interval = 10
+
+        # upper bound on how long the scheduler loop sleeps while waiting for
+        # an idle worker or a returned block, in seconds
+        self.max_dispatch_wait = 1.0
         self.completion_rate = collections.defaultdict(int)
 
     def distribute(self, graph):
@@ -80,6 +213,10 @@ class Scheduler():
             return self.__distribute(graph)
         finally:
             # always run clean up
+            if self.journal is not None:
+                self.journal.close()
+            if hasattr(self, 'tcpserver'):
+                self.tcpserver.daisy_close()
             for task in self.tasks:
                 try:
                     self.tasks[task].cleanup()
@@ -98,77 +235,130 @@ class Scheduler():
         self._start_tcp_server()
         self._construct_recruit_functions()
 
-        self.results = []
+        # number of returned blocks per ReturnCode
+        self.results = collections.Counter()
 
         logger.debug("Server running at %s", self.net_identity)
         logger.info("Scheduling %d tasks to completion.", graph.size())
         logger.debug("Max parallelism seems to be %d.", graph.ready_size())
 
+        for task_id, task in self.tasks.items():
+            self.pre_checkers[task_id] = CheckExecutor(
+                task._daisy.pre_check,
+                task._daisy.batch_pre_check,
+                task._daisy.pre_check_workers,
+                task._daisy.pre_check_batch_size,
+                name='pre_check',
+                record_duration=functools.partial(
+                    self.instrumentation.record,
+                    'pre_check',
+                    task_id))
+            self.post_checkers[task_id] = CheckExecutor(
+                task._daisy.post_check,
+                num_workers=task._daisy.post_check_workers,
+                name='post_check',
+                record_duration=functools.partial(
+                    self.instrumentation.record,
+                    'post_check',
+                    task_id))
+
         if not _NO_SPAWN_STATUS_THREAD:
             self._start_status_thread()
-        blocks = {}  # {task_id: block_id}
-        no_worker_delay = 0.001
-        while not graph.empty():
 
-            blocks = graph.next(waiting_blocks=blocks)
+        # blocks that passed the pre_check, waiting for an idle worker
+        blocks = collections.defaultdict(collections.deque)
+        while not graph.empty():
 
-            submitted_blocks = []
-            for task_id in blocks:
-                block = blocks[task_id]
+            # any event after this point (idle worker, returned block,
+            # finished pre_check) will wake up wait_for_update() below
+            update_count = graph.get_update_count()
 
-                # pre-check and skip blocks if possible
+            while True:
                 try:
-                    # pre_check can intermittently fail
-                    # so we wrap it in a try block
-                    pre_check_ret = self.tasks[task_id]._daisy.pre_check(block)
-                except Exception as e:
-                    logger.error(
-                        "pre_check() exception for block %s. Exception: %s",
-                        block, e)
-                    pre_check_ret = False
-
-                if pre_check_ret:
-                    logger.debug(
-                        "Skipping %s block %d; already processed.",
-                        task_id, block.block_id)
-                    ret = ReturnCode.SKIPPED
-                    self.skipped_count[task_id] += 1
-                    self.block_return(None, (task_id, block.block_id), ret)
-                    submitted_blocks.append(task_id)
-
-                else:
-                    worker = self.get_idle_worker(task_id)
-
-                    if worker is not None:
-
-                        with self.worker_states_lock:
-                            if worker not in self.dead_workers:
-                                self.worker_outstanding_blocks[worker].add(
-                                    (task_id, block.block_id))
-                            else:
-                                logger.debug(
-                                    "Worker %s is dead or disconnected. "
-                                    "Getting new worker.", worker)
-                                continue
-
-                        self.send_block(worker, block)
-                        submitted_blocks.append(task_id)
-
-                        logger.debug(
-                            "Pushed block %s of task %s to worker %s.",
-                            block, task_id, worker)
-
-            scheduled_any = (len(submitted_blocks) > 0)
-            if (len(blocks) > 0) and not scheduled_any:
-                time.sleep(no_worker_delay)  # wait for workers to come online
-                no_worker_delay *= 2
-                if (no_worker_delay > 1.0):
-                    no_worker_delay = 1.0
-            else:
-                no_worker_delay = 0.001
-
-            for submitted_task in submitted_blocks:
-                blocks.pop(submitted_task)
+                    task_id, block, checked_time = self.checked_blocks.get(
+                        block=False)
+                except queue.Empty:
+                    break
+                blocks[task_id].append((block, checked_time))
+
+            scheduled_any = False
+            for task_id, task_blocks in blocks.items():
+
+                while len(task_blocks) > 0:
+                    block, checked_time = task_blocks[0]
+                    if not self.dispatch_block(task_id, block):
+                        # no idle worker for this task
+                        break
+                    task_blocks.popleft()
+                    scheduled_any = True
+                    self.__record_since('queue_wait', task_id, checked_time)
+
+            # ask for as many blocks as there are idle workers per task, plus
+            # as many as can be pre-checked ahead of them
+            max_blocks = {}
+            for task_id in self.tasks:
+                pre_checker = self.pre_checkers[task_id]
+                num_blocks = (
+                    self.idle_workers[task_id].qsize() +
+                    pre_checker.get_capacity() -
+                    len(blocks[task_id]) -
+                    pre_checker.get_pending_count())
+                if num_blocks > 0:
+                    max_blocks[task_id] = num_blocks
+
+            start = time.perf_counter()
+            ready_blocks = graph.next(
+                waiting_blocks={},
+                max_blocks=max_blocks,
+                wait=False)
+            self.__record_since('next', None, start)
+
+            for task_id, task in self.tasks.items():
+                # worker threads can not be terminated
+                if (
+                        task._daisy.block_timeout is not None and
+                        not task._daisy.use_threads):
+                    self.__check_timeouts(task_id)
+
+            if (
+                    self.last_autoscale is None or
+                    time.perf_counter() - self.last_autoscale >
+                    self.autoscale_interval):
+                self.__autoscale(blocks)
+                self.last_autoscale = time.perf_counter()
+
+            # give idle workers copies of straggling blocks, if there is
+            # nothing else to do for them
+            for task_id, task in self.tasks.items():
+                if (
+                        task._daisy.straggler_factor is not None and
+                        task_id not in ready_blocks and
+                        len(blocks[task_id]) == 0 and
+                        self.pre_checkers[task_id].get_pending_count() == 0
+                        and self.idle_workers[task_id].qsize() > 0):
+                    if self.__speculate(task_id):
+                        scheduled_any = True
+
+            for task_id, task_blocks in ready_blocks.items():
+                if self.trace is not None:
+                    for block in task_blocks:
+                        self.trace.record(
+                            BlockTrace.READY,
+                            (task_id, block.block_id))
+                self.pre_checkers[task_id].submit(
+                    task_blocks,
+                    functools.partial(self.__pre_check_done, task_id))
+
+            if not scheduled_any and len(ready_blocks) == 0:
+                # wait for workers to become idle (or come online), for
+                # blocks to return, or for pre_checks to finish
+                graph.wait_for_update(
+                    update_count,
+                    timeout=self.max_dispatch_wait)
+
+        for checker in list(self.pre_checkers.values()) + list(
+                self.post_checkers.values()):
+            checker.shutdown()
 
         self.finished_scheduling = True
         self.tcpserver.daisy_close()
@@ -176,28 +366,361 @@ class Scheduler():
         self.ioloop.add_callback(self.ioloop.stop)  # stop Tornado IOLoop
         self._stop_status_thread()
 
-        succeeded = [t for t, r in self.results if r == ReturnCode.SUCCESS]
-        skipped = [t for t, r in self.results if r == ReturnCode.SKIPPED]
-        failed = [
-            t for t, r in self.results
-            if r == ReturnCode.FAILED_POST_CHECK
-        ]
-        errored = [t for t, r in self.results if r == ReturnCode.ERROR]
-        network_errored = [
-            t for t, r in self.results
-            if r == ReturnCode.NETWORK_ERROR
-        ]
+        succeeded = self.results[ReturnCode.SUCCESS]
+        skipped = self.results[ReturnCode.SKIPPED]
+        failed = self.results[ReturnCode.FAILED_POST_CHECK]
+        errored = self.results[ReturnCode.ERROR]
+        network_errored = self.results[ReturnCode.NETWORK_ERROR]
+        restored = graph.get_restored_count()
+        state_counts = graph.get_state_counts()
 
         logger.info(
             "Ran %d tasks of which %d succeeded, %d were skipped, %d were "
+            "completed in an earlier run, %d were "
             "orphaned (failed dependencies), %d tasks failed (%d "
             "failed check, %d application errors, %d network failures "
             "or app crashes)",
-            graph.size(), len(succeeded), len(skipped),
-            len(graph.get_orphans()), len(graph.get_failed_blocks()),
-            len(failed), len(errored), len(network_errored))
+            graph.size(), succeeded, skipped, restored,
+            state_counts[BlockState.ORPHANED],
+            state_counts[BlockState.FAILED],
+            failed, errored, network_errored)
+
+        logger.info(
+            "Time spent per block:\n%s",
+            self.instrumentation.get_summary())
+
+        return graph.size() == (succeeded + skipped + restored)
+
+    def __pre_check_done(self, task_id, block, pre_check_ret):
+        '''Called by the pre-checker of a task with the result of the
+        pre_check of a block. Skips the block if the pre_check succeeded,
+        otherwise queues it for dispatching.'''
+
+        if pre_check_ret:
+            logger.debug(
+                "Skipping %s block %d; already processed.",
+                task_id, block.block_id)
+            with self.results_lock:
+                self.skipped_count[task_id] += 1
+            if self.trace is not None:
+                self.trace.record(
+                    BlockTrace.SKIPPED,
+                    (task_id, block.block_id))
+            self.block_return(
+                None,
+                (task_id, block.block_id),
+                ReturnCode.SKIPPED)
+        else:
+            self.checked_blocks.put((task_id, block, time.perf_counter()))
+
+        # wake up the scheduler loop
+        self.graph.notify_update()
+
+    def dispatch_block(self, task_id, block, running_on=None):
+        '''Send the given block to an idle worker of the task. Returns
+        ``False`` if the block could not be dispatched because there is no
+        idle worker.
+
+        If ``running_on`` is given, the block is a speculative copy of a
+        block that is still being processed by this worker. The copy is
+        only sent to a worker without outstanding blocks.'''
+
+        block_id = (task_id, block.block_id)
+
+        while True:
+
+            worker = self.get_idle_worker(task_id)
+
+            if worker is None:
+                return False
+
+            with self.worker_states_lock:
+
+                if (
+                        worker in self.dead_workers or
+                        worker in self.retired_workers):
+                    logger.debug(
+                        "Worker %s is dead, disconnected, or retired. "
+                        "Getting new worker.", worker)
+                    continue
+
+                if running_on is not None:
+                    if (
+                            worker is running_on or
+                            len(self.worker_outstanding_blocks[worker]) > 0
+                            or block_id not in
+                            self.worker_outstanding_blocks[running_on]):
+                        # the worker is busy, or the block returned in the
+                        # meantime
+                        self.idle_workers[task_id].put(worker)
+                        return False
+                    self.block_copies[block_id] = set([running_on, worker])
+
+                self.worker_outstanding_blocks[worker][block_id] = \
+                    time.perf_counter()
+                break
+
+        self.send_block(worker, block, task_id)
+
+        if self.trace is not None:
+            self.trace.record(
+                BlockTrace.DISPATCHED,
+                (task_id, block.block_id),
+                worker.worker_id)
+
+        logger.debug(
+            "Pushed block %s of task %s to worker %s.",
+            block, task_id, worker)
+
+        return True
+
+    def __speculate(self, task_id):
+        '''Dispatch copies of blocks of the given task that have been running
+        for much longer than usual (more than ``straggler_factor`` times the
+        median duration) to idle workers. Whichever copy returns first
+        successfully is used. Returns ``True`` if any copy was sent.'''
+
+        now = time.perf_counter()
+        stragglers = []
+
+        with self.worker_states_lock:
+
+            durations = self.block_durations[task_id]
+            if durations.count < self.min_straggler_samples:
+                return False
+            median = durations.percentile(50)
+            threshold = max(
+                self.tasks[task_id]._daisy.straggler_factor*median,
+                self.min_straggler_duration)
+
+            for worker in self.registered_workers[task_id]:
+                block_id, start = self.__get_running_block(worker)
+                if (
+                        block_id is not None and
+                        now - start > threshold and
+                        block_id not in self.block_copies):
+                    stragglers.append((start, block_id, worker))
+
+        sent_any = False
+        for start, block_id, worker in sorted(
+                stragglers,
+                key=lambda s: s[0]):
+
+            if self.idle_workers[task_id].qsize() == 0:
+                break
+
+            if self.dispatch_block(
+                    task_id,
+                    self.graph.get_block(block_id),
+                    running_on=worker):
+                logger.info(
+                    "Block %s has been running on worker %s for %.2fs "
+                    "(median %.2fs), dispatched a speculative copy",
+                    block_id, worker, now - start, median)
+                sent_any = True
+
+        return sent_any
+
+    def __check_timeouts(self, task_id):
+        '''Shut down workers of the given task that have been processing a
+        block for longer than the ``block_timeout`` of the task. Their
+        blocks are rescheduled and the workers respawned once their
+        connection closes, see ``remove_worker_callback``.'''
+
+        timeout = self.tasks[task_id]._daisy.block_timeout
+        now = time.perf_counter()
+        timed_out = []
+
+        with self.worker_states_lock:
+            for worker in self.registered_workers[task_id]:
+                if worker in self.timed_out_workers:
+                    continue
+                block_id, start = self.__get_running_block(worker)
+                if block_id is not None and now - start > timeout:
+                    self.timed_out_workers.add(worker)
+                    timed_out.append((worker, block_id, now - start))
+
+        for worker, block_id, duration in timed_out:
+
+            logger.error(
+                "Worker %s has been processing block %s for %.1fs, longer "
+                "than the block timeout of %.1fs. Terminating the worker.",
+                worker, block_id, duration, timeout)
+
+            proc = self.worker_processes.get((task_id, worker.worker_id))
+            if proc is not None:
+                proc.terminate()
+
+            # closing the connection triggers remove_worker_callback(), also
+            # for workers that were not started by this scheduler
+            self.ioloop.add_callback(worker.stream.close)
+
+    def __autoscale(self, blocks):
+        '''Recruit or retire workers of tasks with ``max_workers``, such
+        that each has about as many workers as it has ready and processing
+        blocks, within its ``min_workers`` and ``max_workers`` and the
+        scheduler's ``max_workers``.'''
+
+        shortfalls = {}
+
+        for task_id, task in self.tasks.items():
+
+            if (
+                    task._daisy.max_workers is None or
+                    task_id in self.finished_tasks):
+                continue
+
+            state_counts = self.graph.get_task_state_counts(task_id)
+            demand = (
+                self.graph.ready_size(task_id) +
+                state_counts[BlockState.PROCESSING])
+            target = min(
+                max(demand, task._daisy.min_workers),
+                task._daisy.max_workers)
+
+            running = self.num_running_workers[task_id]
+            if running > target and len(blocks[task_id]) == 0:
+                self.__retire_workers(task_id, running - target)
+            elif running < target:
+                shortfalls[task_id] = target - running
+
+        if len(shortfalls) == 0:
+            return
+
+        available = None
+        if self.max_workers is not None:
+            available = self.max_workers - sum(
+                self.num_running_workers.values())
 
-        return graph.size() == (len(succeeded) + len(skipped))
+        # tasks that need the most workers first
+        for task_id, shortfall in sorted(
+                shortfalls.items(),
+                key=lambda s: -s[1]):
+
+            if available is not None:
+                shortfall = min(shortfall, available)
+                available -= shortfall
+            if shortfall <= 0:
+                break
+
+            logger.info(
+                "Recruiting %d more workers for task %s",
+                shortfall, task_id)
+            self.__recruit_workers(task_id, shortfall)
+
+    def __recruit_workers(self, task_id, num_workers):
+
+        num_assigned = 0
+        if task_id in self.pool_tasks:
+            num_assigned = self.__assign_spare_workers(task_id, num_workers)
+
+        for i in range(num_workers - num_assigned):
+
+            context = self._make_context(
+                task_id,
+                self.next_worker_id[task_id])
+            self.worker_recruit_fn[task_id](context)
+
+            self.next_worker_id[task_id] += 1
+
+        self.num_running_workers[task_id] += num_workers
+        self.launched_tasks.add(task_id)
+
+    def __assign_spare_workers(self, task_id, num_workers):
+        '''Assign up to ``num_workers`` spare workers to the given task.
+        Returns the number of assigned workers.'''
+
+        assigned = []
+
+        with self.worker_states_lock:
+
+            while len(assigned) < num_workers and self.spare_workers:
+
+                worker = self.spare_workers.pop()
+                previous_task_id = self.worker_type[worker]
+
+                # worker IDs are unique per task
+                proc = self.worker_processes.pop(
+                    (previous_task_id, worker.worker_id),
+                    None)
+                worker.worker_id = self.next_worker_id[task_id]
+                self.next_worker_id[task_id] += 1
+                if proc is not None:
+                    self.worker_processes[(task_id, worker.worker_id)] = proc
+
+                self.registered_workers[previous_task_id].discard(worker)
+                self.registered_workers[task_id].add(worker)
+                self.worker_type[worker] = task_id
+
+                assigned.append((worker, previous_task_id))
+
+        daisy_params = self.tasks[task_id]._daisy
+        for worker, previous_task_id in assigned:
+            logger.info(
+                "Assigning spare worker %s of task %s to task %s",
+                worker, previous_task_id, task_id)
+            self.tcpserver.send(
+                worker,
+                SchedulerMessage(
+                    SchedulerMessageType.ASSIGN_TASK,
+                    data=(
+                        task_id,
+                        worker.worker_id,
+                        daisy_params.num_workers,
+                        daisy_params.prefetch_depth)))
+            self.__send_block_template(worker, task_id)
+
+        return len(assigned)
+
+    def __retire_workers(self, task_id, num_workers):
+        '''Terminate up to ``num_workers`` idle workers of the given task.'''
+
+        idle_workers = self.idle_workers[task_id]
+        retired = 0
+
+        # look at each entry of the idle queue at most once, workers that
+        # are busy (but asked for more blocks) are put back
+        for i in range(idle_workers.qsize()):
+
+            if retired == num_workers:
+                break
+
+            try:
+                worker = idle_workers.get(block=False)
+            except queue.Empty:
+                break
+
+            with self.worker_states_lock:
+                if (
+                        worker in self.dead_workers or
+                        worker in self.retired_workers):
+                    continue
+                if len(self.worker_outstanding_blocks[worker]) > 0:
+                    idle_workers.put(worker)
+                    continue
+                self.retired_workers.add(worker)
+
+            logger.info("Retiring idle worker %s of task %s", worker, task_id)
+            self.send_terminate(worker)
+            retired += 1
+
+        self.num_running_workers[task_id] -= retired
+
+    def __get_running_block(self, worker):
+        '''Get the ID of the block the given worker is processing and since
+        when, as ``(block_id, time)``, or ``(None, None)``. Has to be called
+        with ``worker_states_lock`` held.'''
+
+        outstanding = self.worker_outstanding_blocks[worker]
+        if len(outstanding) == 0:
+            return None, None
+
+        # only the oldest outstanding block is being processed, the others
+        # were prefetched and wait for it to return
+        block_id, sent_time = next(iter(outstanding.items()))
+        start = max(sent_time, self.worker_last_return.get(worker, sent_time))
+
+        return block_id, start
 
     def _start_tcp_server(self, ioloop=None):
         '''Start TCP server to handle remote worker requests.
@@ -232,6 +755,11 @@ class Scheduler():
                 pass
         self.net_identity = self.tcpserver.get_identity()
 
+        # workers on this host connect through a Unix domain socket instead
+        self.unix_socket_path = None
+        if hasattr(socket, 'AF_UNIX') and not _NO_UNIX_SOCKET:
+            self.unix_socket_path = self.tcpserver.listen_unix()
+
     def _start_status_thread(self):
         self.status_thread = threading.Thread(target=self.status_loop)
         self.status_thread.start()
@@ -261,11 +789,12 @@ class Scheduler():
 
             for task_id in self.tasks:
 
+                state_counts = self.graph.get_task_state_counts(task_id)
+                done_count = state_counts[BlockState.DONE]
+                restored_count = self.graph.get_task_restored_count(task_id)
                 pending_count = (
-                    self.graph.get_task_size(task_id) -
-                    self.graph.get_task_done_count(task_id) -
-                    self.graph.get_task_failed_count(task_id) -
-                    len(self.graph.get_task_processing_blocks(task_id)))
+                    state_counts[BlockState.PENDING] +
+                    state_counts[BlockState.READY])
 
                 # calculate ETA
                 blocks_per_sec = 0
@@ -281,21 +810,23 @@ class Scheduler():
                 logger.info(
                     "\n\t%s processing %d blocks "
                     "with %d workers (%d online)"
-                    "\n\t\t%d finished (%d skipped, %d succeeded, %d failed), "
-                    "%d processing, %d pending"
+                    "\n\t\t%d finished (%d skipped, %d in an earlier run, "
+                    "%d succeeded, %d failed, %d orphaned), %d processing, "
+                    "%d pending"
                     "\n\t\tETA: %s",
                     task_id, self.graph.get_task_size(task_id),
 
-                    self.tasks[task_id]._daisy.num_workers,
+                    self.num_running_workers[task_id],
                     len(self.registered_workers[task_id]),
 
-                    self.graph.get_task_done_count(task_id),
+                    done_count,
                     self.skipped_count[task_id],
-                    (self.graph.get_task_done_count(task_id) -
-                        self.skipped_count[task_id]),
-                    self.graph.get_task_failed_count(task_id),
+                    restored_count,
+                    done_count - self.skipped_count[task_id] - restored_count,
+                    state_counts[BlockState.FAILED],
+                    state_counts[BlockState.ORPHANED],
 
-                    len(self.graph.get_task_processing_blocks(task_id)),
+                    state_counts[BlockState.PROCESSING],
                     pending_count,
 
                     eta)
@@ -328,32 +859,49 @@ class Scheduler():
             # in distribute(). It can lead to dead locks or forgotten
             # blocks if not thought about carefully
             self.dead_workers.add(worker)
+            self.timed_out_workers.discard(worker)
+            self.spare_workers.discard(worker)
             self.workers.remove(worker)
             if self.worker_type[worker] is not None:
                 self.registered_workers[task_id].remove(worker)
             self.worker_type[worker] = None
 
+        if worker in self.retired_workers:
+            logger.debug("Retired worker %s exited", worker)
+            return
+
         if ((not self.finished_scheduling) and
                 (task_id not in self.finished_tasks)):
             # task is unfinished--keep respawning to finish task
 
-            num_workers = self.tasks[task_id]._daisy.num_workers
-
             logger.info("Respawning worker %s due to disconnection", worker)
-            context = Context(
-                self.net_identity[0],
-                self.net_identity[1],
-                task_id,
-                worker.worker_id,
-                num_workers)
+            context = self._make_context(task_id, worker.worker_id)
             self.worker_recruit_fn[task_id](context)
 
             # reschedule block if necessary
             with self.worker_states_lock:
-                outstanding_blocks = (self.worker_outstanding_blocks[worker]
-                                      .copy())
-            for block_id in outstanding_blocks:
-                self.block_return(worker, block_id, ReturnCode.NETWORK_ERROR)
+                outstanding_blocks = list(
+                    self.worker_outstanding_blocks[worker])
+            for i, block_id in enumerate(outstanding_blocks):
+                # only the oldest outstanding block was being processed, the
+                # others were prefetched and should not count as a retry
+                self.block_return(
+                    worker,
+                    block_id,
+                    ReturnCode.NETWORK_ERROR,
+                    count_retry=(i == 0))
+
+    def _make_context(self, task_id, worker_id):
+        '''Create the context for a new worker of the given task.'''
+        daisy_params = self.tasks[task_id]._daisy
+        return Context(
+            self.net_identity[0],
+            self.net_identity[1],
+            task_id,
+            worker_id,
+            daisy_params.num_workers,
+            daisy_params.prefetch_depth,
+            self.unix_socket_path)
 
     def _recruit_worker(
             self,
@@ -378,9 +926,12 @@ class Scheduler():
             function, args, env,
             log_dir+"/worker.{}.out".format(context.worker_id),
             log_dir+"/worker.{}.err".format(context.worker_id),
-            log_to_files, log_to_stdout)
+            log_to_files, log_to_stdout,
+            start_method=self.start_method,
+            preload_modules=self.preload_modules)
 
         self.started_processes.add(proc)
+        self.worker_processes[(context.task_id, context.worker_id)] = proc
 
     def _make_spawn_function(
             self,
@@ -395,9 +946,69 @@ class Scheduler():
             function, args, context, log_dir,
             log_to_files, log_to_stdout)
 
+    def _start_thread_worker(self, function, context):
+        '''Start a worker thread for the task of the given context, that
+        applies ``function`` to each of its blocks.'''
+
+        worker = ThreadWorker(context.worker_id)
+        thread = threading.Thread(
+            target=self._thread_worker,
+            args=(worker, context.task_id, function),
+            daemon=True)
+        thread.start()
+
+        self.started_threads.append(thread)
+
+    def _thread_worker(self, worker, task_id, function):
+        '''The loop of a worker thread. Mirrors ``Client``, but gets blocks
+        from the worker's queue and returns them by calling
+        ``block_return()`` directly.'''
+
+        while True:
+
+            # same as receiving WORKER_GET_BLOCK from a client
+            self.add_idle_worker_callback(worker, task_id)
+
+            block = worker.blocks.get()
+            if block is None:
+                break
+
+            start = time.perf_counter()
+            try:
+                ret = function(block)
+            except Exception:
+                logger.exception(
+                    "Worker %s of task %s failed to process block %d",
+                    worker, task_id, block.block_id)
+                ret = 1
+            compute_time = time.perf_counter() - start
+
+            if ret == 0:
+                ret = ReturnCode.SUCCESS
+            elif ret == 1:
+                ret = ReturnCode.ERROR
+            else:
+                logger.warning(
+                    "Daisy user function should return either 0 or 1--given "
+                    "%s", ret)
+                ret = ReturnCode.SUCCESS
+
+            self.block_return(
+                worker,
+                (task_id, block.block_id),
+                ret,
+                compute_time=compute_time)
+
+        self.remove_worker_callback(worker)
+
     def _construct_recruit_functions(self):
         '''Construct all worker recruit functions to be used later when
         needed'''
+
+        # if workers are reused, all tasks with a process function that
+        # takes a block share the same worker, which can run any of them
+        pool_functions = {}
+
         for task_id in self.tasks:
             log_dir = '.daisy_logs_' + task_id
             os.makedirs(log_dir, exist_ok=True)
@@ -414,7 +1025,18 @@ class Scheduler():
             except Exception:
                 spawn_workers = False
 
-            if spawn_workers:
+            if self.tasks[task_id]._daisy.use_threads:
+
+                if spawn_workers:
+                    raise RuntimeError(
+                        "Task %s uses threads, its process function has to "
+                        "take a block as argument" % task_id)
+
+                new_worker_fn = functools.partial(
+                    self._start_thread_worker,
+                    _get_block_function(process_function))
+
+            elif spawn_workers:
                 if log_to_files and log_to_stdout:
                     logger.warning(
                         "It is not possible to log to both files and stdout "
@@ -429,6 +1051,17 @@ class Scheduler():
                         log_to_files,
                         log_to_stdout)
 
+            elif self.reuse_workers:
+
+                self.pool_tasks.add(task_id)
+                pool_functions[task_id] = process_function
+                new_worker_fn = self._make_spawn_function(
+                        _pool_worker_wrapper,
+                        [pool_functions],
+                        log_dir,
+                        log_to_files,
+                        log_to_stdout)
+
             else:
 
                 new_worker_fn = self._make_spawn_function(
@@ -450,21 +1083,12 @@ class Scheduler():
         if task_id not in self.launched_tasks:
 
             logger.info("Launching workers for task %s", task_id)
-            num_workers = self.tasks[task_id]._daisy.num_workers
-
-            for i in range(num_workers):
-
-                context = Context(
-                    self.net_identity[0],
-                    self.net_identity[1],
-                    task_id,
-                    self.next_worker_id[task_id],
-                    num_workers)
-                self.worker_recruit_fn[task_id](context)
-
-                self.next_worker_id[task_id] += 1
-
-            self.launched_tasks.add(task_id)
+            daisy_params = self.tasks[task_id]._daisy
+            if daisy_params.max_workers is None:
+                self.__recruit_workers(task_id, daisy_params.num_workers)
+            else:
+                # more workers are recruited by __autoscale()
+                self.__recruit_workers(task_id, daisy_params.min_workers)
 
         try:
             return self.idle_workers[task_id].get(block=False)
@@ -481,6 +1105,9 @@ class Scheduler():
 
         self.idle_workers[task].put(worker)
 
+        # wake up the scheduler loop if it is waiting for workers
+        self.graph.notify_update()
+
     def close_all_workers(self):
         '''Send termination message to all available worker. This is called
         when the scheduler loop exits'''
@@ -491,6 +1118,22 @@ class Scheduler():
         for task in self.tasks:
             self.tasks[task].cleanup()
 
+        # don't wait for workers that are still processing blocks that were
+        # completed by a speculative copy
+        with self.worker_states_lock:
+            for worker, outstanding in \
+                    self.worker_outstanding_blocks.items():
+                for block_id in outstanding:
+                    if block_id in self.superseded_blocks:
+                        proc = self.worker_processes.get(
+                            (block_id[0], worker.worker_id))
+                        if proc is not None:
+                            logger.info(
+                                "Terminating worker %s, still processing "
+                                "superseded block %s", worker, block_id)
+                            proc.terminate()
+                        break
+
         # 10 minutes from now
         timeout = time.time() + 60*10
 
@@ -503,37 +1146,95 @@ class Scheduler():
         for proc in self.started_processes:
             proc.terminate()
 
+        # threads can not be terminated, hanging ones are left behind (they
+        # do not keep the interpreter alive)
+        for thread in self.started_threads:
+            thread.join(timeout=max(1, timeout - time.time()))
+
     def finish_task(self, task_id):
         '''Called when a task is completely finished. Currently this function
-        closes all workers of this task.'''
+        closes all workers of this task, or keeps them as spare workers for
+        other tasks if workers are reused.
+
+        The last blocks of a task can be finished concurrently by several
+        threads (check executors, the IOLoop, worker threads), which might
+        all see the task as done. Only the first call finishes the task.'''
+
+        with self.finished_tasks_lock:
+            if task_id in self.finished_tasks:
+                return
+            self.finished_tasks.add(task_id)
+
+        # keep workers only if there is a task left to assign them to
+        keep_workers = (
+            task_id in self.pool_tasks and
+            any(t not in self.finished_tasks for t in self.pool_tasks))
+
         with self.worker_states_lock:
             for worker in self.workers:
-                if self.worker_type[worker] == task_id:
+                if self.worker_type[worker] != task_id:
+                    continue
+                if (
+                        keep_workers and
+                        len(self.worker_outstanding_blocks[worker]) == 0 and
+                        worker not in self.retired_workers and
+                        worker not in self.timed_out_workers):
+                    self.spare_workers.add(worker)
+                else:
                     self.send_terminate(worker)
-        self.finished_tasks.add(task_id)
+
+        self.num_running_workers[task_id] = 0
         self.tasks[task_id].cleanup()
 
     def send_terminate(self, worker):
         '''Send TERMINATE_WORKER command to worker'''
+        if isinstance(worker, ThreadWorker):
+            worker.blocks.put(None)
+            return
         self.tcpserver.send(
             worker,
             SchedulerMessage(SchedulerMessageType.TERMINATE_WORKER))
 
-    def send_block(self, worker, block):
-        '''Send NEW_BLOCK command to worker'''
+    def send_block(self, worker, block, task_id=None):
+        '''Send NEW_BLOCK command to worker. If ``task_id`` is given, the
+        time it took to send the block is recorded for this task.'''
+
+        callback = None
+        if task_id is not None:
+            callback = functools.partial(
+                self.__record_since,
+                'send',
+                task_id,
+                time.perf_counter())
+
+        if isinstance(worker, ThreadWorker):
+            worker.blocks.put(block)
+            if callback is not None:
+                callback()
+            return
+
         self.tcpserver.send(
             worker,
-            SchedulerMessage(SchedulerMessageType.NEW_BLOCK, data=block))
+            SchedulerMessage(SchedulerMessageType.NEW_BLOCK, data=block),
+            callback=callback)
+
+    def __record_since(self, metric, task_id, start):
+        self.instrumentation.record(
+            metric,
+            task_id,
+            time.perf_counter() - start)
 
     def register_worker(self, worker, task_id):
         '''Register new worker with bookkeeping variables. If scheduler loop
         had finished it will not, instead terminating this new worker.'''
         logger.debug("Registering new worker %s", worker)
-        if self.finished_scheduling:
-            self.send_terminate(worker)
-            return
 
         with self.worker_states_lock:
+            # checked under the lock, otherwise the worker could be added
+            # after close_all_workers() terminated all known workers
+            if self.finished_scheduling:
+                self.send_terminate(worker)
+                return
             self.workers.add(worker)
             self.worker_type[worker] = task_id
             self.registered_workers[task_id].add(worker)
@@ -541,56 +1242,186 @@ class Scheduler():
                 # handle aliasing of previous workers
                 self.dead_workers.remove(worker)
 
-    def block_return(self, worker, block_id, ret):
-        '''Called when a block is returned, whether successfully or not'''
-        block = self.graph.get_block(block_id)
-        task_id = block_id[0]
+        if not isinstance(worker, ThreadWorker):
+            self.__send_block_template(worker, task_id)
 
-        # run post_check for finishing blocks
-        if ret == ReturnCode.SUCCESS:
-            try:
-                post_check_success = (
-                    self.tasks[task_id]._daisy.post_check(block))
-            except Exception as e:
-                logger.error(
-                    "Encountered exception while running post_check for "
-                    "block %s. Exception: %s",
-                    block, e)
-                post_check_success = False
-
-            self.completion_rate[task_id] += 1
-
-            if not post_check_success:
-                logger.error(
-                    "Completion check failed for task for block %s.", block)
-                ret = ReturnCode.FAILED_POST_CHECK
+    def __send_block_template(self, worker, task_id):
+
+        # from now on, blocks are sent to the worker relative to the block
+        # template of its task
+        task = self.tasks[task_id]
+        template = BlockTemplate(task._daisy.read_roi, task._daisy.write_roi)
+        self.tcpserver.send(
+            worker,
+            SchedulerMessage(
+                SchedulerMessageType.BLOCK_TEMPLATE,
+                data=template))
+        worker.block_template = template
+
+    def block_return(
+            self,
+            worker,
+            block_id,
+            ret,
+            count_retry=True,
+            compute_time=None):
+        '''Called when a block is returned, whether successfully or not. If
+        ``count_retry`` is ``False``, a failed block is rescheduled without
+        counting against its number of retries. ``compute_time`` is the time
+        the worker spent processing the block, if known.
+
+        The post_check of successful blocks is evaluated by the post-checker
+        of the task, the block is finished or rescheduled once the check
+        resolved.'''
+
+        task_id = block_id[0]
+        superseded = False
 
         if worker is not None:
             with self.worker_states_lock:
-                self.worker_outstanding_blocks[worker].remove(block_id)
+                now = time.perf_counter()
+                sent_time = self.worker_outstanding_blocks[worker].pop(
+                    block_id)
+                # a prefetched block was started when the previous one
+                # returned, same as in __get_running_block()
+                start = max(
+                    sent_time,
+                    self.worker_last_return.get(worker, sent_time))
+                self.worker_last_return[worker] = now
+                if block_id in self.block_copies:
+                    superseded = self.__return_copy(worker, block_id, ret)
+                if ret == ReturnCode.SUCCESS and not superseded:
+                    self.block_durations[task_id].add(now - start)
+            if self.trace is not None:
+                self.__trace_return(worker, block_id, compute_time)
+            if compute_time is not None:
+                self.instrumentation.record('compute', task_id, compute_time)
+                self.instrumentation.record(
+                    'dispatch',
+                    task_id,
+                    max(
+                        0.0,
+                        time.perf_counter() - sent_time - compute_time))
+
+        if superseded:
+            logger.debug(
+                "Ignoring return of block %s by worker %s, another copy "
+                "decides its outcome", block_id, worker)
+            return
+
+        if ret == ReturnCode.SUCCESS:
+            self.post_checkers[task_id].submit(
+                [self.graph.get_block(block_id)],
+                functools.partial(
+                    self.__post_check_done,
+                    block_id,
+                    count_retry))
+            return
+
+        self.__update_block(block_id, ret, count_retry)
+
+    def __return_copy(self, worker, block_id, ret):
+        '''Called with ``worker_states_lock`` held for returned blocks that
+        have speculative copies. Returns ``True`` if the return should be
+        ignored, because another copy already succeeded or is still
+        running after this one failed.'''
+
+        copies = self.block_copies[block_id]
+        if worker not in copies:
+            # a new attempt after the copies were rescheduled
+            return False
+        copies.remove(worker)
+
+        if block_id in self.superseded_blocks:
+            if len(copies) == 0:
+                del self.block_copies[block_id]
+                self.superseded_blocks.remove(block_id)
+            return True
+
+        if len(copies) == 0:
+            del self.block_copies[block_id]
+            return False
+
+        if ret == ReturnCode.SUCCESS:
+            self.superseded_blocks.add(block_id)
+            return False
+
+        # wait for the other copies
+        return True
+
+    def __trace_return(self, worker, block_id, compute_time):
+
+        now = time.perf_counter()
+        if compute_time is not None:
+            self.trace.record(
+                BlockTrace.ACQUIRED,
+                block_id,
+                worker.worker_id,
+                now - compute_time)
+        self.trace.record(
+            BlockTrace.RETURNED,
+            block_id,
+            worker.worker_id,
+            now)
+
+    def __post_check_done(
+            self,
+            block_id,
+            count_retry,
+            block,
+            post_check_success):
+        '''Called by the post-checker of a task with the result of the
+        post_check of a returned block.'''
+
+        with self.results_lock:
+            self.completion_rate[block_id[0]] += 1
+
+        ret = ReturnCode.SUCCESS
+        if not post_check_success:
+            logger.error(
+                "Completion check failed for task for block %s.", block)
+            ret = ReturnCode.FAILED_POST_CHECK
+
+        self.__update_block(block_id, ret, count_retry)
+
+    def __update_block(self, block_id, ret, count_retry):
+        '''Finish or reschedule a block in the dependency graph, according
+        to its return code.'''
+
+        start = time.perf_counter()
+        block = self.graph.get_block(block_id)
+        task_id = block_id[0]
 
         if ret in [ReturnCode.ERROR, ReturnCode.NETWORK_ERROR,
                    ReturnCode.FAILED_POST_CHECK]:
             logger.error("Task failed for block %s.", block)
-            self.graph.cancel_and_reschedule(block_id)
+            if self.trace is not None:
+                self.trace.record(BlockTrace.FAILED, block_id)
+            self.graph.cancel_and_reschedule(block_id, count_retry)
 
         elif ret in [ReturnCode.SUCCESS, ReturnCode.SKIPPED]:
+            if self.journal is not None:
+                self.journal.add(block_id)
+            if self.trace is not None and ret == ReturnCode.SUCCESS:
+                self.trace.record(BlockTrace.DONE, block_id)
             self.graph.remove_and_update(block_id)
 
         else:
             raise Exception('Unknown ReturnCode {}'.format(ret))
 
+        self.__record_since('update', task_id, start)
+
         if self.graph.is_task_done(task_id):
             # in other words if this is the last block for this task
             self.finish_task(task_id)
 
-        self.results.append((block, ret))
+        with self.results_lock:
+            self.results[ret] += 1
 
 
-def _local_worker_wrapper(received_fn, port, task_id):
-    '''Simple wrapper for local process function'''
-
-    client = Client()
+def _get_block_function(received_fn):
+    '''Get a function that takes a block from a process function, which is
+    either such a function or a tuple ``(function, args)``.'''
 
     try:
         user_fn, args = received_fn
@@ -600,6 +1431,16 @@ def _local_worker_wrapper(received_fn, port, task_id):
 
     except Exception:
         fn = received_fn
+
+    return fn
+
+
+def _local_worker_wrapper(received_fn, port, task_id):
+    '''Simple wrapper for local process function'''
+
+    client = Client()
+
+    fn = _get_block_function(received_fn)
     while True:
         block = client.acquire_block()
         if block is None:
@@ -608,6 +1449,25 @@ def _local_worker_wrapper(received_fn, port, task_id):
         client.release_block(block, ret)
 
 
+def _pool_worker_wrapper(process_functions):
+    '''Wrapper for workers that can be assigned to other tasks, runs the
+    process function of the task the client is currently assigned to.'''
+
+    client = Client()
+
+    functions = {}
+    while True:
+        block = client.acquire_block()
+        if block is None:
+            break
+        task_id = client.context.task_id
+        if task_id not in functions:
+            functions[task_id] = _get_block_function(
+                process_functions[task_id])
+        ret = functions[task_id](block)
+        client.release_block(block, ret)
+
+
 def run_blockwise(
         total_roi,
         read_roi,
@@ -618,7 +1478,24 @@ def run_blockwise(
         fit='valid',
         num_workers=1,
         processes=None,
-        max_retries=2):
+        max_retries=2,
+        prefetch_depth=1,
+        lazy=False,
+        priority='z_order',
+        pre_check_workers=1,
+        batch_pre_check=None,
+        pre_check_batch_size=1000,
+        post_check_workers=1,
+        straggler_factor=None,
+        block_timeout=None,
+        min_workers=0,
+        max_workers=None,
+        use_threads=False,
+        journal=None,
+        instrumentation=None,
+        trace=None,
+        start_method=None,
+        preload_modules=None):
     '''Convenient function to run a single block-wise task.
 
     Args:
@@ -667,6 +1544,9 @@ def run_blockwise(
             to check if the block needs to be run, and if so, the second after
             it was run to check if the run succeeded.
 
+            The first check (``pre_check``) runs for ready blocks ahead of
+            the blocks sent to workers, see ``pre_check_workers``.
+
         read_write_conflict (``bool``, optional):
 
             Whether the read and write ROIs are conflicting, i.e., accessing
@@ -726,6 +1606,111 @@ def run_blockwise(
             (either due to failed post_check or application crashes or network
             failure)
 
+        prefetch_depth (int, optional):
+
+            The number of blocks a worker requests ahead of time, such that
+            the next block is already available when the current one is done.
+            Blocks that were prefetched by a worker that dies are rescheduled
+            without counting as a retry.
+
+        lazy (bool, optional):
+
+            If set, blocks and their dependencies are created on demand,
+            instead of before scheduling starts. This saves time and memory
+            for volumes with many blocks, see ``DependencyGraph``.
+
+        priority (``string`` or function, optional):
+
+            The order in which ready blocks are processed, see
+            ``DependencyGraph``.
+
+        pre_check_workers (int, optional):
+
+            The number of threads that evaluate the ``pre_check`` (see
+            ``check_function``) of ready blocks, ahead of the blocks sent to
+            workers. If 0, the ``pre_check`` is evaluated right before a
+            block is sent to a worker.
+
+        batch_pre_check (function, optional):
+
+            A function that will be called as::
+
+                batch_pre_check(blocks)
+
+            with a list of ready blocks, and returns a list of ``bool``, one
+            per block, that are ``True`` for blocks that were completed
+            already. If given, used instead of the ``pre_check``, e.g., to
+            check thousands of blocks with a single database query.
+
+        pre_check_batch_size (int, optional):
+
+            The maximal number of blocks passed to ``batch_pre_check``.
+
+        post_check_workers (int, optional):
+
+            The maximal number of post_checks (see ``check_function``) of
+            returned blocks that are evaluated concurrently, each in its own
+            thread. A block is only marked as done once its post_check
+            succeeded. If 0, the post_check is evaluated in the thread
+            handling network I/O.
+
+        straggler_factor (float, optional):
+
+            If given, a block that has been running for longer than
+            ``straggler_factor`` times the median duration of blocks (and at
+            least a second) is sent a second time to an idle worker, if there
+            are no other blocks to process. The first copy that succeeds
+            completes the block, the other one is ignored. Use this only if
+            processing a block twice, possibly at the same time, is safe.
+
+        block_timeout (float, optional):
+
+            If given, a worker that has been processing a block for longer
+            than this many seconds is considered hung. It is terminated and
+            respawned, and the block is rescheduled (counting as a retry).
+
+        min_workers (int, optional):
+        max_workers (int, optional):
+
+            If ``max_workers`` is given, ``num_workers`` is ignored and the
+            number of workers is scaled between ``min_workers`` and
+            ``max_workers``, following the number of blocks that are ready
+            or being processed. Idle workers are retired when there are
+            fewer such blocks than workers.
+
+        use_threads (bool, optional):
+
+            If set, workers are threads in the scheduler process instead of
+            separate processes. Blocks are passed to them in memory, which
+            avoids the overhead of sending blocks over the network for each
+            block. Useful for many small blocks, and for process functions
+            that mostly wait for I/O and release the GIL while doing so.
+            ``process_function`` has to take a block as argument. An
+            exception raised by it fails the block, the worker continues.
+            Hung workers can not be terminated, ``block_timeout`` is ignored.
+
+        journal (``string``, optional):
+
+            The filename of a journal of completed blocks, see ``distribute``.
+
+        instrumentation (`class:Instrumentation`, optional):
+
+            Records the time spent in each step of scheduling a block, see
+            ``distribute``.
+
+        trace (`class:BlockTrace`, optional):
+
+            Records events of every block, see ``distribute``.
+
+        start_method (``string``, optional):
+
+            How to start worker processes, see ``distribute``.
+
+        preload_modules (`list` of ``string``, optional):
+
+            Modules to preload if ``start_method`` is ``'forkserver'``, see
+            ``distribute``.
+
     Returns:
 
         True, if all tasks succeeded (or were skipped because they were already
@@ -744,12 +1729,41 @@ def run_blockwise(
                 fit=fit,
                 num_workers=num_workers,
                 max_retries=max_retries,
+                prefetch_depth=prefetch_depth,
+                pre_check_workers=pre_check_workers,
+                batch_pre_check=batch_pre_check,
+                pre_check_batch_size=pre_check_batch_size,
+                post_check_workers=post_check_workers,
+                straggler_factor=straggler_factor,
+                block_timeout=block_timeout,
+                min_workers=min_workers,
+                max_workers=max_workers,
+                use_threads=use_threads,
                 )
 
-    return distribute([{'task': BlockwiseTask()}])
-
-
-def distribute(tasks, global_config=None):
+    return distribute(
+        [{'task': BlockwiseTask()}],
+        lazy=lazy,
+        priority=priority,
+        journal=journal,
+        instrumentation=instrumentation,
+        trace=trace,
+        start_method=start_method,
+        preload_modules=preload_modules)
+
+
+def distribute(
+        tasks,
+        global_config=None,
+        lazy=False,
+        priority='z_order',
+        journal=None,
+        instrumentation=None,
+        trace=None,
+        max_workers=None,
+        reuse_workers=False,
+        start_method=None,
+        preload_modules=None):
     ''' Execute tasks in a block-wise fashion using the Task interface
 
     Args:
@@ -759,8 +1773,81 @@ def distribute(tasks, global_config=None):
 
             List of tasks to be executed. Each task is a dictionary mapping
             'task' to a `Task`, and 'request' to a sub-Roi for the task
+
+        lazy (``bool``, optional):
+
+            If set, blocks and their dependencies are created on demand,
+            see ``DependencyGraph``.
+
+        priority (``string``, `class:PriorityPolicy`, or function, optional):
+
+            The order in which ready blocks of a task are processed, see
+            ``DependencyGraph``.
+
+        journal (``string``, optional):
+
+            The filename of a journal of completed blocks (see
+            ``CompletionJournal``). Every block that is completed (or skipped
+            because its ``pre_check`` passed) is appended to the journal.
+            Blocks found in the journal when the tasks are started are marked
+            as done without calling their ``pre_check``, which makes resuming
+            an interrupted run fast. The journal has to be deleted if the
+            ROIs of a task change.
+
+        instrumentation (`class:Instrumentation`, optional):
+
+            Records histograms of the time spent in each step of scheduling a
+            block (waiting for a worker, sending it, processing it, checking
+            it, ...), per task. Pass an instance to inspect them after the
+            run. A summary is logged at the end of the run in any case.
+
+        trace (`class:BlockTrace`, optional):
+
+            If given, records when each block was ready, dispatched,
+            processed, and finished, and by which worker. Use
+            ``BlockTrace.save_chrome_trace()`` after the run to see the
+            utilization of workers over time.
+
+        max_workers (``int``, optional):
+
+            The maximal number of workers of all tasks together. Tasks with
+            ``max_workers`` (see ``Task.schedule()``) recruit workers when
+            they have ready blocks, and retire them when they are idle, such
+            that workers move to the tasks that have work to do within this
+            budget.
+
+        reuse_workers (``bool``, optional):
+
+            If set, workers of a finished task are assigned to tasks that
+            start later instead of being terminated, such that each worker
+            process is started only once per run. This applies to tasks with
+            a process function that takes a block.
+
+        start_method (``string``, optional):
+
+            The ``multiprocessing`` start method used to start workers
+            (``'fork'``, ``'spawn'``, or ``'forkserver'``). Defaults to the
+            one of the platform. With ``'forkserver'``, workers are forked
+            from a server process that imported daisy, numpy, zarr, and
+            ``preload_modules`` once, which makes starting many workers
+            faster and lets them share the memory of these modules. Process
+            functions have to be picklable for ``'spawn'`` and
+            ``'forkserver'``, i.e., they can not be lambdas or local
+            functions.
+
+        preload_modules (`list` of ``string``, optional):
+
+            Additional modules to import in the forkserver.
     '''
-    dependency_graph = DependencyGraph(global_config=global_config)
+    completed_blocks = None
+    if journal is not None:
+        journal = CompletionJournal(journal)
+        completed_blocks = journal.read()
+
+    dependency_graph = DependencyGraph(
+        global_config=global_config,
+        lazy=lazy,
+        priority=priority)
 
     # if len(tasks) > 1:
     #     raise NotImplementedError(
@@ -772,7 +1859,8 @@ def distribute(tasks, global_config=None):
 
         if 'request' not in task or task['request'] is None:
             dependency_graph.init(task['task'].task_id,
-                                  request_roi=[])
+                                  request_roi=[],
+                                  completed_blocks=completed_blocks)
 
         else:
             if len(task['request']) > 1:
@@ -780,10 +1868,20 @@ def distribute(tasks, global_config=None):
                   "Sorry Daisy does not handle more than one request_roi yet.")
 
             dependency_graph.init(task['task'].task_id,
-                                  request_roi=task['request'][0])
+                                  request_roi=task['request'][0],
+                                  completed_blocks=completed_blocks)
 
     # if 'request' in task and task['request'] is not None:
     #     subgraph = dependency_graph.get_subgraph(task['request'])
     #     dependency_graph = subgraph
 
-    return Scheduler().distribute(dependency_graph)
+    scheduler = Scheduler(
+        journal=journal,
+        instrumentation=instrumentation,
+        trace=trace,
+        max_workers=max_workers,
+        reuse_workers=reuse_workers,
+        start_method=start_method,
+        preload_modules=preload_modules)
+
+    return scheduler.distribute(dependency_graph)
@@ -146,7 +146,17 @@ class Task():
             read_write_conflict=True,
             num_workers=1,
             max_retries=2,
-            fit='valid'
+            fit='valid',
+            prefetch_depth=1,
+            pre_check_workers=1,
+            batch_pre_check=None,
+            pre_check_batch_size=1000,
+            post_check_workers=1,
+            straggler_factor=None,
+            block_timeout=None,
+            min_workers=0,
+            max_workers=None,
+            use_threads=False
             ):
         '''Configure necessary parameters for the scheduler to run this
         task. The arguments are the same as those in
@@ -166,6 +176,16 @@ class Task():
         self._daisy.fit = fit
         self._daisy.num_workers = num_workers
         self._daisy.max_retries = max_retries
+        self._daisy.prefetch_depth = prefetch_depth
+        self._daisy.pre_check_workers = pre_check_workers
+        self._daisy.batch_pre_check = batch_pre_check
+        self._daisy.pre_check_batch_size = pre_check_batch_size
+        self._daisy.post_check_workers = post_check_workers
+        self._daisy.straggler_factor = straggler_factor
+        self._daisy.block_timeout = block_timeout
+        self._daisy.min_workers = min_workers
+        self._daisy.max_workers = max_workers
+        self._daisy.use_threads = use_threads
 
         if check_function is not None:
             try:
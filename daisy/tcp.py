@@ -1,12 +1,19 @@
+from .block import Block
+from .roi import Roi
 from .worker import Worker
 from enum import Enum
 from tornado.ioloop import IOLoop
 from tornado.iostream import StreamClosedError
+from tornado.netutil import bind_unix_socket
 from tornado.tcpserver import TCPServer
 import logging
+import math
+import os
 import pickle
+import shutil
 import socket
 import struct
+import tempfile
 
 logger = logging.getLogger(__name__)
 
@@ -15,14 +22,26 @@ class DaisyTCPServer(TCPServer):
 
     def __init__(self):
         super().__init__()
+        # the IOLoop of the creating thread, messages can be sent from any
+        # thread
+        self.ioloop = IOLoop.current()
         self.scheduler = None
         self.scheduler_closed = False
         self.connected_workers = set()
+        self.unix_socket_path = None
 
     async def handle_stream(self, stream, address):
 
+        if not isinstance(address, tuple):
+            # connected through the Unix domain socket
+            address = (self.unix_socket_path, 0)
+
         logger.debug("Received new connection from %s:%d", *address)
 
+        # messages are small and latency-critical, don't let Nagle's
+        # algorithm delay them
+        stream.set_nodelay(True)
+
         try:
             msg = await get_and_unpack_message(stream)
         except StreamClosedError:
@@ -30,6 +49,12 @@ class DaisyTCPServer(TCPServer):
                 "Lost connection to %s before getting worker ID",
                 address)
             return
+        except ProtocolError as e:
+            logger.error(
+                "Closing connection to %s:%d: %s",
+                *address, e)
+            stream.close()
+            return
 
         if msg.type != SchedulerMessageType.WORKER_HANDSHAKE:
             logger.error("Unexpected message %s received", msg.type)
@@ -57,8 +82,9 @@ class DaisyTCPServer(TCPServer):
                         worker, task=msg.data)
 
                 elif msg.type == SchedulerMessageType.WORKER_RET_BLOCK:
-                    jobid, ret = msg.data
-                    self.scheduler.block_return(worker, jobid, ret)
+                    jobid, ret, compute_time = msg.data
+                    self.scheduler.block_return(
+                        worker, jobid, ret, compute_time=compute_time)
 
                 else:
                     logger.error(
@@ -78,27 +104,43 @@ class DaisyTCPServer(TCPServer):
                     worker)
                 break
 
+            except ProtocolError as e:
+                logger.error(
+                    "Closing connection to worker %s: %s",
+                    worker, e)
+                break
+
         # done, removing worker from list
         stream.close()
         self.scheduler.remove_worker_callback(worker)
         self.connected_workers.remove(worker)
 
-    async def async_send(self, stream, data):
+    async def async_send(self, stream, data, callback=None):
 
         try:
             await stream.write(data)
         except StreamClosedError:
             # might actually be okay if worker exits normally
             logger.debug("Scheduler lost connection while sending data.")
+            return
 
-    def send(self, worker, data):
+        if callback is not None:
+            callback()
+
+    def send(self, worker, data, callback=None):
+        '''Send a message to a worker. Can be called from any thread. If
+        ``callback`` is given, it is called in the IOLoop thread once the
+        message was written.'''
 
         if worker not in self.connected_workers:
             logger.warning("worker %d is no longer alive", worker.worker_id)
             return
 
-        IOLoop.current().spawn_callback(
-            self.async_send, worker.stream, pack_message(data))
+        self.ioloop.add_callback(
+            self.async_send,
+            worker.stream,
+            pack_message(data, template=worker.block_template),
+            callback)
 
     def add_handler(self, scheduler):
         self.scheduler = scheduler
@@ -122,9 +164,28 @@ class DaisyTCPServer(TCPServer):
         ip = self.get_own_ip(port)
         return (ip, port)
 
+    def listen_unix(self):
+        '''Accept connections on a Unix domain socket as well, which is
+        faster than TCP for workers on the same host. The socket is created
+        in a new temporary directory, that only the current user can access.
+        Returns the path of the socket.'''
+
+        socket_dir = tempfile.mkdtemp(prefix='daisy_')
+        path = os.path.join(socket_dir, 'scheduler.sock')
+        self.add_socket(bind_unix_socket(path))
+        self.unix_socket_path = path
+
+        return path
+
     def daisy_close(self):
         self.scheduler_closed = True
 
+        if self.unix_socket_path is not None:
+            # connected workers are not affected
+            shutil.rmtree(
+                os.path.dirname(self.unix_socket_path),
+                ignore_errors=True)
+
 
 class SchedulerMessageType(Enum):
     WORKER_HANDSHAKE = 1,
@@ -133,6 +194,8 @@ class SchedulerMessageType(Enum):
     WORKER_EXITING = 4,
     TERMINATE_WORKER = 5,
     NEW_BLOCK = 6,
+    BLOCK_TEMPLATE = 7,
+    ASSIGN_TASK = 8,
 
 
 class ReturnCode(Enum):
@@ -150,20 +213,208 @@ class SchedulerMessage():
         self.data = data
 
 
-async def get_and_unpack_message(stream):
+# Wire format of a message: a fixed-size header, followed by the payload.
+#
+#   version (uint8) | encoding (uint8) | payload size (uint64)
+#
+# all in network byte order. The payload is either a pickled
+# ``SchedulerMessage`` (ENCODING_PICKLE), or, for the frequent messages
+# exchanged for every block, a compact binary encoding (ENCODING_BINARY).
+#
+# Once a worker has received the ``BlockTemplate`` of its task (in a
+# BLOCK_TEMPLATE message), blocks are sent to it as offsets relative to
+# that template.
+PROTOCOL_VERSION = 2
+ENCODING_PICKLE = 0
+ENCODING_BINARY = 1
+_header = struct.Struct('!BBQ')
+
+_message_types = list(SchedulerMessageType)
+_return_codes = list(ReturnCode)
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def _pack_roi(roi):
+    return tuple(roi.get_begin()) + tuple(roi.get_shape())
+
+
+def _unpack_roi(values, dims):
+    return Roi(values[:dims], values[dims:])
+
+
+def _encode_get_block(data, template):
+    # data: task_id
+    return data.encode()
+
+
+def _decode_get_block(payload, template):
+    return payload.decode()
+
+
+_ret_block_format = struct.Struct('!Bqd')
+
+
+def _encode_ret_block(data, template):
+    # data: ((task_id, block_id), return code, compute time or None)
+    (task_id, block_id), ret, compute_time = data
+    if compute_time is None:
+        compute_time = math.nan
+    return (
+        _ret_block_format.pack(
+            _return_codes.index(ret),
+            block_id,
+            compute_time) +
+        task_id.encode())
+
+
+def _decode_ret_block(payload, template):
+    ret, block_id, compute_time = _ret_block_format.unpack_from(payload)
+    task_id = payload[_ret_block_format.size:].decode()
+    if math.isnan(compute_time):
+        compute_time = None
+    return ((task_id, block_id), _return_codes[ret], compute_time)
+
+
+_FULL_BLOCK = 0
+_TEMPLATE_BLOCK = 1
+
+
+def _encode_new_block(block, template):
+    # data: Block
+    dims = block.read_roi.dims()
+
+    if template is not None:
+        offset = template.get_offset(block)
+        if offset is not None:
+            return struct.pack(
+                '!BB%dq' % (2 + dims),
+                _TEMPLATE_BLOCK, dims,
+                block.block_id, block.z_order_id, *offset)
+
+    values = (
+        (block.block_id, block.z_order_id) +
+        _pack_roi(block.read_roi) +
+        _pack_roi(block.write_roi) +
+        _pack_roi(block.requested_write_roi))
+    return struct.pack('!BB%dq' % len(values), _FULL_BLOCK, dims, *values)
+
+
+def _decode_new_block(payload, template):
+    kind, dims = payload[0], payload[1]
+
+    if kind == _TEMPLATE_BLOCK:
+        if template is None:
+            raise ProtocolError("Received block relative to unknown template")
+        values = struct.unpack_from('!%dq' % (2 + dims), payload, 2)
+        return template.make_block(values[2:], values[0], values[1])
+
+    values = struct.unpack_from('!%dq' % (2 + 6*dims), payload, 2)
+    block = Block(
+        None,
+        _unpack_roi(values[2:2 + 2*dims], dims),
+        _unpack_roi(values[2 + 2*dims:2 + 4*dims], dims),
+        block_id=values[0])
+    block.z_order_id = values[1]
+    block.requested_write_roi = _unpack_roi(values[2 + 4*dims:], dims)
+    return block
+
+
+_binary_encoders = {
+    SchedulerMessageType.WORKER_GET_BLOCK: _encode_get_block,
+    SchedulerMessageType.WORKER_RET_BLOCK: _encode_ret_block,
+    SchedulerMessageType.NEW_BLOCK: _encode_new_block,
+}
+
+_binary_decoders = {
+    SchedulerMessageType.WORKER_GET_BLOCK: _decode_get_block,
+    SchedulerMessageType.WORKER_RET_BLOCK: _decode_ret_block,
+    SchedulerMessageType.NEW_BLOCK: _decode_new_block,
+}
+
+
+def encode_message(msg, binary=True, template=None):
+    '''Encode a ``SchedulerMessage``. Returns a tuple ``(encoding,
+    payload)``.
+
+    If ``binary`` is set, messages of the types exchanged for every block
+    (``WORKER_GET_BLOCK``, ``WORKER_RET_BLOCK``, ``NEW_BLOCK``) are encoded
+    with a compact binary format instead of pickle, unless their content
+    can not be represented in it (e.g., unbounded ROIs). If a ``template``
+    (`class:BlockTemplate`) is given, blocks are encoded by their offset
+    to it whenever possible. The receiver needs the same template to decode
+    them.'''
+
+    if binary and msg.type in _binary_encoders:
+        try:
+            payload = _binary_encoders[msg.type](msg.data, template)
+            return (
+                ENCODING_BINARY,
+                bytes((_message_types.index(msg.type),)) + payload)
+        except (AttributeError, TypeError, ValueError, struct.error):
+            # fall back to pickle
+            pass
+
+    return ENCODING_PICKLE, pickle.dumps(msg)
+
+
+def decode_message(encoding, payload, template=None):
+    '''Decode a payload created by ``encode_message()``.'''
+
+    if encoding == ENCODING_PICKLE:
+        return pickle.loads(payload)
+
+    elif encoding == ENCODING_BINARY:
+        try:
+            msg_type = _message_types[payload[0]]
+            return SchedulerMessage(
+                msg_type,
+                data=_binary_decoders[msg_type](payload[1:], template))
+        except (IndexError, KeyError, ValueError, struct.error) as e:
+            # unknown message type, or a truncated or malformed payload
+            raise ProtocolError("Malformed binary message: %r" % e)
+
+    raise ProtocolError("Unknown message encoding %d" % encoding)
+
+
+def _unpack_header(header):
+
+    version, encoding, size = _header.unpack(header)
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(
+            "Received message with protocol version %d, expected %d" %
+            (version, PROTOCOL_VERSION))
+    return encoding, size
+
+
+async def get_and_unpack_message(stream, template=None):
     try:
-        size = await stream.read_bytes(4)
+        header = await stream.read_bytes(_header.size)
     except StreamClosedError:
         logger.debug("stream %s was closed", stream)
         raise
-    size = struct.unpack('I', size)[0]
-    assert(size < 65535)  # TODO: parameterize max message size
-    pickled_data = await stream.read_bytes(size)
-    msg = pickle.loads(pickled_data)
-    return msg
+    encoding, size = _unpack_header(header)
+    payload = await stream.read_bytes(size)
+    return decode_message(encoding, payload, template)
+
+
+def read_message(reader, template=None):
+    '''Blocking counterpart of ``get_and_unpack_message()``, reads the next
+    message from a binary file object (e.g., from ``socket.makefile()``).
+    Raises ``EOFError`` if the connection was closed.'''
+
+    header = reader.read(_header.size)
+    if len(header) < _header.size:
+        raise EOFError("Connection closed")
+    encoding, size = _unpack_header(header)
+    payload = reader.read(size)
+    if len(payload) < size:
+        raise EOFError("Connection closed")
+    return decode_message(encoding, payload, template)
 
 
-def pack_message(data):
-    pickled_data = pickle.dumps(data)
-    msg_size_bytes = struct.pack('I', len(pickled_data))
-    return msg_size_bytes + pickled_data
+def pack_message(data, binary=True, template=None):
+    encoding, payload = encode_message(data, binary, template)
+    return _header.pack(PROTOCOL_VERSION, encoding, len(payload)) + payload
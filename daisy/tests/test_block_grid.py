@@ -0,0 +1,115 @@
+from daisy.block_grid import BlockGrid
+from daisy.blocks import create_dependency_graph, get_subgraph_blocks
+from itertools import product
+import daisy
+import unittest
+
+
+class TestBlockGrid(unittest.TestCase):
+
+    def test_create_dependency_graph(self):
+
+        total_roi = daisy.Roi((3, 2), (29, 17))
+        read_roi = daisy.Roi((0, 0), (7, 6))
+        write_roi = daisy.Roi((2, 1), (3, 4))
+
+        for fit in ['valid', 'overhang', 'shrink']:
+            for read_write_conflict in [True, False]:
+
+                blocks = create_dependency_graph(
+                    total_roi,
+                    read_roi,
+                    write_roi,
+                    read_write_conflict,
+                    fit)
+                grid = BlockGrid(
+                    total_roi,
+                    read_roi,
+                    write_roi,
+                    read_write_conflict,
+                    fit)
+
+                self.assertEqual(grid.size(), len(blocks))
+
+                expected = {
+                    block.block_id: (block, set(d.block_id for d in deps))
+                    for block, deps in blocks
+                }
+                block_ids = {
+                    index: grid.get_block(index).block_id
+                    for index in product(*[range(s) for s in grid.shape])
+                }
+                self.assertEqual(len(set(block_ids.values())), grid.size())
+                self.assertEqual(set(block_ids.values()), set(expected))
+
+                roots = set(grid.get_roots())
+
+                for index, block_id in block_ids.items():
+
+                    block = grid.get_block(index)
+                    expected_block, expected_deps = expected[block_id]
+
+                    self.assertEqual(block.read_roi, expected_block.read_roi)
+                    self.assertEqual(
+                        block.write_roi,
+                        expected_block.write_roi)
+                    self.assertEqual(grid.get_read_roi(index), block.read_roi)
+
+                    dependencies = grid.get_dependencies(index)
+                    self.assertEqual(
+                        set(block_ids[i] for i in dependencies),
+                        expected_deps)
+                    self.assertEqual(len(dependencies) == 0, index in roots)
+                    for i in dependencies:
+                        self.assertIn(index, grid.get_dependents(i))
+
+                    self.assertEqual(
+                        set(
+                            block_ids[i]
+                            for i in grid.get_indices_writing(block.read_roi)
+                        ),
+                        set(get_subgraph_blocks(
+                            block.read_roi,
+                            total_roi,
+                            read_roi,
+                            write_roi,
+                            fit)))
+
+    def test_indices_reading(self):
+
+        total_roi = daisy.Roi((0, 0), (20, 20))
+        read_roi = daisy.Roi((0, 0), (6, 6))
+        write_roi = daisy.Roi((2, 2), (2, 2))
+
+        for fit in ['valid', 'overhang', 'shrink']:
+
+            grid = BlockGrid(total_roi, read_roi, write_roi, fit=fit)
+            indices = list(product(*[range(s) for s in grid.shape]))
+
+            for roi in [
+                    daisy.Roi((0, 0), (1, 1)),
+                    daisy.Roi((5, 7), (3, 1)),
+                    daisy.Roi((19, 3), (4, 4)),
+                    daisy.Roi((-4, -4), (2, 30))]:
+
+                self.assertEqual(
+                    set(grid.get_indices_reading(roi)),
+                    set(
+                        index for index in indices
+                        if not grid.get_read_roi(index).intersect(roi).empty()
+                    ))
+
+    def test_positions(self):
+
+        grid = BlockGrid(
+            daisy.Roi((0, 0, 0), (20, 30, 40)),
+            daisy.Roi((0, 0, 0), (6, 6, 6)),
+            daisy.Roi((2, 2, 2), (2, 2, 2)))
+        indices = list(product(*[range(s) for s in grid.shape]))
+
+        self.assertEqual(
+            [grid.get_position(index) for index in indices],
+            list(range(grid.size())))
+        self.assertEqual(
+            [grid.get_index(p) for p in range(grid.size())],
+            indices)
@@ -0,0 +1,96 @@
+from daisy.block_table import BlockTable
+from daisy.blocks import create_dependency_graph, get_subgraph_blocks
+import daisy
+import numpy as np
+import unittest
+
+
+class TestBlockTable(unittest.TestCase):
+
+    def test_create_dependency_graph(self):
+
+        total_roi = daisy.Roi((3, 2), (29, 17))
+        read_roi = daisy.Roi((0, 0), (7, 6))
+        write_roi = daisy.Roi((2, 1), (3, 4))
+
+        for fit in ['valid', 'overhang', 'shrink']:
+            for read_write_conflict in [True, False]:
+
+                blocks = create_dependency_graph(
+                    total_roi,
+                    read_roi,
+                    write_roi,
+                    read_write_conflict,
+                    fit)
+                table = BlockTable(
+                    total_roi,
+                    read_roi,
+                    write_roi,
+                    read_write_conflict,
+                    fit)
+
+                self.assertEqual(len(table), len(blocks))
+
+                for row, (block, dependencies) in enumerate(blocks):
+
+                    table_block = table.get_block(row)
+                    self.assertEqual(table_block.block_id, block.block_id)
+                    self.assertEqual(table_block.z_order_id, block.z_order_id)
+                    self.assertEqual(table_block.read_roi, block.read_roi)
+                    self.assertEqual(table_block.write_roi, block.write_roi)
+                    self.assertEqual(table.get_row(block.block_id), row)
+
+                    conflicts = table.get_conflicts(row)
+                    self.assertEqual(
+                        set(table.block_ids[conflicts]),
+                        set(d.block_id for d in dependencies))
+                    for conflict in conflicts:
+                        self.assertIn(row, table.get_dependents(conflict))
+
+                # blocks writing to the read ROIs of all blocks
+                roi_indices, rows = table.get_rows_writing(table.read_rois)
+                for row, (block, _) in enumerate(blocks):
+                    self.assertEqual(
+                        set(table.block_ids[rows[roi_indices == row]]),
+                        set(get_subgraph_blocks(
+                            block.read_roi,
+                            total_roi,
+                            read_roi,
+                            write_roi,
+                            fit)))
+
+    def test_merge(self):
+
+        read_roi = daisy.Roi((0,), (5,))
+        write_roi = daisy.Roi((1,), (3,))
+
+        grid_begin = daisy.Coordinate((0,))
+        table = BlockTable(
+            daisy.Roi((0,), (14,)),
+            read_roi,
+            write_roi,
+            grid_begin=grid_begin)
+        other = BlockTable(
+            daisy.Roi((6,), (14,)),
+            read_roi,
+            write_roi,
+            grid_begin=grid_begin)
+        full = BlockTable(daisy.Roi((0,), (20,)), read_roi, write_roi)
+
+        table.merge(other)
+
+        self.assertEqual(len(table), len(full))
+        self.assertEqual(set(table.block_ids), set(full.block_ids))
+        self.assertEqual(table.get_rows([1000])[0], -1)
+        with self.assertRaises(KeyError):
+            table.get_row(1000)
+
+        for block_id in full.block_ids:
+            row = table.get_row(block_id)
+            full_row = full.get_row(block_id)
+            self.assertTrue(np.array_equal(
+                table.write_rois[row],
+                full.write_rois[full_row]))
+            self.assertEqual(
+                table.z_order_ids[row],
+                full.z_order_ids[full_row])
@@ -0,0 +1,76 @@
+from daisy.blocks import create_dependency_graph, create_block_arrays, \
+    _create_dependency_graph_iterative
+import daisy
+import unittest
+
+
+class TestBlocks(unittest.TestCase):
+
+    def test_create_dependency_graph(self):
+
+        total_roi = daisy.Roi((3, 2, -5), (29, 17, 13))
+        read_roi = daisy.Roi((0, 0, 0), (7, 6, 4))
+        write_roi = daisy.Roi((2, 1, 1), (3, 4, 2))
+
+        for fit in ['valid', 'overhang', 'shrink']:
+            for read_write_conflict in [True, False]:
+
+                expected = _create_dependency_graph_iterative(
+                    total_roi,
+                    read_roi,
+                    write_roi,
+                    read_write_conflict,
+                    fit)
+                blocks = create_dependency_graph(
+                    total_roi,
+                    read_roi,
+                    write_roi,
+                    read_write_conflict,
+                    fit)
+
+                self.assertEqual(len(blocks), len(expected))
+
+                for (block, conflicts), (expected_block, expected_conflicts) \
+                        in zip(blocks, expected):
+
+                    self.assertEqual(block.block_id, expected_block.block_id)
+                    self.assertEqual(block.read_roi, expected_block.read_roi)
+                    self.assertEqual(
+                        block.write_roi,
+                        expected_block.write_roi)
+                    self.assertEqual(
+                        [b.block_id for b in conflicts],
+                        [b.block_id for b in expected_conflicts])
+
+    def test_create_block_arrays(self):
+
+        total_roi = daisy.Roi((-1,), (11,))
+        read_roi = daisy.Roi((-1,), (4,))
+        write_roi = daisy.Roi((0,), (2,))
+
+        read_rois, write_rois, conflict_ptrs, conflict_indices = \
+            create_block_arrays(
+                total_roi,
+                read_roi,
+                write_roi,
+                fit='shrink')
+
+        # two levels, the last block is shrunk
+        self.assertEqual(
+            write_rois.tolist(),
+            [
+                [[2], [2]], [[6], [2]],
+                [[0], [2]], [[4], [2]], [[8], [1]]
+            ])
+        self.assertEqual(
+            read_rois.tolist(),
+            [
+                [[1], [4]], [[5], [4]],
+                [[-1], [4]], [[3], [4]], [[7], [3]]
+            ])
+
+        conflicts = [
+            conflict_indices[b:e].tolist()
+            for b, e in zip(conflict_ptrs[:-1], conflict_ptrs[1:])
+        ]
+        self.assertEqual(conflicts, [[], [], [0], [0, 1], [1]])
@@ -1,10 +1,12 @@
 from __future__ import absolute_import
 
 from .tmpdir_test import TmpDirTestCase
+import collections
 import daisy
 import glob
 import os
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 daisy.scheduler._NO_SPAWN_STATUS_THREAD = True
@@ -112,6 +114,665 @@ class TestBlockwiseBasics(TmpDirTestCase):
         expected_block_ids.remove(16)
         self.assertEqual(block_ids, expected_block_ids)
 
+    def test_prefetch(self):
+
+        total_roi = daisy.Roi((0,), (100,))
+        read_roi = daisy.Roi((0,), (5,))
+        write_roi = daisy.Roi((0,), (3,))
+
+        outdir = self.path_to()
+
+        ret = daisy.run_blockwise(
+            total_roi=total_roi,
+            read_roi=read_roi,
+            write_roi=write_roi,
+            process_function=lambda b: self.process_block(outdir, b),
+            num_workers=4,
+            prefetch_depth=3)
+
+        outfiles = glob.glob(os.path.join(outdir, '*.block'))
+        block_ids = sorted([
+            int(path.split('/')[-1].split('.')[0])
+            for path in outfiles
+        ])
+
+        self.assertTrue(ret)
+        self.assertEqual(block_ids, list(range(32)))
+
+    def test_prefetch_worker_failure(self):
+
+        total_roi = daisy.Roi((0,), (100,))
+        read_roi = daisy.Roi((0,), (5,))
+        write_roi = daisy.Roi((0,), (3,))
+
+        outdir = self.path_to()
+
+        # blocks prefetched by the crashing worker are rescheduled without
+        # using up their retries
+        ret = daisy.run_blockwise(
+            total_roi=total_roi,
+            read_roi=read_roi,
+            write_roi=write_roi,
+            process_function=lambda: self.worker(outdir, fail=16),
+            num_workers=4,
+            prefetch_depth=3)
+
+        outfiles = glob.glob(os.path.join(outdir, '*.block'))
+        block_ids = sorted([
+            int(path.split('/')[-1].split('.')[0])
+            for path in outfiles
+        ])
+
+        self.assertFalse(ret)
+        expected_block_ids = list(range(32))
+        expected_block_ids.remove(16)
+        self.assertEqual(block_ids, expected_block_ids)
+
+    def test_lazy(self):
+
+        total_roi = daisy.Roi((0,), (100,))
+        read_roi = daisy.Roi((0,), (5,))
+        write_roi = daisy.Roi((0,), (3,))
+
+        outdir = self.path_to()
+
+        ret = daisy.run_blockwise(
+            total_roi=total_roi,
+            read_roi=read_roi,
+            write_roi=write_roi,
+            process_function=lambda b: self.process_block(outdir, b),
+            num_workers=10,
+            lazy=True)
+
+        outfiles = glob.glob(os.path.join(outdir, '*.block'))
+        block_ids = sorted([
+            int(path.split('/')[-1].split('.')[0])
+            for path in outfiles
+        ])
+
+        self.assertTrue(ret)
+        self.assertEqual(block_ids, list(range(32)))
+
+    def test_forkserver(self):
+
+        total_roi = daisy.Roi((0,), (100,))
+        read_roi = daisy.Roi((0,), (5,))
+        write_roi = daisy.Roi((0,), (3,))
+
+        outdir = self.path_to()
+
+        # the process function has to be picklable to be sent to the
+        # forkserver
+        ret = daisy.run_blockwise(
+            total_roi=total_roi,
+            read_roi=read_roi,
+            write_roi=write_roi,
+            process_function=(write_block, [outdir]),
+            num_workers=2,
+            start_method='forkserver',
+            preload_modules=['daisy.tests.test_blockwise_basics'])
+
+        outfiles = glob.glob(os.path.join(outdir, '*.block'))
+        block_ids = sorted([
+            int(path.split('/')[-1].split('.')[0])
+            for path in outfiles
+        ])
+
+        self.assertTrue(ret)
+        self.assertEqual(block_ids, list(range(32)))
+
+    def test_threads(self):
+
+        total_roi = daisy.Roi((0,), (100,))
+        read_roi = daisy.Roi((0,), (5,))
+        write_roi = daisy.Roi((0,), (3,))
+
+        outdir = self.path_to()
+        pids = set()
+
+        def process_block(b):
+            pids.add(os.getpid())
+            self.process_block(outdir, b, fail=16)
+            return 0
+
+        ret = daisy.run_blockwise(
+            total_roi=total_roi,
+            read_roi=read_roi,
+            write_roi=write_roi,
+            process_function=process_block,
+            num_workers=4,
+            max_retries=1,
+            use_threads=True)
+
+        outfiles = glob.glob(os.path.join(outdir, '*.block'))
+        block_ids = sorted([
+            int(path.split('/')[-1].split('.')[0])
+            for path in outfiles
+        ])
+
+        self.assertFalse(ret)
+        self.assertEqual(pids, set([os.getpid()]))
+        expected_block_ids = list(range(32))
+        expected_block_ids.remove(16)
+        self.assertEqual(block_ids, expected_block_ids)
+
+    def test_tcp_transport(self):
+
+        total_roi = daisy.Roi((0,), (100,))
+        read_roi = daisy.Roi((0,), (5,))
+        write_roi = daisy.Roi((0,), (3,))
+
+        outdir = self.path_to()
+
+        # local workers connect through TCP if the scheduler has no Unix
+        # domain socket
+        daisy.scheduler._NO_UNIX_SOCKET = True
+        try:
+            ret = daisy.run_blockwise(
+                total_roi=total_roi,
+                read_roi=read_roi,
+                write_roi=write_roi,
+                process_function=lambda b: self.process_block(outdir, b),
+                num_workers=2)
+        finally:
+            daisy.scheduler._NO_UNIX_SOCKET = False
+
+        outfiles = glob.glob(os.path.join(outdir, '*.block'))
+        block_ids = sorted([
+            int(path.split('/')[-1].split('.')[0])
+            for path in outfiles
+        ])
+
+        self.assertTrue(ret)
+        self.assertEqual(block_ids, list(range(32)))
+
+    def test_priority(self):
+
+        total_roi = daisy.Roi((0,), (100,))
+        read_roi = daisy.Roi((0,), (5,))
+        write_roi = daisy.Roi((0,), (3,))
+
+        for priority in ['critical_path', 'locality']:
+
+            outdir = self.path_to(priority)
+            os.makedirs(outdir)
+
+            ret = daisy.run_blockwise(
+                total_roi=total_roi,
+                read_roi=read_roi,
+                write_roi=write_roi,
+                process_function=lambda b: self.process_block(outdir, b),
+                num_workers=10,
+                priority=priority)
+
+            outfiles = glob.glob(os.path.join(outdir, '*.block'))
+            block_ids = sorted([
+                int(path.split('/')[-1].split('.')[0])
+                for path in outfiles
+            ])
+
+            self.assertTrue(ret)
+            self.assertEqual(block_ids, list(range(32)))
+
+    def test_pre_check(self):
+
+        total_roi = daisy.Roi((0,), (100,))
+        read_roi = daisy.Roi((0,), (5,))
+        write_roi = daisy.Roi((0,), (3,))
+
+        for pre_check_workers in [0, 4]:
+
+            outdir = self.path_to(str(pre_check_workers))
+            os.makedirs(outdir)
+
+            # even blocks were processed already
+            ret = daisy.run_blockwise(
+                total_roi=total_roi,
+                read_roi=read_roi,
+                write_roi=write_roi,
+                process_function=lambda b: self.process_block(outdir, b),
+                check_function=(
+                    lambda b: b.block_id % 2 == 0,
+                    lambda b: True),
+                num_workers=10,
+                pre_check_workers=pre_check_workers)
+
+            outfiles = glob.glob(os.path.join(outdir, '*.block'))
+            block_ids = sorted([
+                int(path.split('/')[-1].split('.')[0])
+                for path in outfiles
+            ])
+
+            self.assertTrue(ret)
+            self.assertEqual(block_ids, list(range(1, 32, 2)))
+
+    def test_post_check(self):
+
+        total_roi = daisy.Roi((0,), (100,))
+        read_roi = daisy.Roi((0,), (5,))
+        write_roi = daisy.Roi((0,), (3,))
+
+        for post_check_workers in [0, 4]:
+
+            outdir = self.path_to(str(post_check_workers))
+            os.makedirs(outdir)
+
+            def post_check(b):
+                time.sleep(0.01)
+                return os.path.exists(
+                    os.path.join(outdir, '%d.block' % b.block_id))
+
+            ret = daisy.run_blockwise(
+                total_roi=total_roi,
+                read_roi=read_roi,
+                write_roi=write_roi,
+                process_function=lambda b: self.process_block(outdir, b),
+                check_function=(lambda b: False, post_check),
+                num_workers=10,
+                post_check_workers=post_check_workers)
+
+            outfiles = glob.glob(os.path.join(outdir, '*.block'))
+            block_ids = sorted([
+                int(path.split('/')[-1].split('.')[0])
+                for path in outfiles
+            ])
+
+            self.assertTrue(ret)
+            self.assertEqual(block_ids, list(range(32)))
+
+    def test_post_check_failure(self):
+
+        total_roi = daisy.Roi((0,), (100,))
+        read_roi = daisy.Roi((0,), (5,))
+        write_roi = daisy.Roi((0,), (3,))
+
+        outdir = self.path_to()
+
+        ret = daisy.run_blockwise(
+            total_roi=total_roi,
+            read_roi=read_roi,
+            write_roi=write_roi,
+            process_function=lambda b: self.process_block(outdir, b),
+            check_function=(lambda b: False, lambda b: b.block_id != 16),
+            num_workers=10,
+            post_check_workers=4)
+
+        outfiles = glob.glob(os.path.join(outdir, '*.block'))
+        block_ids = sorted([
+            int(path.split('/')[-1].split('.')[0])
+            for path in outfiles
+        ])
+
+        # block 16 was processed, but never passed its post_check
+        self.assertFalse(ret)
+        self.assertEqual(block_ids, list(range(32)))
+
+    def test_batch_pre_check(self):
+
+        total_roi = daisy.Roi((0,), (100,))
+        read_roi = daisy.Roi((0,), (5,))
+        write_roi = daisy.Roi((0,), (3,))
+
+        outdir = self.path_to()
+        batch_sizes = []
+
+        def batch_pre_check(blocks):
+            batch_sizes.append(len(blocks))
+            return [b.block_id < 20 for b in blocks]
+
+        ret = daisy.run_blockwise(
+            total_roi=total_roi,
+            read_roi=read_roi,
+            write_roi=write_roi,
+            process_function=lambda b: self.process_block(outdir, b),
+            num_workers=10,
+            batch_pre_check=batch_pre_check,
+            pre_check_batch_size=8)
+
+        outfiles = glob.glob(os.path.join(outdir, '*.block'))
+        block_ids = sorted([
+            int(path.split('/')[-1].split('.')[0])
+            for path in outfiles
+        ])
+
+        self.assertTrue(ret)
+        self.assertEqual(block_ids, list(range(20, 32)))
+        self.assertEqual(sum(batch_sizes), 32)
+        self.assertLessEqual(max(batch_sizes), 8)
+
+    def test_journal(self):
+
+        total_roi = daisy.Roi((0,), (100,))
+        read_roi = daisy.Roi((0,), (5,))
+        write_roi = daisy.Roi((0,), (3,))
+
+        journal = self.path_to('journal')
+
+        for lazy in [False, True]:
+
+            outdir = self.path_to(str(lazy))
+            os.makedirs(outdir)
+
+            # a first run that fails for block 16, all other blocks are
+            # journaled
+            ret = daisy.run_blockwise(
+                total_roi=total_roi,
+                read_roi=read_roi,
+                write_roi=write_roi,
+                process_function=lambda b: self.process_block(
+                    outdir, b, fail=16),
+                num_workers=10,
+                lazy=lazy,
+                journal=journal)
+            self.assertFalse(ret)
+
+            for path in glob.glob(os.path.join(outdir, '*.block')):
+                os.remove(path)
+
+            # only block 16 is checked and processed again
+            checked = []
+
+            def pre_check(b):
+                checked.append(b.block_id)
+                return False
+
+            ret = daisy.run_blockwise(
+                total_roi=total_roi,
+                read_roi=read_roi,
+                write_roi=write_roi,
+                process_function=lambda b: self.process_block(outdir, b),
+                check_function=(pre_check, lambda b: True),
+                num_workers=10,
+                lazy=lazy,
+                journal=journal)
+
+            outfiles = glob.glob(os.path.join(outdir, '*.block'))
+            block_ids = sorted([
+                int(path.split('/')[-1].split('.')[0])
+                for path in outfiles
+            ])
+
+            self.assertTrue(ret)
+            self.assertEqual(checked, [16])
+            self.assertEqual(block_ids, [16])
+
+            os.remove(journal)
+
+    def test_instrumentation(self):
+
+        total_roi = daisy.Roi((0,), (100,))
+        read_roi = daisy.Roi((0,), (5,))
+        write_roi = daisy.Roi((0,), (3,))
+
+        outdir = self.path_to()
+
+        def process_block(b):
+            time.sleep(0.01)
+            self.process_block(outdir, b)
+
+        instrumentation = daisy.Instrumentation()
+
+        ret = daisy.run_blockwise(
+            total_roi=total_roi,
+            read_roi=read_roi,
+            write_roi=write_roi,
+            process_function=process_block,
+            # skip even blocks
+            check_function=(
+                lambda b: b.block_id % 2 == 0,
+                lambda b: True),
+            num_workers=4,
+            instrumentation=instrumentation)
+
+        self.assertTrue(ret)
+
+        # every block is pre-checked and updated, only odd blocks are sent
+        # to workers
+        for metric, count in [
+                ('pre_check', 32),
+                ('queue_wait', 16),
+                ('send', 16),
+                ('compute', 16),
+                ('dispatch', 16),
+                ('post_check', 16),
+                ('update', 32)]:
+            histogram = instrumentation.get_histogram(metric, 'BlockwiseTask')
+            self.assertEqual(histogram.count, count, metric)
+
+        self.assertGreater(instrumentation.get_histogram('next').count, 0)
+        self.assertGreaterEqual(
+            instrumentation.get_histogram('compute').min,
+            0.01)
+        self.assertEqual(instrumentation.get_task_ids(), ['BlockwiseTask'])
+
+    def test_trace(self):
+
+        total_roi = daisy.Roi((0,), (100,))
+        read_roi = daisy.Roi((0,), (5,))
+        write_roi = daisy.Roi((0,), (3,))
+
+        outdir = self.path_to()
+
+        trace = daisy.BlockTrace()
+
+        ret = daisy.run_blockwise(
+            total_roi=total_roi,
+            read_roi=read_roi,
+            write_roi=write_roi,
+            process_function=lambda b: self.process_block(outdir, b, fail=16),
+            # skip blocks 0 to 3
+            check_function=(lambda b: b.block_id < 4, lambda b: True),
+            num_workers=4,
+            max_retries=0,
+            trace=trace)
+
+        self.assertFalse(ret)
+
+        columns = trace.get_columns()
+        events = collections.defaultdict(list)
+        for event, block_id, worker_id in zip(
+                columns['event'].tolist(),
+                columns['block_id'].tolist(),
+                columns['worker_id'].tolist()):
+            events[block_id].append(event)
+            if event == daisy.BlockTrace.DISPATCHED:
+                self.assertIn(worker_id, range(4))
+
+        self.assertEqual(sorted(events.keys()), list(range(32)))
+
+        for block_id in range(4):
+            self.assertEqual(
+                events[block_id],
+                [daisy.BlockTrace.READY, daisy.BlockTrace.SKIPPED])
+        for block_id in range(4, 32):
+            if block_id == 16:
+                # the worker crashed, it did not report a compute time
+                continue
+            self.assertEqual(
+                events[block_id],
+                [
+                    daisy.BlockTrace.READY,
+                    daisy.BlockTrace.DISPATCHED,
+                    daisy.BlockTrace.ACQUIRED,
+                    daisy.BlockTrace.RETURNED,
+                    daisy.BlockTrace.DONE
+                ])
+        self.assertEqual(
+            events[16],
+            [
+                daisy.BlockTrace.READY,
+                daisy.BlockTrace.DISPATCHED,
+                daisy.BlockTrace.RETURNED,
+                daisy.BlockTrace.FAILED
+            ])
+
+    def test_straggler(self):
+
+        total_roi = daisy.Roi((0,), (100,))
+        read_roi = daisy.Roi((0,), (5,))
+        write_roi = daisy.Roi((0,), (3,))
+
+        outdir = self.path_to()
+
+        def process_block(b):
+            marker = os.path.join(outdir, '%d.started' % b.block_id)
+            if b.block_id == 20 and not os.path.exists(marker):
+                # the first attempt of block 20 hangs
+                open(marker, 'w').close()
+                time.sleep(60)
+            time.sleep(0.01)
+            self.process_block(outdir, b)
+
+        start = time.time()
+        ret = daisy.run_blockwise(
+            total_roi=total_roi,
+            read_roi=read_roi,
+            write_roi=write_roi,
+            process_function=process_block,
+            read_write_conflict=False,
+            num_workers=2,
+            straggler_factor=3)
+        duration = time.time() - start
+
+        outfiles = glob.glob(os.path.join(outdir, '*.block'))
+        block_ids = sorted([
+            int(path.split('/')[-1].split('.')[0])
+            for path in outfiles
+        ])
+
+        self.assertTrue(ret)
+        self.assertEqual(block_ids, list(range(32)))
+        # neither the scheduler nor its shutdown waited for the hanging
+        # block
+        self.assertLess(duration, 30)
+
+    def test_block_timeout(self):
+
+        total_roi = daisy.Roi((0,), (100,))
+        read_roi = daisy.Roi((0,), (5,))
+        write_roi = daisy.Roi((0,), (3,))
+
+        for prefetch_depth in [1, 3]:
+
+            outdir = self.path_to(str(prefetch_depth))
+            os.makedirs(outdir)
+
+            def process_block(b):
+                marker = os.path.join(outdir, '%d.started' % b.block_id)
+                if b.block_id in [5, 20] and not os.path.exists(marker):
+                    # the first attempts of blocks 5 and 20 hang
+                    open(marker, 'w').close()
+                    time.sleep(60)
+                self.process_block(outdir, b)
+
+            start = time.time()
+            ret = daisy.run_blockwise(
+                total_roi=total_roi,
+                read_roi=read_roi,
+                write_roi=write_roi,
+                process_function=process_block,
+                num_workers=2,
+                prefetch_depth=prefetch_depth,
+                block_timeout=1)
+            duration = time.time() - start
+
+            outfiles = glob.glob(os.path.join(outdir, '*.block'))
+            block_ids = sorted([
+                int(path.split('/')[-1].split('.')[0])
+                for path in outfiles
+            ])
+
+            self.assertTrue(ret)
+            self.assertEqual(block_ids, list(range(32)))
+            self.assertLess(duration, 30)
+
+    def test_autoscale(self):
+
+        total_roi = daisy.Roi((0,), (100,))
+        read_roi = daisy.Roi((0,), (5,))
+        write_roi = daisy.Roi((0,), (3,))
+
+        outdir = self.path_to()
+
+        def process_block(b):
+            # the last block keeps one worker busy long after the others
+            # are done
+            time.sleep(2 if b.block_id == 31 else 0.05)
+            self.process_block(outdir, b)
+
+        # count the workers that are recruited and retired
+        recruited = []
+        retired = []
+        recruit_workers = daisy.Scheduler._Scheduler__recruit_workers
+        retire_workers = daisy.Scheduler._Scheduler__retire_workers
+
+        def count_recruited(scheduler, task_id, num_workers):
+            recruited.append(num_workers)
+            recruit_workers(scheduler, task_id, num_workers)
+
+        def count_retired(scheduler, task_id, num_workers):
+            running = scheduler.num_running_workers[task_id]
+            retire_workers(scheduler, task_id, num_workers)
+            retired.append(running - scheduler.num_running_workers[task_id])
+
+        daisy.Scheduler._Scheduler__recruit_workers = count_recruited
+        daisy.Scheduler._Scheduler__retire_workers = count_retired
+        try:
+            # blocks become ready in waves of dependencies, workers are
+            # recruited and retired between them
+            ret = daisy.run_blockwise(
+                total_roi=total_roi,
+                read_roi=read_roi,
+                write_roi=write_roi,
+                process_function=process_block,
+                read_write_conflict=True,
+                max_workers=4)
+        finally:
+            daisy.Scheduler._Scheduler__recruit_workers = recruit_workers
+            daisy.Scheduler._Scheduler__retire_workers = retire_workers
+
+        outfiles = glob.glob(os.path.join(outdir, '*.block'))
+        block_ids = sorted([
+            int(path.split('/')[-1].split('.')[0])
+            for path in outfiles
+        ])
+
+        self.assertTrue(ret)
+        self.assertEqual(block_ids, list(range(32)))
+
+        # up to max_workers are recruited
+        self.assertGreaterEqual(sum(recruited), 4)
+        # all but the worker of the last block are retired while it runs
+        self.assertGreaterEqual(sum(retired), 3)
+        self.assertLessEqual(sum(recruited) - sum(retired), 4)
+
+    def test_lazy_failure(self):
+
+        total_roi = daisy.Roi((0,), (100,))
+        read_roi = daisy.Roi((0,), (5,))
+        write_roi = daisy.Roi((0,), (3,))
+
+        outdir = self.path_to()
+
+        ret = daisy.run_blockwise(
+            total_roi=total_roi,
+            read_roi=read_roi,
+            write_roi=write_roi,
+            process_function=lambda b: self.process_block(outdir, b, fail=16),
+            num_workers=10,
+            lazy=True)
+
+        outfiles = glob.glob(os.path.join(outdir, '*.block'))
+        block_ids = sorted([
+            int(path.split('/')[-1].split('.')[0])
+            for path in outfiles
+        ])
+
+        self.assertFalse(ret)
+        expected_block_ids = list(range(32))
+        expected_block_ids.remove(16)
+        self.assertEqual(block_ids, expected_block_ids)
+
     def test_negative_offset(self):
 
         logger.warning("A warning")
@@ -201,3 +862,12 @@ class TestBlockwiseBasics(TmpDirTestCase):
             self.process_block(outdir, block, fail)
 
             client.release_block(block, 0)
+
+
+def write_block(block, outdir):
+
+    path = os.path.join(outdir, '%d.block' % block.block_id)
+    with open(path, 'w') as f:
+        f.write(str(block.block_id))
+
+    return 0
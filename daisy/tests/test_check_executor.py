@@ -0,0 +1,69 @@
+from daisy.check_executor import CheckExecutor
+import threading
+import unittest
+
+
+class TestCheckExecutor(unittest.TestCase):
+
+    def test_check(self):
+
+        def check(block):
+            if block == 3:
+                raise RuntimeError("intended failure")
+            return block % 2 == 0
+
+        for num_workers in [0, 1, 4]:
+
+            executor = CheckExecutor(check, num_workers=num_workers)
+            results = self.run_executor(executor, range(10))
+
+            self.assertEqual(
+                results,
+                {b: b % 2 == 0 and b != 3 for b in range(10)})
+            self.assertEqual(executor.get_pending_count(), 0)
+
+    def test_batch_check(self):
+
+        batches = []
+
+        def batch_check(blocks):
+            batches.append(blocks)
+            if 13 in blocks:
+                raise RuntimeError("intended failure")
+            return [b < 5 for b in blocks]
+
+        executor = CheckExecutor(
+            None,
+            batch_check_function=batch_check,
+            num_workers=2,
+            batch_size=4)
+        results = self.run_executor(executor, range(16))
+
+        # all blocks of the failed batch did not pass the check
+        self.assertEqual(results, {b: b < 5 for b in range(16)})
+        self.assertEqual(
+            sorted(batches),
+            [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, 11], [12, 13, 14, 15]])
+
+        # wrong number of results
+        executor = CheckExecutor(
+            None,
+            batch_check_function=lambda blocks: [True],
+            num_workers=0,
+            batch_size=4)
+        results = self.run_executor(executor, range(3))
+        self.assertEqual(results, {0: False, 1: False, 2: False})
+
+    def run_executor(self, executor, blocks):
+
+        results = {}
+        lock = threading.Lock()
+
+        def callback(block, result):
+            with lock:
+                results[block] = result
+
+        executor.submit(blocks, callback)
+        executor.shutdown()
+
+        return results
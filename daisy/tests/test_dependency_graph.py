@@ -0,0 +1,467 @@
+import collections
+from daisy.dependency_graph import BlockState
+import daisy
+import numpy as np
+import unittest
+
+daisy.scheduler._NO_SPAWN_STATUS_THREAD = True
+
+
+class TestDependencyGraph(unittest.TestCase):
+
+    def test_next_batch(self):
+
+        task = self.IndependentTask()
+        graph = daisy.DependencyGraph(global_config=None)
+        graph.add(task)
+        graph.init(task.task_id)
+
+        # one block per task by default
+        blocks = graph.next(waiting_blocks={})
+        self.assertEqual(len(blocks[task.task_id]), 1)
+
+        # waiting blocks are counted against max_blocks
+        blocks = graph.next(
+            waiting_blocks=blocks,
+            max_blocks={task.task_id: 4})
+        self.assertEqual(len(blocks[task.task_id]), 4)
+        self.assertEqual(
+            len(set(b.block_id for b in blocks[task.task_id])), 4)
+
+        blocks = graph.next(
+            waiting_blocks=blocks,
+            max_blocks={task.task_id: 4})
+        self.assertEqual(len(blocks[task.task_id]), 4)
+
+        # no more than the number of ready blocks
+        blocks = graph.next(
+            waiting_blocks=blocks,
+            max_blocks={task.task_id: 100})
+        self.assertEqual(len(blocks[task.task_id]), 10)
+        self.assertEqual(graph.ready_size(), 0)
+
+        for block in blocks[task.task_id]:
+            graph.remove_and_update((task.task_id, block.block_id))
+        self.assertTrue(graph.empty())
+        self.assertTrue(graph.is_task_done(task.task_id))
+
+    def test_lazy(self):
+
+        eager = daisy.DependencyGraph(global_config=None)
+        eager.add(self.DownstreamTask())
+        eager.init('DownstreamTask')
+
+        lazy = daisy.DependencyGraph(global_config=None, lazy=True)
+        lazy.add(self.DownstreamTask())
+        lazy.init('DownstreamTask')
+
+        self.assertEqual(lazy.size(), eager.size())
+        self.assertEqual(lazy.ready_size(), eager.ready_size())
+
+        done = self.run_graph(lazy, eager)
+
+        self.assertEqual(done, set(self.get_blocks(eager)))
+        self.assertTrue(lazy.is_task_done('UpstreamTask'))
+        self.assertTrue(lazy.is_task_done('DownstreamTask'))
+
+        # nothing is kept after all blocks finished
+        self.assertEqual(len(lazy.blocks), 0)
+        self.assertEqual(len(lazy.remaining_dependencies), 0)
+
+    def test_lazy_orphans(self):
+
+        eager = daisy.DependencyGraph(global_config=None)
+        eager.add(self.DownstreamTask())
+        eager.init('DownstreamTask')
+
+        lazy = daisy.DependencyGraph(global_config=None, lazy=True)
+        lazy.add(self.DownstreamTask())
+        lazy.init('DownstreamTask')
+
+        blocks = self.get_blocks(eager)
+        failed_id = next(
+            block_id
+            for block_id, block in blocks.items()
+            if block_id[0] == 'UpstreamTask' and
+            block.write_roi.contains(daisy.Coordinate((8, 8))))
+
+        # all direct and indirect dependents of the failed block
+        orphans = set()
+        to_check = collections.deque(eager.get_dependents(failed_id))
+        while len(to_check) > 0:
+            block_id = to_check.popleft()
+            if block_id not in orphans:
+                orphans.add(block_id)
+                to_check.extend(eager.get_dependents(block_id))
+
+        done = self.run_graph(lazy, eager, fail=failed_id)
+
+        self.assertEqual(lazy.get_failed_blocks(), set([failed_id]))
+        self.assertEqual(lazy.get_orphans(), orphans)
+        self.assertEqual(done, set(blocks) - orphans - set([failed_id]))
+
+    def test_states(self):
+
+        reference = daisy.DependencyGraph(global_config=None)
+        reference.add(self.DownstreamTask())
+        reference.init('DownstreamTask')
+        failed_id = next(
+            block_id
+            for block_id, block in self.get_blocks(reference).items()
+            if block_id[0] == 'UpstreamTask' and
+            block.write_roi.contains(daisy.Coordinate((8, 8))))
+
+        for lazy in [False, True]:
+
+            graph = daisy.DependencyGraph(global_config=None, lazy=lazy)
+            graph.add(self.DownstreamTask())
+            graph.init('DownstreamTask')
+
+            counts = graph.get_state_counts()
+            self.assertEqual(counts[BlockState.READY], graph.ready_size())
+            self.assertEqual(
+                counts[BlockState.PENDING],
+                graph.size() - graph.ready_size())
+
+            blocks = graph.next(
+                waiting_blocks={},
+                max_blocks={'UpstreamTask': 3})
+            counts = graph.get_task_state_counts('UpstreamTask')
+            self.assertEqual(counts[BlockState.PROCESSING], 3)
+            self.assertEqual(
+                graph.get_task_processing_count('UpstreamTask'),
+                3)
+            finished = set()
+            for block in blocks['UpstreamTask']:
+                finished.add(('UpstreamTask', block.block_id))
+                graph.remove_and_update(('UpstreamTask', block.block_id))
+
+            done = self.run_graph(
+                graph,
+                reference,
+                fail=failed_id,
+                completed=finished)
+
+            counts = graph.get_state_counts()
+            self.assertEqual(counts[BlockState.DONE], len(done) + 3)
+            self.assertEqual(counts[BlockState.FAILED], 1)
+            self.assertEqual(
+                counts[BlockState.ORPHANED],
+                len(graph.get_orphans()))
+            self.assertEqual(counts.sum(), graph.size())
+            self.assertEqual(
+                graph.get_task_failed_count('UpstreamTask'), 1)
+
+            for states in graph.block_states.values():
+                self.assertEqual(states.dtype, np.uint8)
+
+    def test_many_retries(self):
+
+        for lazy in [False, True]:
+
+            graph = daisy.DependencyGraph(global_config=None, lazy=lazy)
+            task = self.RetryTask()
+            graph.add(task)
+            graph.init(task.task_id)
+
+            # retries are counted beyond 255
+            for i in range(301):
+                blocks = graph.next(waiting_blocks={})
+                self.assertEqual(len(blocks[task.task_id]), 1)
+                block_id = (task.task_id, blocks[task.task_id][0].block_id)
+                graph.cancel_and_reschedule(block_id)
+
+            self.assertEqual(graph.get_failed_blocks(), set([block_id]))
+            self.assertEqual(graph.ready_size(), 0)
+
+    def test_mark_orphans(self):
+
+        graph = daisy.DependencyGraph(global_config=None)
+        graph.add(self.DownstreamTask())
+        graph.init('DownstreamTask')
+
+        blocks = self.get_blocks(graph)
+        failed_ids = [
+            next(
+                block_id
+                for block_id, block in blocks.items()
+                if block_id[0] == 'UpstreamTask' and
+                block.write_roi.contains(daisy.Coordinate(c)))
+            for c in [(8, 8), (11, 8)]
+        ]
+
+        # all direct and indirect dependents of the failed blocks
+        orphans = set()
+        for failed_id in failed_ids:
+
+            dependents = set()
+            to_check = collections.deque(graph.get_dependents(failed_id))
+            while len(to_check) > 0:
+                block_id = to_check.popleft()
+                if block_id not in dependents:
+                    dependents.add(block_id)
+                    to_check.extend(graph.get_dependents(block_id))
+
+            # the dependents of the second block overlap with the first
+            if len(orphans):
+                self.assertNotEqual(orphans & dependents, set())
+
+            expected_counts = collections.Counter(
+                block_id[0] for block_id in dependents - orphans)
+            orphans |= dependents
+
+            self.assertEqual(graph.mark_orphans(failed_id), expected_counts)
+
+        self.assertEqual(graph.get_orphans(), orphans)
+
+    def test_lazy_different_requests(self):
+
+        graph = daisy.DependencyGraph(global_config=None, lazy=True)
+        graph.add(self.DownstreamTask())
+        graph.init('DownstreamTask')
+
+        with self.assertRaises(RuntimeError):
+            graph.init(
+                'UpstreamTask',
+                request_roi=daisy.Roi((0, 0), (10, 10)))
+
+    def test_priorities(self):
+
+        reference = daisy.DependencyGraph(global_config=None)
+        reference.add(self.DownstreamTask())
+        reference.init('DownstreamTask')
+
+        for lazy in [False, True]:
+            for priority in [
+                    'z_order',
+                    'critical_path',
+                    'locality',
+                    lambda task_id, block: -block.block_id]:
+
+                graph = daisy.DependencyGraph(
+                    global_config=None,
+                    lazy=lazy,
+                    priority=priority)
+                graph.add(self.DownstreamTask())
+                graph.init('DownstreamTask')
+
+                done = self.run_graph(graph, reference, batch_size=1)
+                self.assertEqual(done, set(self.get_blocks(reference)))
+
+        with self.assertRaises(RuntimeError):
+            daisy.DependencyGraph(global_config=None, priority='unknown')
+
+    def test_critical_path_priority(self):
+
+        graph = daisy.DependencyGraph(
+            global_config=None,
+            priority='critical_path')
+        graph.add(self.DownstreamTask())
+        graph.init('DownstreamTask')
+
+        # upstream blocks have downstream blocks depending on them
+        heights = graph.priority_policy.heights
+        self.assertGreater(
+            heights['UpstreamTask'].max(),
+            heights['DownstreamTask'].max())
+
+        # blocks with the longest chain of dependents are ready first
+        table = graph.block_tables['UpstreamTask']
+        ready = graph.dependency_counts['UpstreamTask'] == 0
+        blocks = graph.next(waiting_blocks={})
+        row = table.get_row(blocks['UpstreamTask'][0].block_id)
+        self.assertEqual(
+            heights['UpstreamTask'][row],
+            heights['UpstreamTask'][ready].max())
+
+    def test_user_priority(self):
+
+        graph = daisy.DependencyGraph(
+            global_config=None,
+            priority=lambda task_id, block: -block.block_id)
+        graph.add(self.IndependentTask())
+        graph.init('IndependentTask')
+
+        blocks = graph.next(
+            waiting_blocks={},
+            max_blocks={'IndependentTask': 10})
+        self.assertEqual(
+            [b.block_id for b in blocks['IndependentTask']],
+            list(range(9, -1, -1)))
+
+    def test_locality_priority(self):
+
+        graph = daisy.DependencyGraph(global_config=None, priority='locality')
+        graph.add(self.UpstreamTask())
+        graph.init('UpstreamTask')
+
+        dependencies = collections.defaultdict(set)
+        for block_id in self.get_blocks(graph):
+            for dependent_id in graph.get_dependents(block_id):
+                dependencies[dependent_id].add(block_id)
+
+        # the blocks made ready by the last finished block are processed next
+        done = set()
+        made_ready = []
+        while not graph.empty():
+
+            block = graph.next(waiting_blocks={})['UpstreamTask'][0]
+            block_id = ('UpstreamTask', block.block_id)
+            if len(made_ready):
+                self.assertIn(block_id, made_ready)
+
+            graph.remove_and_update(block_id)
+            done.add(block_id)
+            made_ready = [
+                b for b in graph.get_dependents(block_id)
+                if dependencies[b].issubset(done)
+            ]
+
+    def test_completed_blocks(self):
+
+        reference = daisy.DependencyGraph(global_config=None)
+        reference.add(self.DownstreamTask())
+        reference.init('DownstreamTask')
+
+        # the first half of the blocks of a complete run
+        order = []
+        self.run_graph(reference, reference, order=order)
+        completed = set(order[:len(order)//2])
+        completed_blocks = collections.defaultdict(list)
+        for task_id, block_id in completed:
+            completed_blocks[task_id].append(block_id)
+        # unknown blocks are ignored
+        completed_blocks['UpstreamTask'].append(1000000)
+
+        for lazy in [False, True]:
+
+            graph = daisy.DependencyGraph(global_config=None, lazy=lazy)
+            graph.add(self.DownstreamTask())
+            graph.init('DownstreamTask', completed_blocks={
+                task_id: np.array(sorted(block_ids))
+                for task_id, block_ids in completed_blocks.items()
+            })
+
+            self.assertEqual(graph.get_restored_count(), len(completed))
+
+            done = self.run_graph(graph, reference, completed=completed)
+
+            self.assertEqual(
+                done,
+                set(self.get_blocks(reference)) - completed)
+            self.assertTrue(graph.is_task_done('UpstreamTask'))
+            self.assertTrue(graph.is_task_done('DownstreamTask'))
+
+    def run_graph(
+            self,
+            graph,
+            reference,
+            fail=None,
+            batch_size=100,
+            order=None,
+            completed=None):
+        '''Process all blocks of ``graph``, while checking that dependencies in
+        ``reference`` are respected. Returns the IDs of finished blocks, and
+        appends them to ``order`` in the order they were processed. Blocks in
+        ``completed`` are expected to be done already.'''
+
+        reference_blocks = self.get_blocks(reference)
+        reference_dependencies = collections.defaultdict(set)
+        for block_id in reference_blocks:
+            for dependent_id in reference.get_dependents(block_id):
+                reference_dependencies[dependent_id].add(block_id)
+
+        done = set()
+        if completed is not None:
+            done |= completed
+        while not graph.empty():
+
+            blocks = graph.next(
+                waiting_blocks={},
+                max_blocks={
+                    'UpstreamTask': batch_size,
+                    'DownstreamTask': batch_size})
+
+            for task_id, task_blocks in blocks.items():
+                for block in task_blocks:
+
+                    block_id = (task_id, block.block_id)
+                    self.assertNotIn(block_id, done)
+                    reference_block = reference_blocks[block_id]
+                    self.assertEqual(block.read_roi, reference_block.read_roi)
+                    self.assertEqual(
+                        block.write_roi,
+                        reference_block.write_roi)
+                    self.assertTrue(
+                        reference_dependencies[block_id].issubset(done))
+
+                    if block_id == fail:
+                        graph.cancel_and_reschedule(block_id)
+                    else:
+                        graph.remove_and_update(block_id)
+                        done.add(block_id)
+                        if order is not None:
+                            order.append(block_id)
+
+        if completed is not None:
+            done -= completed
+
+        return done
+
+    def get_blocks(self, graph):
+        '''Get all blocks of an eager ``graph`` by their ID.'''
+
+        return {
+            (task_id, int(table.block_ids[row])): table.get_block(row)
+            for task_id, table in graph.block_tables.items()
+            for row in range(len(table))
+        }
+
+    class UpstreamTask(daisy.Task):
+
+        def prepare(self):
+
+            self.schedule(
+                total_roi=daisy.Roi((0, 0), (20, 20)),
+                read_roi=daisy.Roi((-1, -1), (5, 5)),
+                write_roi=daisy.Roi((0, 0), (3, 3)),
+                process_function=lambda b: 0,
+                max_retries=0,
+                fit='shrink')
+
+    class DownstreamTask(daisy.Task):
+
+        def prepare(self):
+
+            self.schedule(
+                total_roi=daisy.Roi((2, 2), (15, 15)),
+                read_roi=daisy.Roi((0, 0), (6, 6)),
+                write_roi=daisy.Roi((2, 2), (2, 2)),
+                process_function=lambda b: 0,
+                max_retries=0,
+                fit='valid')
+
+        def requires(self):
+            return [TestDependencyGraph.UpstreamTask()]
+
+    class RetryTask(daisy.Task):
+
+        def prepare(self):
+
+            self.schedule(
+                total_roi=daisy.Roi((0,), (1,)),
+                read_roi=daisy.Roi((0,), (1,)),
+                write_roi=daisy.Roi((0,), (1,)),
+                process_function=lambda b: 0,
+                max_retries=300)
+
+    class IndependentTask(daisy.Task):
+
+        def prepare(self):
+
+            self.schedule(
+                total_roi=daisy.Roi((0,), (10,)),
+                read_roi=daisy.Roi((0,), (1,)),
+                write_roi=daisy.Roi((0,), (1,)),
+                process_function=lambda b: 0,
+                read_write_conflict=False)
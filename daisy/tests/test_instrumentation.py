@@ -0,0 +1,77 @@
+from daisy.instrumentation import Histogram, Instrumentation
+import unittest
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def test_histogram(self):
+
+        histogram = Histogram()
+        self.assertEqual(histogram.count, 0)
+        self.assertEqual(histogram.mean(), 0.0)
+        self.assertEqual(histogram.percentile(50), 0.0)
+
+        # 90 fast and 10 slow durations
+        for _ in range(90):
+            histogram.add(100e-6)
+        for _ in range(10):
+            histogram.add(0.5)
+
+        self.assertEqual(histogram.count, 100)
+        self.assertAlmostEqual(histogram.mean(), 0.9*100e-6 + 0.1*0.5)
+        self.assertEqual(histogram.min, 100e-6)
+        self.assertEqual(histogram.max, 0.5)
+
+        # percentiles are accurate up to a factor of two
+        for p, expected in [(50, 100e-6), (90, 100e-6), (99, 0.5)]:
+            self.assertGreaterEqual(histogram.percentile(p), expected)
+            self.assertLessEqual(histogram.percentile(p), 2*expected)
+
+        self.assertEqual(histogram.percentile(100), 0.5)
+
+        # zero, negative, and very long durations
+        histogram.add(0.0)
+        histogram.add(-1e-3)
+        histogram.add(1e9)
+        self.assertEqual(histogram.count, 103)
+        self.assertEqual(histogram.max, 1e9)
+
+        other = Histogram()
+        other.add(1.0)
+        other.merge(histogram)
+        self.assertEqual(other.count, 104)
+        self.assertEqual(other.min, -1e-3)
+        self.assertEqual(other.max, 1e9)
+        self.assertEqual(sum(other.counts), 104)
+
+    def test_instrumentation(self):
+
+        instrumentation = Instrumentation()
+
+        instrumentation.record('compute', 'a', 1.0)
+        instrumentation.record('compute', 'a', 3.0)
+        instrumentation.record('compute', 'b', 2.0)
+        instrumentation.record('next', None, 1e-3)
+
+        self.assertEqual(instrumentation.get_task_ids(), ['a', 'b'])
+        self.assertEqual(
+            instrumentation.get_histogram('compute', 'a').count,
+            2)
+        self.assertEqual(
+            instrumentation.get_histogram('compute', 'b').max,
+            2.0)
+
+        histogram = instrumentation.get_histogram('compute')
+        self.assertEqual(histogram.count, 3)
+        self.assertEqual(histogram.mean(), 2.0)
+
+        self.assertEqual(instrumentation.get_histogram('send').count, 0)
+
+        summary = instrumentation.get_summary().split('\n')
+        self.assertEqual(len(summary), 4)
+        self.assertTrue(summary[1].startswith('next'))
+        self.assertTrue(summary[2].startswith('compute'))
+
+        disabled = Instrumentation(enabled=False)
+        disabled.record('compute', 'a', 1.0)
+        self.assertEqual(disabled.get_histogram('compute').count, 0)
@@ -0,0 +1,31 @@
+from .tmpdir_test import TmpDirTestCase
+import daisy
+
+
+class TestCompletionJournal(TmpDirTestCase):
+
+    def test_journal(self):
+
+        filename = self.path_to('journal')
+
+        journal = daisy.CompletionJournal(filename)
+        self.assertEqual(journal.read(), {})
+
+        journal.add(('task_a', 3))
+        journal.add(('task_a', 1))
+        journal.add(('task b', 2))
+        journal.add(('task_a', 3))
+        journal.close()
+
+        # a crash in the middle of a line
+        with open(filename, 'a') as f:
+            f.write('task_a\t')
+
+        journal = daisy.CompletionJournal(filename)
+        journal.add(('task_a', 5))
+        journal.close()
+
+        completed = journal.read()
+        self.assertEqual(sorted(completed.keys()), ['task b', 'task_a'])
+        self.assertEqual(completed['task_a'].tolist(), [1, 3, 5])
+        self.assertEqual(completed['task b'].tolist(), [2])
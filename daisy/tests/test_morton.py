@@ -0,0 +1,69 @@
+from daisy.blocks import compute_block_ids
+from daisy.morton import morton_code, morton_encode
+import daisy
+import numpy as np
+import unittest
+
+
+class TestMorton(unittest.TestCase):
+
+    def test_morton_code(self):
+
+        self.assertEqual(morton_code((0, 0)), 0)
+        self.assertEqual(morton_code((1, 0)), 1)
+        self.assertEqual(morton_code((0, 1)), 2)
+        self.assertEqual(morton_code((3, 5)), 0b100111)
+        self.assertEqual(morton_code((1, 1, 1)), 0b111)
+        self.assertEqual(morton_code((0, 2, 0, 1)), 0b101000)
+
+        # more than 32 bits per dimension
+        self.assertEqual(morton_code((1 << 40, 0)), 1 << 80)
+        self.assertEqual(morton_code((0, 0, 1 << 33)), 1 << 101)
+
+    def test_morton_encode(self):
+
+        random = np.random.RandomState(42)
+
+        for dims in [1, 2, 3, 4, 5]:
+            for max_value in [16, 1 << 20, 1 << 40, 1 << 62]:
+
+                indices = random.randint(0, max_value, size=(100, dims))
+                codes = morton_encode(indices)
+
+                self.assertEqual(len(codes), len(indices))
+                self.assertEqual(
+                    [int(c) for c in codes],
+                    [morton_code(index) for index in indices.tolist()])
+
+                if dims*int(indices.max()).bit_length() <= 64:
+                    self.assertEqual(codes.dtype, np.uint64)
+
+        self.assertEqual(len(morton_encode(np.zeros((0, 3)))), 0)
+
+    def test_compute_block_ids(self):
+
+        total_roi = daisy.Roi((-5, 3, 1), (40, 31, 17))
+        write_roi = daisy.Roi((-5, 3, 1), (4, 3, 2))
+
+        offsets = np.array([
+            (x, y, z)
+            for x in range(-5, 35, 4)
+            for y in range(3, 34, 3)
+            for z in range(1, 18, 2)
+        ])
+        block_ids, z_order_ids = compute_block_ids(
+            total_roi,
+            write_roi.get_shape(),
+            offsets)
+
+        for offset, block_id, z_order_id in zip(
+                offsets.tolist(),
+                block_ids.tolist(),
+                z_order_ids.tolist()):
+
+            block = daisy.Block(
+                total_roi,
+                daisy.Roi(offset, write_roi.get_shape()),
+                daisy.Roi(offset, write_roi.get_shape()))
+            self.assertEqual(block.block_id, block_id)
+            self.assertEqual(block.z_order_id, z_order_id)
@@ -5,6 +5,7 @@ import daisy
 import glob
 import os
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 daisy.scheduler._NO_SPAWN_STATUS_THREAD = True
@@ -95,6 +96,43 @@ class TestMultipleTasks(TmpDirTestCase):
         self.assertTrue(ret)
         self.assertEqual(block_ids, expected_block_ids)
 
+    def test_reuse_workers(self):
+        '''Tests that workers of a finished task are reused'''
+        outdir = self.path_to('')
+
+        task = self.PidParentTask(outdir=outdir)
+        ret = daisy.distribute([{'task': task}], reuse_workers=True)
+
+        def read_pids(name):
+            pids = set()
+            for path in glob.glob(os.path.join(outdir, '%s.*.pid' % name)):
+                with open(path, 'r') as f:
+                    pids.add(int(f.read()))
+            return pids
+
+        leaf_pids = read_pids('leaf')
+        parent_pids = read_pids('parent')
+
+        self.assertTrue(ret)
+        self.assertEqual(len(parent_pids), 1)
+        self.assertTrue(parent_pids.issubset(leaf_pids))
+
+    def test_reuse_workers_chain(self):
+        '''Tests worker reuse over several tasks with concurrent post
+        checks'''
+        outdir = self.path_to('')
+
+        task = self.PidChainTask(
+            task_id='PidChainTask2',
+            outdir=outdir,
+            level=2)
+        ret = daisy.distribute([{'task': task}], reuse_workers=True)
+
+        outfiles = glob.glob(os.path.join(outdir, 'chain*.pid'))
+
+        self.assertTrue(ret)
+        self.assertEqual(len(outfiles), 30)
+
     def test_multi_with_request(self):
         '''Tests multiple different task targets with requests'''
         outdir = self.path_to('')
@@ -561,6 +599,95 @@ class TestMultipleTasks(TmpDirTestCase):
         def requires(self):
             return [TestMultipleTasks.LeafTask(outdir=self.outdir)]
 
+    class PidLeafTask(daisy.Task):
+
+        outdir = daisy.Parameter()
+
+        def prepare(self):
+
+            total_roi = daisy.Roi((0,), (10,))
+            read_roi = daisy.Roi((0,), (1,))
+            write_roi = daisy.Roi((0,), (1,))
+
+            self.schedule(
+                total_roi,
+                read_roi,
+                write_roi,
+                process_function=(
+                    TestMultipleTasks.write_pid,
+                    [self.outdir, 'leaf']),
+                num_workers=2,
+                max_retries=0)
+
+    class PidParentTask(daisy.Task):
+
+        outdir = daisy.Parameter()
+
+        def prepare(self):
+
+            # a single block that depends on all blocks of the leaf task
+            total_roi = daisy.Roi((0,), (10,))
+            read_roi = daisy.Roi((0,), (10,))
+            write_roi = daisy.Roi((0,), (10,))
+
+            def pre_check(block):
+                # give the workers of the leaf task time to become spare
+                time.sleep(0.5)
+                return False
+
+            self.schedule(
+                total_roi,
+                read_roi,
+                write_roi,
+                process_function=(
+                    TestMultipleTasks.write_pid,
+                    [self.outdir, 'parent']),
+                check_function=(pre_check, lambda b: True),
+                num_workers=1,
+                max_retries=0)
+
+        def requires(self):
+            return [TestMultipleTasks.PidLeafTask(outdir=self.outdir)]
+
+    class PidChainTask(daisy.Task):
+
+        outdir = daisy.Parameter()
+        level = daisy.Parameter()
+
+        def prepare(self):
+
+            total_roi = daisy.Roi((0,), (10,))
+            read_roi = daisy.Roi((0,), (1,))
+            write_roi = daisy.Roi((0,), (1,))
+
+            self.schedule(
+                total_roi,
+                read_roi,
+                write_roi,
+                process_function=(
+                    TestMultipleTasks.write_pid,
+                    [self.outdir, 'chain%d' % self.level]),
+                check_function=(lambda b: False, lambda b: True),
+                num_workers=2,
+                post_check_workers=4,
+                max_retries=0)
+
+        def requires(self):
+            if self.level == 0:
+                return []
+            return [TestMultipleTasks.PidChainTask(
+                task_id='PidChainTask%d' % (self.level - 1),
+                outdir=self.outdir,
+                level=self.level - 1)]
+
+    def write_pid(block, outdir, name):
+
+        path = os.path.join(outdir, '%s.%d.pid' % (name, block.block_id))
+        with open(path, 'w') as f:
+            f.write(str(os.getpid()))
+
+        return 0
+
     def process_block(outdir, block, fail=None):
 
         logger.debug("Processing block %s", block)
@@ -0,0 +1,214 @@
+from daisy.block import BlockTemplate
+from daisy.tcp import SchedulerMessage, SchedulerMessageType, ReturnCode, \
+    pack_message, get_and_unpack_message, read_message, ProtocolError
+import daisy
+import io
+import os
+import unittest
+
+# version, encoding, and payload size
+_header_size = 10
+
+daisy.scheduler._NO_SPAWN_STATUS_THREAD = True
+
+
+class BytesStream():
+    '''Minimal stand-in for a tornado IOStream reading from a buffer.'''
+
+    def __init__(self, data):
+        self.data = data
+
+    async def read_bytes(self, size):
+        data, self.data = self.data[:size], self.data[size:]
+        return data
+
+
+def unpack(data, template=None):
+    # reading from a BytesStream never suspends, so the coroutine can be run
+    # to completion without an event loop
+    coroutine = get_and_unpack_message(BytesStream(data), template)
+    try:
+        coroutine.send(None)
+    except StopIteration as e:
+        return e.value
+    raise RuntimeError("get_and_unpack_message did not finish")
+
+
+def roundtrip(msg, binary=True, template=None):
+    return unpack(pack_message(msg, binary, template), template)
+
+
+class TestTcp(unittest.TestCase):
+
+    def test_roundtrip(self):
+
+        block = daisy.Block(
+            daisy.Roi((0, 0), (100, 100)),
+            daisy.Roi((-10, 20), (30, 30)),
+            daisy.Roi((0, 30), (10, 10)))
+
+        for binary in [True, False]:
+
+            msg = roundtrip(
+                SchedulerMessage(
+                    SchedulerMessageType.WORKER_GET_BLOCK,
+                    data='task'),
+                binary)
+            self.assertEqual(msg.type, SchedulerMessageType.WORKER_GET_BLOCK)
+            self.assertEqual(msg.data, 'task')
+
+            for compute_time in [None, 0.25]:
+                msg = roundtrip(
+                    SchedulerMessage(
+                        SchedulerMessageType.WORKER_RET_BLOCK,
+                        data=(
+                            ('task', 42),
+                            ReturnCode.FAILED_POST_CHECK,
+                            compute_time)),
+                    binary)
+                self.assertEqual(
+                    msg.type,
+                    SchedulerMessageType.WORKER_RET_BLOCK)
+                self.assertEqual(
+                    msg.data,
+                    (('task', 42), ReturnCode.FAILED_POST_CHECK, compute_time))
+
+            msg = roundtrip(
+                SchedulerMessage(
+                    SchedulerMessageType.NEW_BLOCK,
+                    data=block),
+                binary)
+            self.assertEqual(msg.type, SchedulerMessageType.NEW_BLOCK)
+            self.assertEqual(msg.data.block_id, block.block_id)
+            self.assertEqual(msg.data.z_order_id, block.z_order_id)
+            self.assertEqual(msg.data.read_roi, block.read_roi)
+            self.assertEqual(msg.data.write_roi, block.write_roi)
+            self.assertEqual(
+                msg.data.requested_write_roi,
+                block.requested_write_roi)
+
+    def test_block_template(self):
+
+        total_roi = daisy.Roi((0, 0), (100, 100))
+        read_roi = daisy.Roi((0, 0), (30, 30))
+        write_roi = daisy.Roi((10, 10), (10, 10))
+        template = BlockTemplate(read_roi, write_roi)
+
+        regular = daisy.Block(
+            total_roi,
+            read_roi + (20, 40),
+            write_roi + (20, 40))
+        shrunk = daisy.Block(
+            total_roi,
+            daisy.Roi((80, 0), (20, 30)),
+            daisy.Roi((90, 10), (10, 10)))
+
+        for block in [regular, shrunk]:
+
+            msg = SchedulerMessage(SchedulerMessageType.NEW_BLOCK, block)
+            received = roundtrip(msg, template=template).data
+
+            self.assertEqual(received.block_id, block.block_id)
+            self.assertEqual(received.z_order_id, block.z_order_id)
+            self.assertEqual(received.read_roi, block.read_roi)
+            self.assertEqual(received.write_roi, block.write_roi)
+            self.assertEqual(
+                received.requested_write_roi,
+                block.requested_write_roi)
+
+        # blocks that match the template are sent as offsets
+        msg = SchedulerMessage(SchedulerMessageType.NEW_BLOCK, regular)
+        self.assertLess(
+            len(pack_message(msg, template=template)),
+            len(pack_message(msg)))
+
+        with self.assertRaises(ProtocolError):
+            unpack(pack_message(msg, template=template))
+
+    def test_large_message(self):
+
+        data = b'x'*(1 << 20)
+        msg = roundtrip(
+            SchedulerMessage(SchedulerMessageType.WORKER_HANDSHAKE, data))
+        self.assertEqual(msg.data, data)
+
+    def test_version_mismatch(self):
+
+        data = bytearray(pack_message(
+            SchedulerMessage(SchedulerMessageType.TERMINATE_WORKER)))
+        data[0] += 1
+
+        with self.assertRaises(ProtocolError):
+            unpack(bytes(data))
+
+    def test_malformed_message(self):
+
+        data = bytearray(pack_message(
+            SchedulerMessage(
+                SchedulerMessageType.WORKER_GET_BLOCK,
+                data='task')))
+
+        # unknown message type
+        unknown = bytearray(data)
+        unknown[_header_size] = 255
+        with self.assertRaises(ProtocolError):
+            unpack(bytes(unknown))
+
+        # a message type without binary encoding
+        unencoded = bytearray(data)
+        unencoded[_header_size] = list(SchedulerMessageType).index(
+            SchedulerMessageType.TERMINATE_WORKER)
+        with self.assertRaises(ProtocolError):
+            unpack(bytes(unencoded))
+
+        # a truncated block
+        block = daisy.Block(
+            daisy.Roi((0,), (100,)),
+            daisy.Roi((0,), (10,)),
+            daisy.Roi((0,), (10,)))
+        msg = pack_message(
+            SchedulerMessage(SchedulerMessageType.NEW_BLOCK, data=block))
+        truncated = bytearray(msg[:-8])
+        truncated[2:_header_size] = (len(truncated) - _header_size).to_bytes(
+            _header_size - 2, 'big')
+        with self.assertRaises(ProtocolError):
+            unpack(bytes(truncated))
+
+    def test_read_message(self):
+
+        data = (
+            pack_message(
+                SchedulerMessage(
+                    SchedulerMessageType.WORKER_GET_BLOCK,
+                    data='task')) +
+            pack_message(
+                SchedulerMessage(SchedulerMessageType.TERMINATE_WORKER)))
+
+        reader = io.BytesIO(data + data[:5])
+        msg = read_message(reader)
+        self.assertEqual(msg.type, SchedulerMessageType.WORKER_GET_BLOCK)
+        self.assertEqual(msg.data, 'task')
+        msg = read_message(reader)
+        self.assertEqual(msg.type, SchedulerMessageType.TERMINATE_WORKER)
+
+        # the connection closed in the middle of a message
+        with self.assertRaises(EOFError):
+            read_message(reader)
+
+    def test_context(self):
+
+        for socket_path in [None, '/tmp/with:colon/scheduler.sock']:
+
+            context = daisy.Context(
+                '127.0.0.1', 1234, 'task', 3, 8, 2, socket_path)
+
+            os.environ['DAISY_CONTEXT'] = context.to_env()
+            try:
+                restored = daisy.Context.from_env()
+            finally:
+                del os.environ['DAISY_CONTEXT']
+
+            self.assertEqual(restored.port, 1234)
+            self.assertEqual(restored.task_id, 'task')
+            self.assertEqual(restored.prefetch_depth, 2)
+            self.assertEqual(restored.socket_path, socket_path)
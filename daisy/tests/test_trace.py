@@ -0,0 +1,73 @@
+from .tmpdir_test import TmpDirTestCase
+from daisy import BlockTrace
+import json
+import numpy as np
+
+
+class TestBlockTrace(TmpDirTestCase):
+
+    def test_trace(self):
+
+        trace = BlockTrace()
+        start = trace.start
+
+        trace.record(BlockTrace.READY, ('a', 1), event_time=start + 1.0)
+        trace.record(BlockTrace.READY, ('a', 2), event_time=start + 1.0)
+        trace.record(BlockTrace.SKIPPED, ('a', 2), event_time=start + 1.5)
+        trace.record(BlockTrace.DISPATCHED, ('a', 1), 3, start + 2.0)
+        trace.record(BlockTrace.ACQUIRED, ('a', 1), 3, start + 2.5)
+        trace.record(BlockTrace.RETURNED, ('a', 1), 3, start + 4.5)
+        trace.record(BlockTrace.FAILED, ('a', 1), event_time=start + 5.0)
+        trace.record(BlockTrace.DISPATCHED, ('b', 1), 0, start + 0.5)
+        trace.record(BlockTrace.RETURNED, ('b', 1), 0, start + 0.75)
+
+        self.assertEqual(len(trace), 9)
+        self.assertEqual(trace.task_ids, ['a', 'b'])
+
+        columns = trace.get_columns()
+        self.assertTrue(np.all(np.diff(columns['time']) >= 0))
+        self.assertEqual(
+            columns['event'].tolist()[:2],
+            [BlockTrace.DISPATCHED, BlockTrace.RETURNED])
+        self.assertEqual(columns['task'].tolist()[:3], [1, 1, 0])
+        self.assertEqual(columns['worker_id'].tolist()[-1], -1)
+
+        filename = self.path_to('trace.npz')
+        trace.save(filename)
+        saved = np.load(filename)
+        self.assertEqual(saved['task_ids'].tolist(), ['a', 'b'])
+        self.assertEqual(
+            saved['block_id'].tolist(),
+            columns['block_id'].tolist())
+
+        filename = self.path_to('trace.json')
+        trace.save_chrome_trace(filename)
+        with open(filename) as f:
+            chrome_trace = json.load(f)
+
+        events = chrome_trace['traceEvents']
+        slices = [e for e in events if e['ph'] == 'X']
+        self.assertEqual(len(slices), 2)
+
+        # block 1 of task 'a' was processed by worker 3 from 2.5s to 4.5s,
+        # block 1 of task 'b' has no ACQUIRED event, it starts when
+        # dispatched
+        a, b = sorted(slices, key=lambda e: e['pid'])
+        self.assertEqual((a['pid'], a['tid']), (0, 3))
+        self.assertAlmostEqual(a['ts'], 2.5e6)
+        self.assertAlmostEqual(a['dur'], 2e6)
+        self.assertAlmostEqual(a['args']['ready_us'], 1e6)
+        self.assertAlmostEqual(b['ts'], 0.5e6)
+        self.assertAlmostEqual(b['dur'], 0.25e6)
+
+        failures = [e for e in events if e['ph'] == 'i']
+        self.assertEqual(len(failures), 1)
+        self.assertEqual(failures[0]['tid'], -1)
+
+        names = {
+            (e['pid'], e.get('tid')): e['args']['name']
+            for e in events if e['ph'] == 'M'
+        }
+        self.assertEqual(names[(0, None)], 'a')
+        self.assertEqual(names[(0, 3)], 'worker 3')
+        self.assertEqual(names[(0, -1)], 'scheduler')
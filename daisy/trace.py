@@ -0,0 +1,270 @@
+from __future__ import absolute_import
+from array import array
+import json
+import logging
+import numpy as np
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class BlockTrace():
+    '''Records when each block passed through the steps of scheduling, and
+    which worker processed it.
+
+    Events are appended to flat arrays of a few bytes each (time, event,
+    task, block ID, worker ID), such that millions of blocks can be traced.
+    They can be saved as columns with ``save()``, or exported as a Chrome
+    trace (which can be opened with Perfetto or ``chrome://tracing``) with
+    ``save_chrome_trace()`` to see idle workers and stragglers.
+
+    The recorded events are:
+
+        ``READY``:
+
+            The block's dependencies finished, it was handed to the
+            pre-checker.
+
+        ``SKIPPED``:
+
+            The block's ``pre_check`` passed, it will not be processed.
+
+        ``DISPATCHED``:
+
+            The block was sent to a worker.
+
+        ``ACQUIRED``:
+
+            The worker started processing the block. Estimated from the
+            compute time reported by the worker when it returned the block.
+
+        ``RETURNED``:
+
+            The worker returned the block.
+
+        ``DONE``:
+
+            The block's ``post_check`` passed, the block is finished.
+
+        ``FAILED``:
+
+            The block failed (and might be rescheduled).
+
+    Times are in seconds since the trace was created.
+    '''
+
+    READY = 0
+    SKIPPED = 1
+    DISPATCHED = 2
+    ACQUIRED = 3
+    RETURNED = 4
+    DONE = 5
+    FAILED = 6
+
+    event_names = [
+        'READY',
+        'SKIPPED',
+        'DISPATCHED',
+        'ACQUIRED',
+        'RETURNED',
+        'DONE',
+        'FAILED',
+    ]
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+
+        self.task_ids = []
+        self.task_indices = {}
+
+        self.times = array('d')
+        self.events = array('B')
+        self.tasks = array('H')
+        self.block_ids = array('q')
+        self.worker_ids = array('i')
+
+    def __len__(self):
+        return len(self.events)
+
+    def record(self, event, block_id, worker_id=-1, event_time=None):
+        '''Record an event for a block, given as ``(task_id, block_id)``.
+        Can be called from any thread.
+
+        Args:
+
+            event (``int``):
+
+                One of the event constants of this class.
+
+            block_id (``tuple``):
+
+                The block.
+
+            worker_id (``int``, optional):
+
+                The worker that has the block, if any.
+
+            event_time (``float``, optional):
+
+                The time of the event, as returned by ``time.perf_counter()``.
+                Defaults to now.
+        '''
+
+        if event_time is None:
+            event_time = time.perf_counter()
+
+        task_id, block_id = block_id
+
+        with self.lock:
+
+            task_index = self.task_indices.get(task_id)
+            if task_index is None:
+                task_index = len(self.task_ids)
+                self.task_ids.append(task_id)
+                self.task_indices[task_id] = task_index
+
+            self.times.append(event_time - self.start)
+            self.events.append(event)
+            self.tasks.append(task_index)
+            self.block_ids.append(block_id)
+            self.worker_ids.append(worker_id)
+
+    def get_columns(self):
+        '''Get all events as a `dict` of ``ndarray``, with keys ``time``,
+        ``event``, ``task``, ``block_id``, and ``worker_id``, ordered by
+        time. ``task`` is an index into ``task_ids``.'''
+
+        with self.lock:
+            columns = {
+                'time': np.array(self.times, dtype=np.float64),
+                'event': np.array(self.events, dtype=np.uint8),
+                'task': np.array(self.tasks, dtype=np.uint16),
+                'block_id': np.array(self.block_ids, dtype=np.int64),
+                'worker_id': np.array(self.worker_ids, dtype=np.int32),
+            }
+
+        order = np.argsort(columns['time'], kind='stable')
+
+        return {name: values[order] for name, values in columns.items()}
+
+    def save(self, filename):
+        '''Save all events as columns to a numpy ``.npz`` file (see
+        ``get_columns()``), together with ``task_ids`` and
+        ``event_names``.'''
+
+        np.savez_compressed(
+            filename,
+            task_ids=np.array(self.task_ids),
+            event_names=np.array(self.event_names),
+            **self.get_columns())
+
+    def to_chrome_trace(self):
+        '''Convert the events into a Chrome trace, as a `dict` in the Trace
+        Event Format.
+
+        Each task is shown as a process, and each of its workers as a
+        thread. Every block processed by a worker is shown as a slice on the
+        worker's thread, from when it was acquired until it was returned.
+        Failed blocks are marked with an instant event on the scheduler's
+        thread.
+        '''
+
+        columns = self.get_columns()
+
+        trace_events = []
+        workers = set()
+
+        # {(task, block_id): time}
+        ready = {}
+        dispatched = {}
+        acquired = {}
+
+        for t, event, task, block_id, worker_id in zip(
+                (columns['time']*1e6).tolist(),
+                columns['event'].tolist(),
+                columns['task'].tolist(),
+                columns['block_id'].tolist(),
+                columns['worker_id'].tolist()):
+
+            key = (task, block_id)
+
+            if event == self.READY:
+                ready[key] = t
+
+            elif event == self.DISPATCHED:
+                dispatched[key] = t
+
+            elif event == self.ACQUIRED:
+                acquired[key] = t
+
+            elif event == self.RETURNED:
+
+                start = acquired.pop(key, dispatched.get(key, t))
+                args = {'block_id': block_id}
+                if key in dispatched:
+                    args['dispatched_us'] = dispatched.pop(key)
+                if key in ready:
+                    args['ready_us'] = ready.pop(key)
+
+                workers.add((task, worker_id))
+                trace_events.append({
+                    'name': 'block %d' % block_id,
+                    'cat': 'block',
+                    'ph': 'X',
+                    'pid': task,
+                    'tid': worker_id,
+                    'ts': start,
+                    'dur': t - start,
+                    'args': args,
+                })
+
+            elif event == self.FAILED:
+
+                workers.add((task, worker_id))
+                trace_events.append({
+                    'name': 'block %d failed' % block_id,
+                    'cat': 'failure',
+                    'ph': 'i',
+                    's': 't',
+                    'pid': task,
+                    'tid': worker_id,
+                    'ts': t,
+                })
+
+        metadata = []
+        for task, task_id in enumerate(self.task_ids):
+            metadata.append({
+                'name': 'process_name',
+                'ph': 'M',
+                'pid': task,
+                'args': {'name': task_id},
+            })
+        for task, worker_id in sorted(workers):
+            metadata.append({
+                'name': 'thread_name',
+                'ph': 'M',
+                'pid': task,
+                'tid': worker_id,
+                'args': {
+                    'name': (
+                        'worker %d' % worker_id
+                        if worker_id >= 0 else 'scheduler')
+                },
+            })
+
+        return {
+            'traceEvents': metadata + trace_events,
+            'displayTimeUnit': 'ms',
+        }
+
+    def save_chrome_trace(self, filename):
+        '''Save the events as a Chrome trace JSON file, see
+        ``to_chrome_trace()``.'''
+
+        with open(filename, 'w') as f:
+            json.dump(self.to_chrome_trace(), f)
+
+        logger.info("Saved trace of %d events to %s", len(self), filename)
@@ -1,12 +1,29 @@
+import queue
+
+
 class Worker():
 
     def __init__(self, worker_id, address, stream):
         self.worker_id = worker_id
         self.address = address
         self.stream = stream
+        # the BlockTemplate this worker received, used to encode its blocks
+        self.block_template = None
 
     def __repr__(self):
         return "%d at %s:%d" % (
             self.worker_id,
             self.address[0],
             self.address[1])
+
+
+class ThreadWorker(Worker):
+    '''A worker that runs as a thread in the scheduler process. Blocks are
+    passed to it through an in-memory queue instead of a connection.'''
+
+    def __init__(self, worker_id):
+        super().__init__(worker_id, None, None)
+        self.blocks = queue.Queue()
+
+    def __repr__(self):
+        return "%d (thread)" % self.worker_id